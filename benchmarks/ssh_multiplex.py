@@ -0,0 +1,110 @@
+"""ssh_multiplex.py
+
+Per-command latency of remote calls, with and without connection multiplexing.
+
+  python3 benchmarks/ssh_multiplex.py --sshd               # throwaway local sshd stand-in
+  python3 benchmarks/ssh_multiplex.py --instance usr@host  # real instance, password prompted
+
+`--sshd` starts `sshd` on 127.0.0.1 with a generated host key and client key,
+so it needs the `sshd` binary but no running ssh server.
+
+"""
+import argparse
+import getpass
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from recompute import cmd
+from recompute import connection
+from recompute import process
+from recompute.instance import Instance
+
+SSHD_CONFIG = """Port {port}
+ListenAddress 127.0.0.1
+HostKey {workdir}/host_key
+AuthorizedKeysFile {workdir}/authorized_keys
+PidFile {workdir}/sshd.pid
+PasswordAuthentication no
+StrictModes no
+MaxSessions 16
+"""
+
+
+def start_sshd(workdir, port):
+  """Start a local sshd stand-in, return (process, ssh options)"""
+  sshd = shutil.which('sshd') or '/usr/sbin/sshd'
+  for key in ['host_key', 'client_key']:
+    subprocess.check_call(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '',
+      '-f', os.path.join(workdir, key)])
+  shutil.copy(os.path.join(workdir, 'client_key.pub'),
+      os.path.join(workdir, 'authorized_keys'))
+  config = os.path.join(workdir, 'sshd_config')
+  with open(config, 'w') as f:
+    f.write(SSHD_CONFIG.format(port=port, workdir=workdir))
+  proc = subprocess.Popen([sshd, '-D', '-e', '-f', config],
+      stderr=subprocess.DEVNULL)
+  time.sleep(1)  # let it bind
+  options = ' '.join([
+    '-o Port={}'.format(port),
+    '-o IdentityFile={}'.format(os.path.join(workdir, 'client_key')),
+    '-o StrictHostKeyChecking=no',
+    '-o UserKnownHostsFile=/dev/null',
+    '-o LogLevel=ERROR'
+    ])
+  return proc, options
+
+
+def measure(instance, n, multiplex):
+  """Run `true` on `instance` `n` times, return latencies in milliseconds"""
+  command = process.make_remote_cmd(cmd.SSH_EXEC, instance,
+      multiplex=multiplex, cmd='true')
+  latencies = []
+  for _ in range(n):
+    start = time.perf_counter()
+    subprocess.call(command, shell=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    latencies.append((time.perf_counter() - start) * 1000.)
+  return latencies
+
+
+def report(label, latencies):
+  latencies = sorted(latencies)
+  p95 = latencies[int(0.95 * (len(latencies) - 1))]
+  print('{:<12} mean {:8.1f} ms   median {:8.1f} ms   p95 {:8.1f} ms'.format(
+    label, statistics.mean(latencies), statistics.median(latencies), p95))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+  parser.add_argument('--instance', default='', help='username@host')
+  parser.add_argument('--sshd', default=False, action='store_true',
+      help='benchmark against a throwaway local sshd')
+  parser.add_argument('--port', default=2222, type=int, help='port of local sshd')
+  parser.add_argument('-n', default=20, type=int, help='number of commands')
+  args = parser.parse_args()
+
+  sshd, workdir = None, tempfile.mkdtemp()
+  connection.manager = connection.ConnectionManager(control_dir=workdir)
+  try:
+    if args.sshd:
+      sshd, connection.manager.options = start_sshd(workdir, args.port)
+      instance = Instance(getpass.getuser(), 'none', '127.0.0.1')
+    else:
+      instance = Instance(password=getpass.getpass('Password:')).resolve_str(args.instance)
+
+    report('handshake', measure(instance, args.n, multiplex=False))
+    connection.manager.open(instance)
+    report('multiplexed', measure(instance, args.n, multiplex=True))
+    connection.manager.close(instance)
+  finally:
+    if sshd:
+      sshd.terminate()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+  main()
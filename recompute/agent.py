@@ -0,0 +1,199 @@
+"""agent.py
+
+A small agent that runs in the remote machine.
+It is uploaded by `re` and started over a single ssh channel (see `channel.py`).
+The agent reads requests from STDIN and writes responses to STDOUT, one JSON object per line.
+
+  request  : {"id": 1, "op": "ps", "args": {"pattern": "re.runner"}}
+  response : {"id": 1, "ok": true, "result": [[1234, "bash re.runner"]]}
+  error    : {"id": 1, "ok": false, "error": "..."}
+
+Each request is served in a thread of its own; responses may arrive out of order.
+On start, the agent introduces itself with a response of id 0.
+
+NOTE : this file is executed by the remote python3. It must depend on nothing but the standard library.
+
+"""
+import base64
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+# protocol version
+VERSION = 1
+# block size used to read files backwards
+BLOCK_SIZE = 8192
+
+
+def op_exec(cmd, cwd=None, timeout=None):
+  """Execute shell command `cmd`, return exit code, stdout and stderr"""
+  proc = subprocess.Popen(cmd, shell=True, cwd=cwd, start_new_session=True,
+      stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  try:
+    stdout, stderr = proc.communicate(timeout=timeout)
+  except subprocess.TimeoutExpired:
+    # children of the shell hold the pipes open; kill them all
+    try:
+      os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+      pass
+    stdout, stderr = proc.communicate()
+  return {
+      'pid' : proc.pid,
+      'code' : proc.returncode,
+      'stdout' : stdout.decode('utf-8', 'replace'),
+      'stderr' : stderr.decode('utf-8', 'replace')
+      }
+
+
+def op_stat(paths):
+  """stat a list of paths; `None` for paths that don't exist"""
+  results = {}
+  for path in paths:
+    try:
+      st = os.stat(os.path.expanduser(path))
+      results[path] = {
+          'size' : st.st_size,
+          'mtime' : st.st_mtime,
+          'mode' : st.st_mode,
+          'isdir' : os.path.isdir(os.path.expanduser(path))
+          }
+    except OSError:
+      results[path] = None
+  return results
+
+
+def op_read(path, offset=0, length=None):
+  """Read `length` bytes of file `path` starting at `offset`
+
+  Data is base64 encoded; logs aren't guaranteed to be valid utf-8
+  at arbitrary offsets.
+  """
+  with open(os.path.expanduser(path), 'rb') as f:
+    size = os.fstat(f.fileno()).st_size
+    f.seek(offset)
+    data = f.read() if length is None else f.read(length)
+  return {
+      'size' : size,
+      'offset' : offset,
+      'data' : base64.b64encode(data).decode('ascii')
+      }
+
+
+def op_tail(path, lines=10):
+  """Last `lines` lines of file `path`"""
+  with open(os.path.expanduser(path), 'rb') as f:
+    f.seek(0, os.SEEK_END)
+    position, data = f.tell(), b''
+    # read backwards, block by block, until there are enough lines
+    while position > 0 and data.count(b'\n') <= lines:
+      step = min(BLOCK_SIZE, position)
+      position -= step
+      f.seek(position)
+      data = f.read(step) + data
+  return b'\n'.join(data.split(b'\n')[-lines - 1:]).decode('utf-8', 'replace')
+
+
+def cmdline(pid):
+  """Command line of process `pid`, `None` if it is gone"""
+  try:
+    with open('/proc/{}/cmdline'.format(pid), 'rb') as f:
+      return f.read().replace(b'\0', b' ').decode('utf-8', 'replace').strip()
+  except (IOError, OSError):
+    return
+
+
+def op_ps(pattern=''):
+  """List processes whose command line contains `pattern`"""
+  procs, me = [], os.getpid()
+  for entry in os.listdir('/proc'):
+    if not entry.isdigit() or int(entry) == me:
+      continue
+    line = cmdline(entry)
+    if line and pattern in line:
+      procs.append([ int(entry), line ])
+  return sorted(procs)
+
+
+def op_alive(pids):
+  """Is each process in `pids` alive? (zombies are not)"""
+  results = {}
+  for pid in pids:
+    try:
+      with open('/proc/{}/stat'.format(pid)) as f:
+        # state follows the command name, which is enclosed in parentheses
+        results[str(pid)] = f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (IOError, OSError, IndexError):
+      results[str(pid)] = False
+  return results
+
+
+def op_kill(pids, signum=signal.SIGKILL):
+  """Send signal `signum` to each process in `pids`"""
+  results = {}
+  for pid in pids:
+    try:
+      os.kill(int(pid), signum)
+      results[str(pid)] = True
+    except OSError:
+      results[str(pid)] = False
+  return results
+
+
+OPS = {
+    'exec' : op_exec,
+    'stat' : op_stat,
+    'read' : op_read,
+    'tail' : op_tail,
+    'ps' : op_ps,
+    'alive' : op_alive,
+    'kill' : op_kill
+    }
+
+
+class Agent(object):
+  """Agent serves JSON-lines requests read from `stdin`"""
+
+  def __init__(self, stdin=None, stdout=None):
+    self.stdin = stdin if stdin else sys.stdin
+    self.stdout = stdout if stdout else sys.stdout
+    self.lock = threading.Lock()
+
+  def respond(self, response):
+    """Write a response, one line at a time"""
+    line = json.dumps(response) + '\n'
+    with self.lock:
+      self.stdout.write(line)
+      self.stdout.flush()
+
+  def handle(self, request):
+    """Serve a single request"""
+    try:
+      result = OPS[request['op']](**request.get('args', {}))
+      self.respond({ 'id' : request['id'], 'ok' : True, 'result' : result })
+    except Exception as e:
+      self.respond({ 'id' : request.get('id'), 'ok' : False,
+        'error' : '{}: {}'.format(type(e).__name__, e) })
+
+  def serve(self):
+    """Serve requests till STDIN is closed"""
+    self.respond({ 'id' : 0, 'ok' : True,
+      'result' : { 'version' : VERSION, 'pid' : os.getpid() } })
+    for line in iter(self.stdin.readline, ''):
+      if not line.strip():
+        continue
+      try:
+        request = json.loads(line)
+      except ValueError:
+        self.respond({ 'id' : None, 'ok' : False, 'error' : 'Bad request' })
+        continue
+      thread = threading.Thread(target=self.handle, args=(request,))
+      thread.daemon = True
+      thread.start()
+
+
+if __name__ == '__main__':
+  Agent().serve()
@@ -0,0 +1,283 @@
+"""archive.py
+
+Archive keeps logs of completed runs under `.recompute/archive/`, for searching across runs.
+
+* a log is stored as a gzip file `<run>.gz`, made of independently compressed blocks of `BLOCK_LINES` lines
+  (the file as a whole is still a valid gzip file; `zcat` reads it)
+* a line index records the (offset, size, first line) of each block, so that a block is read without decompressing the rest
+* an inverted index maps every token to the blocks it occurs in, per run
+
+A search decompresses only the blocks that contain every word of the pattern.
+Words of the pattern are looked up in sorted lists of tokens (saved along with the index) :
+a word inside the pattern is a token, the first word may be the end of a token
+and the last one the start of a token. Only a pattern of a single word may be any part of a token;
+it scans the tokens.
+Patterns with regex metacharacters can't be looked up; they scan the blocks of the runs selected.
+
+"""
+import datetime
+import hashlib
+import bisect
+import pickle
+import gzip
+import time
+import re
+import os
+
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# archive directory
+ARCHIVE_DIR = '.recompute/archive'
+# number of lines in a compressed block
+BLOCK_LINES = 1024
+# tokens are runs of letters/digits, with a letter in them
+TOKEN = re.compile('[0-9]*[a-z][a-z0-9]*')
+# regex metacharacters; patterns with these are not looked up in the index
+METACHARACTERS = set('.^$*+?{}[]\\|()')
+
+
+def tokenize(line):
+  """Tokens of `line` (lower case)"""
+  return set(TOKEN.findall(line.lower()))
+
+
+def parse_time(timestr):
+  """Parse time of form "YYYY-MM-DD" or "YYYY-MM-DD HH:MM[:SS]" into a timestamp"""
+  for fmt in [ '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d' ]:
+    try:
+      return time.mktime(datetime.datetime.strptime(timestr, fmt).timetuple())
+    except ValueError:
+      pass
+  raise ValueError('Invalid time [{}]'.format(timestr))
+
+
+def is_complete(logfile):
+  """Has the run that wrote `logfile` ended? (last line is "EOF")"""
+  if not os.path.exists(logfile):
+    return False
+  with open(logfile, 'rb') as f:
+    f.seek(max(os.path.getsize(logfile) - 8, 0))
+    return f.read().strip().split(b'\n')[-1] == b'EOF'
+
+
+class Archive(object):
+  """Archive of completed run logs"""
+
+  def __init__(self, path=ARCHIVE_DIR):
+    """
+    Parameters
+    ----------
+    path : str, optional
+      Archive directory (default ARCHIVE_DIR)
+    """
+    self.path = path
+    # index file
+    self.index_file = os.path.join(path, 'index')
+    # runs   : { run : { time, name, instance, lines, digest, blocks } }
+    # tokens : { token : { run : [ block idx ... ] } }
+    self.runs, self.tokens = {}, {}
+    # tokens, sorted; tokens reversed, sorted (for lookups by suffix)
+    self.vocabulary, self.reversed_vocabulary = None, None
+    if os.path.exists(self.index_file):
+      index = pickle.load(open(self.index_file, 'rb'))
+      self.runs, self.tokens = index['runs'], index['tokens']
+      self.vocabulary = index.get('vocabulary')
+      self.reversed_vocabulary = index.get('reversed_vocabulary')
+
+  def save(self):
+    """Write index to disk"""
+    if not os.path.exists(self.path):
+      os.makedirs(self.path)
+    self.sort_vocabulary()
+    pickle.dump({ 'runs' : self.runs, 'tokens' : self.tokens,
+      'vocabulary' : self.vocabulary, 'reversed_vocabulary' : self.reversed_vocabulary },
+        open(self.index_file, 'wb'))
+
+  def sort_vocabulary(self):
+    """Sort tokens for lookups by prefix/suffix, unless they are sorted already"""
+    if self.vocabulary is None or len(self.vocabulary) != len(self.tokens):
+      self.vocabulary = sorted(self.tokens)
+      self.reversed_vocabulary = sorted(token[::-1] for token in self.tokens)
+
+  def lookup(self, word, start=False, end=False):
+    """Tokens that `word` may be a part of
+
+    Parameters
+    ----------
+    word : str
+      A word of pattern
+    start : bool, optional
+      `word` may start mid-token (default False)
+    end : bool, optional
+      `word` may end mid-token (default False)
+
+    Returns
+    -------
+    list
+      Tokens
+    """
+    if not start and not end:
+      return [ word ] if word in self.tokens else []
+    self.sort_vocabulary()
+    if start and end:  # any part of a token; scan
+      return [ token for token in self.vocabulary if word in token ]
+    # tokens that start (end) with `word` are a run in sorted tokens (reversed tokens)
+    vocabulary, word = (self.vocabulary, word) if end else (self.reversed_vocabulary, word[::-1])
+    tokens = vocabulary[bisect.bisect_left(vocabulary, word):bisect.bisect_left(vocabulary, word + '\uffff')]
+    return tokens if end else [ token[::-1] for token in tokens ]
+
+  def add(self, logfile, name='', instance='', end_time=None):
+    """Archive log file `logfile`
+
+    Parameters
+    ----------
+    logfile : str
+      Path to log file
+    name : str, optional
+      Name of project (default '')
+    instance : str, optional
+      Instance the run was executed in (default '')
+    end_time : float, optional
+      Timestamp of the end of run (default modification time of `logfile`)
+
+    Returns
+    -------
+    str
+      Run id; `None` if the log was archived already
+    """
+    data = open(logfile, 'rb').read()
+    digest = hashlib.sha1(data).hexdigest()
+    # already archived?
+    if any(run['digest'] == digest for run in self.runs.values()):
+      logger.info('Log archived already [{}]'.format(logfile))
+      return
+    end_time = end_time if end_time else os.path.getmtime(logfile)
+    # run id : end time of run, disambiguated by digest
+    run_id = '{}-{}'.format(
+        datetime.datetime.fromtimestamp(end_time).strftime('%Y%m%d-%H%M%S'),
+        digest[:6])
+    lines = data.decode('utf-8', 'replace').splitlines(True)
+    # . compress block by block
+    # .. index blocks and tokens
+    blocks, offset = [], 0
+    if not os.path.exists(self.path):
+      os.makedirs(self.path)
+    with open(os.path.join(self.path, '{}.gz'.format(run_id)), 'wb') as f:
+      for idx, first in enumerate(range(0, len(lines), BLOCK_LINES)):
+        block = lines[first:first + BLOCK_LINES]
+        compressed = gzip.compress(''.join(block).encode('utf-8'))
+        f.write(compressed)
+        blocks.append((offset, len(compressed), first))
+        offset += len(compressed)
+        for token in tokenize(''.join(block)):
+          self.tokens.setdefault(token, {}).setdefault(run_id, []).append(idx)
+    self.runs[run_id] = {
+        'time' : end_time,
+        'name' : name,
+        'instance' : instance,
+        'lines' : len(lines),
+        'digest' : digest,
+        'blocks' : blocks
+        }
+    self.save()
+    logger.info('Archived [{}] as {}'.format(logfile, run_id))
+    return run_id
+
+  def select(self, run=None, since=None, until=None):
+    """Select runs by id (prefix) and time
+
+    Parameters
+    ----------
+    run : str, optional
+      Run id or a prefix of it (default None)
+    since : str, optional
+      Runs that ended at or after this time "YYYY-MM-DD [HH:MM]" (default None)
+    until : str, optional
+      Runs that ended at or before this time "YYYY-MM-DD [HH:MM]" (default None)
+
+    Returns
+    -------
+    list
+      Run ids, in chronological order
+    """
+    since = parse_time(since) if since else None
+    until = parse_time(until) if until else None
+    return sorted([ run_id for run_id, info in self.runs.items()
+      if (not run or run_id.startswith(run))
+      and (since is None or info['time'] >= since)
+      and (until is None or info['time'] <= until) ])
+
+  def candidates(self, pattern, runs):
+    """Blocks that may contain `pattern`, looked up in the inverted index
+
+    Returns
+    -------
+    dict
+      { run : [ block idx ... ] }; `None` if `pattern` can't be looked up
+    """
+    if METACHARACTERS & set(pattern):
+      return
+    pattern = pattern.lower()
+    words = list(TOKEN.finditer(pattern))
+    if not words:
+      return
+    candidates = { run_id : None for run_id in runs }
+    for match in words:
+      # the first word may start mid-token ("oss" of "loss"), the last one may end mid-token;
+      # words within are bounded by characters that aren't part of tokens
+      tokens = self.lookup(match.group(), start=match.start() == 0, end=match.end() == len(pattern))
+      blocks = {}
+      for token in tokens:
+        for run_id, idxs in self.tokens[token].items():
+          blocks.setdefault(run_id, set()).update(idxs)
+      # blocks must contain every word
+      candidates = { run_id : blocks[run_id] if idxs is None else idxs & blocks[run_id]
+          for run_id, idxs in candidates.items() if run_id in blocks }
+    return { run_id : sorted(idxs) for run_id, idxs in candidates.items() if idxs }
+
+  def read_block(self, run_id, idx):
+    """Decompress block `idx` of run `run_id`
+
+    Returns
+    -------
+    list
+      Lines in block
+    """
+    offset, size, _ = self.runs[run_id]['blocks'][idx]
+    with open(os.path.join(self.path, '{}.gz'.format(run_id)), 'rb') as f:
+      f.seek(offset)
+      return gzip.decompress(f.read(size)).decode('utf-8').splitlines()
+
+  def search(self, pattern, run=None, since=None, until=None):
+    """Search archived logs for lines that match regex `pattern`
+
+    Parameters
+    ----------
+    pattern : str
+      A regular expression
+    run : str, optional
+      Run id or a prefix of it (default None)
+    since : str, optional
+      Runs that ended at or after this time (default None)
+    until : str, optional
+      Runs that ended at or before this time (default None)
+
+    Yields
+    ------
+    tuple
+      (run, line number, line) of matching lines
+    """
+    regex = re.compile(pattern)
+    runs = self.select(run, since, until)
+    candidates = self.candidates(pattern, runs)
+    if candidates is None:  # scan every block
+      candidates = { run_id : range(len(self.runs[run_id]['blocks'])) for run_id in runs }
+    for run_id in runs:
+      for idx in candidates.get(run_id, []):
+        first = self.runs[run_id]['blocks'][idx][-1]
+        for i, line in enumerate(self.read_block(run_id, idx)):
+          if regex.search(line):
+            yield run_id, first + i + 1, line
@@ -2,14 +2,18 @@
 
 Bundle encapsulates the local repository in the current directory.
 Dependencies are resolved and added to a local database (`.recompute/resync.db`).
-pypi package requirements are resolved and added to `requirements.txt`.
-Inclusion/Exclusion rules are read from the local configuration files `.recompute/include` and `.recompute/exclude`.
+pypi package requirements are resolved (`imports.ImportScanner`) and added to `requirements.txt`.
+Inclusion/Exclusion rules (gitignore-style globs) are read from the local configuration files
+`.recompute/include` and `.recompute/exclude`; `.gitignore` files are honoured (`walker.walk`).
+A stat index (`.recompute/stat.index`) remembers (size, mtime, inode) of every file scanned;
+requirements and the local database are rebuilt only when the index shows a change.
 
 """
+import pickle
 import os
 
-from recompute import process
-from recompute import cmd
+from recompute import imports
+from recompute import walker
 from recompute import utils
 
 # setup logger
@@ -20,6 +24,7 @@ RSYNC_DB = '.recompute/rsync.db'
 REQS = 'requirements.txt'
 INCLUDE = '.recompute/include'
 EXCLUDE = '.recompute/exclude'
+STAT_INDEX = '.recompute/stat.index'
 
 
 class Bundle(object):
@@ -43,19 +48,71 @@ class Bundle(object):
     # update bundle dependencies
     self.update_dependencies()
 
-  def update_dependencies(self):
-    """Update dependencies including local files and pypi packages."""
-    # get a list of files (local dependencies)
-    self.files = list(self.get_local_deps())
-    # add INCLUDE; remote EXCLUDE
-    self.files = self.inclusion_exclusion()
+  def update_dependencies(self, force=False):
+    """Update dependencies including local files and pypi packages.
+
+    Files are compared against the stat index; only changes trigger rebuilds.
+
+    Parameters
+    ----------
+    force : bool, optional
+      When set to `True`, requirements and local database are rebuilt regardless (default False)
+    """
+    # . stat local dependencies
+    # .. compare with stat index
+    stats = self.stat_local_deps()
+    index = self.read_stat_index()
+    # new, modified and removed files
+    self.changed = set([ path for path, stat in stats.items()
+      if index['stats'].get(path) != stat ]) | (set(index['stats']) - set(stats))
+    logger.info('{} files changed'.format(len(self.changed)))
+    # get a list of files (local dependencies, INCLUDE; EXCLUDE pruned)
+    self.files = sorted(stats)
+    self.sources = [ path for path in self.files if path.endswith('.py') ]
     logger.info(' '.join(self.files))
     # create a file containing list of dependencies
-    self.populate_requirements()
+    if force or self.changed or not os.path.exists(REQS):
+      self.populate_requirements()
     # get a list of dependencies (python packages)
     self.requirements = self.get_requirements()
     # create a file containting list of local dependencies
-    self.populate_local_deps()
+    if force or self.files != index['files'] or not os.path.exists(self.db):
+      self.populate_local_deps()
+    # update stat index
+    self.write_stat_index(stats)
+
+  def stat_local_deps(self):
+    """Stat local dependencies (`get_local_deps`)
+
+    Returns
+    -------
+    dict
+      { path : (size, mtime, inode) }
+    """
+    stats = {}
+    for path in self.get_local_deps():
+      st = os.stat(path)
+      stats[path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+    return stats
+
+  def read_stat_index(self):
+    """Read stat index; an empty index if there is none
+
+    Returns
+    -------
+    dict
+      { 'stats' : { path : (size, mtime, inode) }, 'files' : [ path ... ] }
+    """
+    if os.path.exists(STAT_INDEX):
+      try:
+        return pickle.load(open(STAT_INDEX, 'rb'))
+      except (EOFError, pickle.UnpicklingError):
+        logger.error('Stat index is corrupt; rebuild')
+    return { 'stats' : {}, 'files' : None }
+
+  def write_stat_index(self, stats):
+    """Write stat index"""
+    pickle.dump({ 'stats' : stats, 'files' : self.files }, open(STAT_INDEX, 'wb'))
 
   def init_include_exclude(self):
     """Create include/exclude local configuration files."""
@@ -65,24 +122,34 @@ class Bundle(object):
       open(EXCLUDE, 'w').close()
 
   def inclusion_exclusion(self):
-    """Read from include/exclude configuration files and update database."""
-    # read from .recompute/include
-    include = [ f for f in open(INCLUDE).readlines() if f.strip() ]
-    # read from .recompute/exclude
-    exclude = [ f for f in open(EXCLUDE).readlines() if f.strip() ]
-    # update self.files
-    self.files = [ f for f in self.files if f not in exclude ]
-    self.files.extend(include)
-    return list(set(self.files))
+    """Read from include/exclude configuration files
+
+    Returns
+    -------
+    tuple
+      (include, exclude) Compiled rules (`walker.compile_patterns`)
+    """
+    return walker.read_patterns(INCLUDE), walker.read_patterns(EXCLUDE)
 
   def get_local_deps(self):
     """Resolve local dependencies.
 
-    Run a search for *.py files in current directory.
+    Walk current directory for *.py files and files that match INCLUDE,
+    pruning directories that match EXCLUDE or `.gitignore`.
+    Files in INCLUDE given by path are added even if they are excluded.
     """
-    for dirpath, dirnames, filenames in os.walk("."):
-      for filename in [f for f in filenames if f.endswith(".py")]:
-        yield os.path.join(dirpath, filename)
+    include, exclude = self.inclusion_exclusion()
+    paths = set(walker.walk('.', exclude, include))
+    for line in open(INCLUDE).readlines():
+      path = os.path.normpath(line.strip())
+      if line.strip() and not walker.GLOB_CHARS & set(path) and os.path.isfile(path):
+        paths.add(path)
+    return sorted(paths)
+
+  def get_local_dirs(self):
+    """Directories walked for local dependencies (current directory included)"""
+    _, exclude = self.inclusion_exclusion()
+    return [ '.' ] + [ path for path, is_dir in walker.scan('.', exclude) if is_dir ]
 
   def populate_local_deps(self):
     """ Write local dependencies to file (local database)."""
@@ -96,9 +163,11 @@ class Bundle(object):
     """Resolve pypi package dependencies and populate requirement.txt."""
     # . get a list of pip packages
     # .. write to requirements.txt
-    assert process.execute(
-        cmd.REDIRECT_STDOUT_NULL.format(command=cmd.PIP_REQS)
-        )
+    requirements = imports.ImportScanner().requirements(self.sources, self.changed)
+    with open(REQS, 'w') as f:
+      for requirement in requirements:
+        f.write(requirement)
+        f.write('\n')
 
   def get_requirements(self):
     """Read from requirements.txt."""
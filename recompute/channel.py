@@ -0,0 +1,251 @@
+"""channel.py
+
+AgentChannel talks to the remote agent (`agent.py`) over a single ssh channel.
+The agent is uploaded to `$HOME/.recompute/` in remote machine and started once per instance.
+Requests are JSON lines tagged with an id; many requests can be in flight at once.
+A reader thread matches responses to requests by id.
+
+`get` returns `None` when the agent can't be started (no python3, for example);
+callers fall back to executing command strings over ssh.
+The channel is opened through the instance's transport (see `transport.py`).
+
+"""
+import atexit
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import threading
+
+from recompute import agent
+from recompute import cmd
+from recompute import process
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# agent lives in `$HOME/.recompute/` of remote machine
+AGENT_DIR = '.recompute'
+# number of seconds to wait for a response
+TIMEOUT = 60
+
+
+class AgentError(Exception):
+  """Agent is unavailable or a request failed"""
+  pass
+
+
+def agent_source(module=agent):
+  """Source code of agent (or another standalone `module` run in remote)"""
+  with open(os.path.splitext(module.__file__)[0] + '.py') as f:
+    return f.read()
+
+
+def agent_path(module=agent):
+  """Path to agent (or another standalone `module`) in remote machine, relative to $HOME
+
+  The name carries a hash of the source, so that a modified agent is uploaded anew.
+  """
+  digest = hashlib.sha1(agent_source(module).encode('utf-8')).hexdigest()[:12]
+  name = module.__name__.split('.')[-1]
+  return os.path.join(AGENT_DIR, '{}-{}.py'.format(name, digest))
+
+
+class AgentChannel(object):
+  """AgentChannel is a client of the agent, connected to the agent's STDIO"""
+
+  def __init__(self, command):
+    """
+    Parameters
+    ----------
+    command : str
+      Local command that starts the agent (ex: ssh into remote and run agent)
+    """
+    self.command = command
+    self.proc = None
+    # requests in flight : { id : [ event, response ] }
+    self.pending = {}
+    self.counter = itertools.count(1)
+    self.lock = threading.Lock()
+    # id 0 is reserved for the agent's introduction
+    self.info = None
+    self.closed = False
+
+  def start(self, timeout=TIMEOUT):
+    """Start agent and wait for its introduction
+
+    Returns
+    -------
+    dict
+      Agent's introduction { version, pid }
+
+    Raises
+    ------
+    AgentError
+      If the agent doesn't introduce itself
+    """
+    logger.info(self.command)
+    self.pending[0] = [ threading.Event(), None ]
+    self.proc = subprocess.Popen(self.command, shell=True,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    reader = threading.Thread(target=self.read)
+    reader.daemon = True
+    reader.start()
+    self.info = self.wait(0, timeout)
+    logger.info('Agent {}'.format(self.info))
+    return self.info
+
+  def read(self):
+    """Read responses and hand them over to waiting requests"""
+    for line in iter(self.proc.stdout.readline, b''):
+      try:
+        response = json.loads(line.decode('utf-8'))
+      except ValueError:
+        logger.error('Bad response [{}]'.format(line))
+        continue
+      with self.lock:
+        slot = self.pending.get(response.get('id'))
+      if slot:
+        slot[1] = response
+        slot[0].set()
+    # channel is closed; wake up everyone waiting
+    with self.lock:
+      self.closed = True
+      for event, _ in self.pending.values():
+        event.set()
+
+  def wait(self, id_, timeout):
+    """Wait for response to request `id_`"""
+    event = self.pending[id_][0]
+    event.wait(timeout)
+    with self.lock:
+      _, response = self.pending.pop(id_)
+    if response is None:
+      raise AgentError('No response to request {}'.format(id_))
+    if not response['ok']:
+      raise AgentError(response['error'])
+    return response['result']
+
+  def request(self, op, wait=TIMEOUT, **args):
+    """Send a request to agent and wait for response
+
+    Safe to call from many threads at once.
+
+    Parameters
+    ----------
+    op : str
+      Operation (exec/stat/read/tail/ps/alive/kill), see `agent.OPS`
+    wait : float, optional
+      Number of seconds to wait for response (default TIMEOUT); `None` to wait for as long as it takes
+    args : dict
+      Arguments of operation (`timeout` of exec is one of them)
+
+    Returns
+    -------
+    object
+      Result of operation
+
+    Raises
+    ------
+    AgentError
+      If the channel is broken or the operation fails
+    """
+    with self.lock:
+      if self.closed:
+        raise AgentError('Channel is closed')
+      id_ = next(self.counter)
+      self.pending[id_] = [ threading.Event(), None ]
+      line = json.dumps({ 'id' : id_, 'op' : op, 'args' : args }) + '\n'
+      try:
+        self.proc.stdin.write(line.encode('utf-8'))
+        self.proc.stdin.flush()
+      except (OSError, ValueError) as e:
+        self.pending.pop(id_)
+        raise AgentError('Channel is broken [{}]'.format(e))
+    return self.wait(id_, wait)
+
+  def close(self):
+    """Close channel; agent exits when its STDIN closes"""
+    if self.proc and self.proc.poll() is None:
+      try:
+        self.proc.stdin.close()
+        self.proc.wait(timeout=2)
+      except (OSError, subprocess.TimeoutExpired):
+        self.proc.kill()
+
+
+# open channels, one per instance (`None` : agent is unavailable)
+_channels = {}
+
+
+def make_start_cmd(transport):
+  """Command that starts agent in remote machine, through `transport`"""
+  return transport.make_cmd(cmd.AGENT_START.format(path=agent_path()))
+
+
+def upload(transport, module=agent):
+  """Upload agent (or another standalone `module`) to remote machine, through `transport`
+
+  Returns
+  -------
+  bool
+    `True` if the agent was uploaded, `False` otherwise
+  """
+  return process.run(upload_async(transport, module))
+
+
+async def upload_async(transport, module=agent):
+  """Upload agent (or another standalone `module`) to remote machine, from within an event loop
+
+  See `upload`
+  """
+  script = cmd.AGENT_UPLOAD.format(dir=AGENT_DIR, path=agent_path(module))
+  _, output = await transport.run_cmd_async(transport.make_cmd(script),
+    input=agent_source(module).encode('utf-8'))
+  return bool(output) and output.strip() == 'ok'
+
+
+def get(transport):
+  """Get a channel to agent in remote machine
+
+  The agent is started on first use, and uploaded if it is absent.
+
+  Parameters
+  ----------
+  transport : transport.Transport
+    Transport of remote device
+
+  Returns
+  -------
+  AgentChannel
+    An open channel; `None` if the agent is unavailable
+  """
+  instance = transport.instance
+  if str(instance) in _channels:
+    return _channels[str(instance)]
+  channel = None
+  for attempt in range(2):
+    channel = AgentChannel(make_start_cmd(transport))
+    try:
+      channel.start()
+      break
+    except AgentError:
+      channel.close()
+      channel = None
+      # agent is absent in remote (or outdated); upload and try again
+      if attempt > 0 or not upload(transport):
+        logger.error('Agent unavailable in {}'.format(instance))
+        break
+  _channels[str(instance)] = channel
+  return channel
+
+
+@atexit.register
+def close_all():
+  """Close all open channels"""
+  for channel in _channels.values():
+    if channel:
+      channel.close()
+  _channels.clear()
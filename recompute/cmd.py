@@ -8,9 +8,8 @@ This definitely requires better organization.
 Commands in string format should be replaced with functions with arguments for formatting the command.
 
 """
-# __pipreqs__ resolves pypi package requirements
-# and writes it to requirements.txt
-PIP_REQS = 'pipreqs . --force'
+import shlex
+import re
 
 # __nvidia-smi__ gives a status report on the GPU
 # we format the results to get free GPU memory
@@ -18,10 +17,26 @@ GPU_FREE_MEMORY = 'nvidia-smi \
     --query-gpu=memory.free \
     --format=csv,nounits,noheader'
 
+# total and free memory (MB) of every GPU, a line each
+# the scheduler places jobs by it, see `scheduler.parse_probe`
+GPU_MEMORY = 'nvidia-smi \
+    --query-gpu=memory.total,memory.free \
+    --format=csv,nounits,noheader'
+
+# number of CPU cores and load average (1 minute)
+CPU_LOAD = 'echo $(nproc) $(cut -d " " -f 1 /proc/loadavg)'
+
 # __free__ outputs free disk space available in device
 # we format it using `utils.parse_free_results`
 DISK_FREE_MEMORY = "free -m"
 
+# __df__ reports free disk space of the device that holds `path`
+# we format it using `utils.parse_df_results`
+DISK_FREE_SPACE = 'df -Pm {path}'
+
+# version of remote __python__
+PYTHON_VERSION = 'python3 --version'
+
 # __jupyter-notebook__ starts a notebook server in remote device
 # `port_num` acts as a handle to keep track of the server
 JUPYTER_SERVER = 'jupyter-notebook --no-browser --port={port_num}\
@@ -29,67 +44,175 @@ JUPYTER_SERVER = 'jupyter-notebook --no-browser --port={port_num}\
 
 SSH_HEADER = 'sshpass -p {password}'
 
+# __ssh__ multiplexing options, see `connection.py`
+# reuse the master connection listening on `control_path`
+# the master lingers for `persist` seconds after the last session ends
+SSH_MULTIPLEX = '-o ControlMaster=auto \
+    -o ControlPath={control_path} \
+    -o ControlPersist={persist}'
+
+# disable multiplexing; every command pays a full handshake
+SSH_NO_MULTIPLEX = '-o ControlMaster=no -o ControlPath=none'
+
+# open a master connection in the background
+# NOTE : ssh honours the first value of an option; ControlMaster=yes goes first
+SSH_MASTER = 'ssh -o ControlMaster=yes {ssh_opts} -f -N {username}@{host}'
+
+# control a master connection (`operation` : check/exit)
+SSH_CONTROL = 'ssh {ssh_opts} -O {operation} {username}@{host}'
+
 # we hook up the remote notebook server to a local port via __ssh__
 # `client_port_num` and `server_port_num` are required
-JUPYTER_CLIENT = SSH_HEADER + ' ' + 'ssh -N -L \
+JUPYTER_CLIENT = SSH_HEADER + ' ' + 'ssh {ssh_opts} -N -L \
     {client_port_num}:localhost:{server_port_num} \
     {username}@{host}'
 
-# __ps__ results are filtered using __grep__ with a the pattern __re.runner__
-# to identify the processes we started in the remote system
-PROCESS_LIST_LINUX = 'ps axf | grep re.runner | grep -v grep'
-
-# process list for __mac__
-# ...
-PROCESS_LIST_OSX = 'ps aux | grep re.runner | grep -v grep'
+# name of runner script; processes we started carry it in their command line
+RUNNER_PATTERN = 're.runner'
 
-# filter __ps__ results using __pid__
-# ...
-PROCESS_PID_LINUX = 'ps -aux | grep {pid}'
+# __ps__ reports state of process `pid`; echoes `pid` if it is alive
+# zombies (state Z) are dead
+PROCESS_ALIVE = 'ps -o stat= -p {pid} | grep -qv Z && echo {pid}'
 
-# __kill__ process with pid as handle
+# __kill__ process group led by `pid` (a job started by `setsid`); the process alone, if it leads none
 # ...
-KILL_PROCESS = 'kill -9 {}'
+KILL_GROUP = 'kill -9 -{pid} 2>/dev/null || kill -9 {pid}'
+
+# runner registers itself as `job` in `registry` : pid, pgid, start time (clock ticks since boot;
+# tells a reused pid apart), log file, `command`; fields are separated by tabs
+REGISTER_JOB = ' '.join([
+  'mkdir -p {registry} &&',
+  'start=$(sed "s/.*) //" /proc/$$/stat 2>/dev/null | cut -d" " -f20) &&',
+  'printf "%s\\t%s\\t%s\\t%s\\t%s\\n" $$ "$(ps -o pgid= -p $$ | tr -d " ")" "${{start:--}}"',
+  '{logfile} {command} > {registry}/{job}'
+  ])
+
+# status of every job in `registry`, in one go : job, alive/dead, fields of registry entry
+# a job is alive if its pid is, with the start time registered, and isn't a zombie (`/proc`; `kill -0` elsewhere)
+# dead jobs are reported once and removed
+JOBS_STATUS = '\n'.join([
+  'cd {registry} 2>/dev/null || exit 0',
+  'for job in *; do',
+  '  [ -f "$job" ] || continue',
+  '  read -r pid pgid start rest < "$job"',
+  '  state=dead',
+  '  if [ -r /proc/"$pid"/stat ]; then',
+  '    set -- $(sed "s/.*) //" /proc/"$pid"/stat)',
+  '    [ "$1" != Z ] && {{ [ "$start" = - ] || [ "${{20}}" = "$start" ]; }} && state=alive',
+  '  elif [ ! -d /proc ] && kill -0 "$pid" 2>/dev/null; then state=alive; fi',
+  '  printf "%s\\t%s\\t" "$job" "$state"; cat "$job"',
+  '  [ "$state" = alive ] || rm -f "$job"',
+  'done'
+  ])
 
 # __scp__ copies file from remote device to local device
 # one file at a time, fellas!
-SCP_FROM_REMOTE = 'scp -r {username}@{host}:{remotepath} {localpath}'
+SCP_FROM_REMOTE = 'scp {ssh_opts} -r {username}@{host}:{remotepath} {localpath}'
 
 # __scp__ copies file from local device to remote device
 # one file at a time, fellas!
-SCP_TO_REMOTE = 'scp -r {localpath} {username}@{host}:{remotepath}'
+SCP_TO_REMOTE = 'scp {ssh_opts} -r {localpath} {username}@{host}:{remotepath}'
 
 # __rsync__ synchonizes files listed in `.recompute/rsync.db`
 # with remote device
-RSYNC = 'rsync -a --files-from={deps_file} . \
+RSYNC = 'rsync -a -e "ssh {ssh_opts}" --files-from={deps_file} . \
         {username}@{host}:{remote_dir}'
 
+# __rsync__ copies files listed in `files_from` (relative to `remote_dir`) from remote device to `local_dir`
+# a file cut short is kept aside (--partial-dir) and resumed, by delta, next time;
+# the local copy is replaced only once the new one is whole (a checkpoint rewritten at the same size included)
+RSYNC_PULL = 'rsync -a --partial-dir=.rsync-partial -e "ssh {ssh_opts}" --files-from={files_from} \
+        {username}@{host}:{remote_dir} {local_dir}'
+
 # execute __cmd__ in remote device via __ssh__
 # ...
-SSH_EXEC = 'ssh {username}@{host} \'{cmd}\''
+SSH_EXEC = 'ssh {ssh_opts} {username}@{host} \'{cmd}\''
 
 # __ssh__ execute in remote device with a pseudo tty terminal
 # ...
-SSH_EXEC_PSEUDO_TERMINAL = 'ssh -t {username}@{host} \'{cmd}\''
+SSH_EXEC_PSEUDO_TERMINAL = 'ssh {ssh_opts} -t {username}@{host} \'{cmd}\''
 
 # __nohup__ ensures uninterrupted remote execution
 # ...
-SSH_EXEC_ASYNC = 'ssh {username}@{host} \'nohup {cmd} > {logfile} \
+SSH_EXEC_ASYNC = 'ssh {ssh_opts} {username}@{host} \'nohup {cmd} > {logfile} \
     2>{logfile} & echo $!\''
 
 # start __ssh__ session
 # changed into `remote_dir`
-__SSH_INTO_REMOTE_DIR = 'ssh -t {username}@{host} \
+__SSH_INTO_REMOTE_DIR = 'ssh {ssh_opts} -t {username}@{host} \
             "cd {remote_dir}; exec \\$SHELL --login"'
 SSH_INTO_REMOTE_DIR = SSH_HEADER + ' ' + __SSH_INTO_REMOTE_DIR
 
 # with __mkdir__, create directory in remote device
 # ...
-SSH_MAKE_DIR = 'ssh {username}@{host} mkdir -p {remote_dir}'
+SSH_MAKE_DIR = 'ssh {ssh_opts} {username}@{host} mkdir -p {remote_dir}'
+
+# execute a shell `script` in remote device via __ssh__
+# `script` is quoted by the caller, see `make_sh`
+SSH_EXEC_SCRIPT = 'ssh {ssh_opts} {username}@{host} {script}'
+
+# with __mkdir__, create a directory
+# ...
+MAKE_DIR = 'mkdir -p {path}'
+
+# loopback transport executes `script` locally, from `root`
+# `root` stands in for $HOME of remote device
+LOOPBACK_EXEC = 'cd {root} && HOME={root} sh -c {script}'
+
+# loopback transport opens an interactive shell in `remote_dir`
+LOOPBACK_SESSION = 'cd {remote_dir} && exec $SHELL'
+
+# __nohup__ ensures uninterrupted execution, PID is echoed
+# ...
+NOHUP = 'nohup {cmd} > {logfile} 2>{logfile} & echo $!'
+
+# __cp__ copies files within local device
+# ...
+COPY = 'cp -r {src} {dst}'
+
+# __tar__ copies files listed in `files_from` to `remote_dir`, within local device
+# ...
+TAR_SYNC = 'tar cf - -T {files_from} | tar xf - -C {remote_dir}'
+
+# __tar__ copies files listed in `files_from` (relative to `remote_dir`) to `local_dir`, within local device
+# ...
+TAR_SYNC_PULL = 'tar cf - -C {remote_dir} -T {files_from} | tar xf - -C {local_dir}'
+
+# __tar__ writes `members` ("-C dir name ...") to STDOUT
+# ...
+TAR_CREATE = 'tar cf - {members}'
+
+# __tar__ reads files from STDIN into directory `path`
+# ...
+TAR_EXTRACT = 'mkdir -p {path} && tar xf - -C {path}'
+
+# __tar__ writes files that match `patterns` (globs, relative to `base`) to STDOUT
+# patterns that match nothing are reported in STDERR (and the exit code)
+TAR_CREATE_GLOB = '\n'.join([
+  'cd {base} || exit 1',
+  'set --; missing=0',
+  'for p in {patterns}; do',
+  '  if [ -e "$p" ]; then set -- "$@" -C "$(cd "$(dirname "$p")" && pwd)" "$(basename "$p")"',
+  '  else echo "No such file in remote [$p]" >&2; missing=1; fi',
+  'done',
+  '[ $# -gt 0 ] && tar cf - "$@" && exit $missing'
+  ])
+
+# start remote agent (`agent.py`) with unbuffered STDIO
+# `exec` hands the ssh channel over to the agent
+AGENT_START = 'exec python3 -u {path}'
+
+# upload remote agent through STDIN
+# written to a temporary file first; a half-uploaded agent is never started
+AGENT_UPLOAD = 'mkdir -p {dir} && cat > {path}.tmp && mv {path}.tmp {path} && echo ok'
+
+# separates outputs of batched commands, see `make_batch`
+# `stream` : out/err/code
+BATCH_MARKER = '@@re:{token}:{idx}:{stream}'
 
 # run `exit` in a __ssh__ session
 # to test if the instance works
-SSH_TEST = 'ssh {username}@{host} \'exit\''
+SSH_TEST = 'ssh {ssh_opts} {username}@{host} \'exit\''
 
 # redirect __stdout__ and __stderr__ to `logfile`
 # push process to background using __&__
@@ -98,6 +221,25 @@ CMD_LOG_FOOTER_ASYNC = ' > {logfile} 2>{logfile} &'
 # redirect __stdout__ and __stderr__ to `logfile`
 CMD_LOG_FOOTER = ' > {logfile} 2>{logfile}'
 
+# print size of file `path` in bytes, followed by its contents from byte `offset` onwards
+# __head__ stops at the printed size; bytes appended meanwhile wait for the next read
+READ_FROM = 'size=$(wc -c < {path} 2>/dev/null || echo 0); echo $size; \
+    [ $size -gt {offset} ] && tail -c +$(({offset} + 1)) {path} | head -c $(($size - {offset}))'
+
+# follow log file `path` from the start with __tail -F__ (waits for the file to appear)
+# __awk__ filters lines by regex `pattern` in remote device; ends at the "EOF" line
+# the follower is killed when STDIN closes (the local end hung up) or when awk is done
+# NOTE : background jobs read /dev/null; the watchdog gets STDIN through fd 3
+# NOTE : mawk fills its input buffer before handing out lines, unless `-W interactive`
+FOLLOW_LOG = '\n'.join([
+    '__re_fifo=$(mktemp -u) && mkfifo $__re_fifo || exit 1',
+    'tail -n +1 -F {path} 2>/dev/null > $__re_fifo & __re_tail=$!',
+    'exec 3<&0; (cat <&3; kill $__re_tail) > /dev/null 2>&1 &',
+    '__re_awk=awk; awk -W version 2>/dev/null | grep -q mawk && __re_awk="awk -W interactive"',
+    '$__re_awk -v pattern={pattern} \'$0 == "EOF" {{ print; exit }} $0 ~ pattern {{ print; fflush() }}\' < $__re_fifo',
+    'kill $__re_tail 2>/dev/null; rm -f $__re_fifo'
+    ])
+
 # use __date__ to get "laste modified" time-stamp of a file
 # ...
 LAST_MODIFIED = 'date -r {filename}'
@@ -114,6 +256,74 @@ TRAP = 'trap "kill 0" SIGINT'
 # ...
 REDIRECT_STDOUT = '{command} > {logfile} 2>&1'
 
+# run `command` and append __stdout__ and __stderr__ to `logfile`
+# a subshell groups compound commands (`a; b`), `exit` included
+REDIRECT_APPEND = '( {command}\n) >> {logfile} 2>&1'
+
+# print contents of file `path`; nothing if there is none
+# ...
+READ_FILE = 'cat {path} 2>/dev/null'
+
+# run `command`; echo `token` if it succeeds
+# ...
+ECHO_ON_SUCCESS = '{command} && echo {token}'
+
+# __dd__ writes STDIN into file `path` at block `blocks` (of `bs` bytes), in place
+# ...
+WRITE_CHUNK = 'dd of={path} bs={bs} seek={blocks} conv=notrunc 2>/dev/null'
+
+# __dd__ reads `count` blocks (of `bs` bytes) of file `path` from block `blocks`
+# ...
+READ_CHUNK = 'dd if={path} bs={bs} skip={blocks} count={count} 2>/dev/null'
+
+# size and modification time of file `path` (GNU/BSD `stat`); nothing if it is not a file
+# ...
+FILE_STAT = '[ -f {path} ] && (stat -c "%s %Y" {path} 2>/dev/null || stat -f "%z %m" {path})'
+
+# sha256 of file `path`
+# ...
+FILE_SHA256 = '(sha256sum {path} 2>/dev/null || shasum -a 256 {path}) | cut -d" " -f1'
+
+# move file `path` to `dst` if its sha256 is `digest`; echo "ok" if it is moved
+# ...
+MOVE_IF_SHA256 = '[ "$( ' + FILE_SHA256 + ')" = {digest} ] && mv -f {path} {dst} && echo ok'
+
+# hardlink `digest` from content-addressed store `cas` to `dst` (a file in it, if `dst` is a directory)
+# echo "linked" if it is in store; else, echo path to file, unlinked from other copies (the store's)
+# ...
+CAS_LINK = '\n'.join([
+  'dst={dst}; [ -d "$dst" ] && dst="$dst"/{name}',
+  'mkdir -p "$(dirname "$dst")" || exit 1',
+  'if [ -f "$HOME"/{cas}/{digest} ] && ln -f "$HOME"/{cas}/{digest} "$dst"; then echo linked; exit; fi',
+  '[ -n "$(find "$dst" -links +1 2>/dev/null)" ] && rm -f "$dst"',
+  'echo "$dst"'
+  ])
+
+# keep file `path` in content-addressed store `cas`, as `digest`, if its sha256 is `digest`
+# ...
+CAS_DEPOSIT = ('[ "$( ' + FILE_SHA256 + ')" = {digest} ] && mkdir -p "$HOME"/{cas}'
+  ' && ([ -e "$HOME"/{cas}/{digest} ] || ln {path} "$HOME"/{cas}/{digest}) && echo ok')
+
+# list files under `dirs` (relative to current directory) : size, modification time, path
+# ...
+LIST_FILES = 'find {dirs} -type f -printf "%s %T@ %p\\n" 2>/dev/null'
+
+# list tree under `dir` : kind (f/d/l), size, modification time, path (relative to `dir`)
+# ...
+LIST_TREE = 'cd {dir} && find . -mindepth 1 -printf "%y %s %T@ %P\\n"'
+
+# is `path` a directory?
+# ...
+IS_DIR = '[ -d {path} ] && echo dir'
+
+# create file `path` anew, empty
+# ...
+TRUNCATE = ': > {path}'
+
+# run `command`; throw away __stdout__ and read __stderr__ through __stdout__
+# ...
+STDERR_ONLY = '{command} 2>&1 >/dev/null'
+
 # run `command` and redirect __stdout__ and __stderr__ to /dev/null
 # we basically throw away outputs
 REDIRECT_STDOUT_NULL = '{command} > /dev/null 2>&1'
@@ -122,10 +332,18 @@ REDIRECT_STDOUT_NULL = '{command} > /dev/null 2>&1'
 # NOTE : again, do we need this?
 WAIT = 'wait'
 
+# a script removes itself once started (bash keeps reading the open file)
+# every job has a runner of its own; they don't pile up
+REMOVE_SELF = 'rm -f -- "$0"'
+
 # execute bash script `runner`
 # ...
 EXEC_RUNNER = 'bash {runner}'
 
+# execute bash script `runner` in a session of its own (`setsid`, where available);
+# it leads a process group, which is killed as a whole
+EXEC_RUNNER_ASYNC = '$(command -v setsid) bash {runner}'
+
 # set `INT` and `TERM` __trap__
 # exit when trap is triggered
 TRAP_INT_TERM = 'trap "exit" INT TERM'
@@ -135,15 +353,115 @@ TRAP_INT_TERM = 'trap "exit" INT TERM'
 TRAP_EXIT = 'trap "kill 0" EXIT'
 
 
-def make_wget(urls):
-  """Download multiple URLs with `wget`
+def make_fetch(path, dir_, urls, jobs=4, cas=None):
+  """Download multiple URLs, `jobs` at a time, with the download manager (`fetch.py`)
 
   Parameters
   ----------
+  path : str
+    Path to download manager in remote machine, relative to $HOME
+  dir_ : str
+    Directory where downloaded files go
   urls : list
     A list of URLs to download from
+  jobs : int, optional
+    Number of URLs downloaded at once (default 4)
+  cas : str, optional
+    Content-addressed store, relative to $HOME (default None)
+  """
+  return 'python3 "$HOME"/{} --dir {} --jobs {} {}{}'.format(shlex.quote(path),
+      shlex.quote(dir_), int(jobs), '--cas "$HOME"/{} '.format(shlex.quote(cas)) if cas else '',
+      ' '.join(shlex.quote(url) for url in urls))
+
+
+def make_sampler(path, out, interval=2, pid='$$'):
+  """Sample resource usage of job led by `pid` into ring buffer `out`, with the sampler (`sampler.py`)
+
+  A line of runner : the sampler is detached (`wait` of runner doesn't wait for it),
+  and skipped if it isn't in remote machine.
+
+  Parameters
+  ----------
+  path : str
+    Path to sampler in remote machine, relative to $HOME
+  out : str
+    Ring buffer file, relative to $HOME
+  interval : float, optional
+    Seconds between samples (default 2)
+  pid : str, optional
+    Process that leads the job (default '$$' : the runner)
+  """
+  return '[ -f "$HOME"/{path} ] && ( python3 "$HOME"/{path} --pid {pid} --out "$HOME"/{out} ' \
+      '--interval {interval} </dev/null >/dev/null 2>&1 & )'.format(path=shlex.quote(path), pid=pid,
+          out=shlex.quote(out), interval=float(interval))
+
+
+def make_sampler_read(path, dir_, last=2):
+  """Print (JSON) latest `last` samples of every ring buffer in `dir_`, with the sampler (`sampler.py`)
+
+  Parameters
+  ----------
+  path : str
+    Path to sampler in remote machine, relative to $HOME
+  dir_ : str
+    Directory of ring buffers, relative to $HOME
+  last : int, optional
+    Number of samples per job (default 2)
+  """
+  return 'python3 "$HOME"/{} --read "$HOME"/{} --last {}'.format(shlex.quote(path),
+      shlex.quote(dir_), int(last))
+
+
+def quote_glob(pattern):
+  """Quote `pattern` for the shell, leaving glob metacharacters (`*`, `?`, `[..]`) to expand"""
+  return ''.join(part if re.match(r'^(\*|\?|\[[^\]]+\])$', part) else shlex.quote(part)
+      for part in re.split(r'(\*|\?|\[[^\]]+\])', pattern) if part)
+
+
+def make_sh(script):
+  """Wrap `script` in `sh -c`, quoted for the remote login shell
+
+  The remote user's login shell could be anything (bash, zsh, fish);
+  `sh` makes sure the script is interpreted by a POSIX shell.
+
+  Parameters
+  ----------
+  script : str
+    Shell script (one or more lines)
+  """
+  return 'sh -c {}'.format(shlex.quote(script))
+
+
+def make_batch(commands, token):
+  """Make a shell script that runs `commands` one after another
+
+  STDOUT, STDERR and exit code of each command are printed
+  in sections separated by `BATCH_MARKER`.
+  Every marker is preceded by a newline, so that the sections are parsable
+  even when a command's output doesn't end with one.
+
+  Parameters
+  ----------
+  commands : list
+    A list of commands to be executed
+  token : str
+    A random token that makes markers unambiguous
+
+  Returns
+  -------
+  str
+    Shell script
   """
-  return 'wget -c {}'.format(' '.join(urls))
+  lines = [ '__re_dir=$(mktemp -d)' ]
+  for idx, command in enumerate(commands):
+    marker = BATCH_MARKER.format(token=token, idx=idx, stream='{}')
+    lines += [
+      '{{ {}\n}} </dev/null >"$__re_dir/out" 2>"$__re_dir/err"; __re_code=$?'.format(command),
+      'printf \'\\n{}\\n\'; cat "$__re_dir/out"'.format(marker.format('out')),
+      'printf \'\\n{}\\n\'; cat "$__re_dir/err"'.format(marker.format('err')),
+      'printf \'\\n{}:%s\\n\' $__re_code'.format(marker.format('code'))
+      ]
+  return '\n'.join(lines + [ 'rm -rf "$__re_dir"' ])
 
 
 def make_traps():
@@ -163,3 +481,14 @@ def kill_procs(pids):
     A list of process id's (processes that ought to be killed)
   """
   return ' '.join( ['kill -9'] + [ str(pid) for pid in pids ] )
+
+
+def kill_groups(pids):
+  """Kill process groups led by `pids` (processes alone, if they lead none)
+
+  Parameters
+  ----------
+  pids : list
+    A list of process id's (leaders of groups that ought to be killed)
+  """
+  return '; '.join([ KILL_GROUP.format(pid=int(pid)) for pid in pids ])
@@ -173,5 +173,11 @@ class ConfigManager(object):
         'host' : instance.host,
         'password' : instance.password
         }
+    # ssh is implied
+    if getattr(instance, 'transport', 'ssh') != 'ssh':
+      self.config['instance {}'.format(idx)]['transport'] = instance.transport
+    # the scheduler runs `instance.MAX_JOBS` jobs at once, by default
+    if getattr(instance, 'max_jobs', None):
+      self.config['instance {}'.format(idx)]['max_jobs'] = str(instance.max_jobs)
     # update config file
     self.update(self.config)
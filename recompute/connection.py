@@ -0,0 +1,193 @@
+"""connection.py
+
+Connection Manager keeps one persistent, multiplexed ssh connection per instance.
+The first ssh/scp/rsync call to an instance opens a master connection (ControlMaster).
+Every subsequent call is routed through the master's control socket,
+which skips the TCP handshake, key exchange and authentication.
+An idle master exits by itself after `CONTROL_PERSIST` seconds (ControlPersist).
+The number of sessions multiplexed concurrently over a master is capped at `MAX_SESSIONS`.
+
+"""
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from recompute import cmd
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# control sockets live here
+CONTROL_DIR = os.path.join(os.path.expanduser('~'), '.recompute.cm')
+# idle master connections exit after `CONTROL_PERSIST` seconds
+CONTROL_PERSIST = 600
+# max number of concurrent sessions per master connection
+#  sshd's own limit (MaxSessions) defaults to 10
+MAX_SESSIONS = 8
+
+
+class ConnectionManager(object):
+  """ConnectionManager maintains a master ssh connection per instance."""
+
+  def __init__(self, control_dir=None, persist=None, max_sessions=None, options=''):
+    """
+    Parameters
+    ----------
+    control_dir : str, optional
+      Directory that holds control sockets (default None)
+      By default, `$HOME/.recompute.cm` is used
+    persist : int, optional
+      Idle timeout of a master connection in seconds (default None)
+    max_sessions : int, optional
+      Max number of concurrent sessions per instance (default None)
+    options : str, optional
+      Extra ssh options added to every command, ex: "-o Port=2222" (default '')
+    """
+    self.control_dir = control_dir if control_dir else CONTROL_DIR
+    self.persist = persist if persist else CONTROL_PERSIST
+    self.max_sessions = max_sessions if max_sessions else MAX_SESSIONS
+    self.options = options
+    # session semaphores, one per instance
+    self.semaphores = {}
+    # instances with a master connection opened by us
+    self.masters = set()
+    self.lock = threading.Lock()
+
+  def control_path(self):
+    """Path to control socket
+
+    `%C` is expanded by ssh into a hash of (local host, host, port, username),
+    which keeps the socket path short and unique per instance.
+    """
+    if not os.path.exists(self.control_dir):
+      os.makedirs(self.control_dir, mode=0o700)
+    return os.path.join(self.control_dir, '%C')
+
+  def ssh_options(self, instance=None, multiplex=True):
+    """Build ssh options for `instance`
+
+    Parameters
+    ----------
+    instance : instance.Instance, optional
+      Instance of remote device (default None)
+    multiplex : bool, optional
+      When set to `False`, options that disable multiplexing are returned (default True)
+
+    Returns
+    -------
+    str
+      Options understood by ssh, scp and `rsync -e ssh`
+    """
+    if not multiplex:
+      return ' '.join([cmd.SSH_NO_MULTIPLEX, self.options]).strip()
+    return ' '.join([
+      cmd.SSH_MULTIPLEX.format(
+        control_path=self.control_path(),
+        persist=self.persist),
+      self.options
+      ]).strip()
+
+  def is_alive(self, instance):
+    """Is there a master connection to `instance`?
+
+    Parameters
+    ----------
+    instance : instance.Instance
+      Instance of remote device
+
+    Returns
+    -------
+    bool
+      `True` if a master connection is alive, `False` otherwise
+    """
+    command = cmd.SSH_CONTROL.format(
+        ssh_opts=self.ssh_options(instance), operation='check',
+        username=instance.username, host=instance.host)
+    return subprocess.call(command, shell=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+
+  def open(self, instance):
+    """Open a master connection to `instance`, unless one is alive
+
+    Parameters
+    ----------
+    instance : instance.Instance
+      Instance of remote device
+
+    Returns
+    -------
+    bool
+      `True` if a master connection is alive, `False` otherwise
+    """
+    with self.lock:
+      if str(instance) in self.masters:
+        return True
+      if not self.is_alive(instance):
+        command = ' '.join([
+          cmd.SSH_HEADER.format(password=instance.password),
+          cmd.SSH_MASTER.format(
+            ssh_opts=self.ssh_options(instance),
+            username=instance.username, host=instance.host)
+          ])
+        logger.info(command)
+        # a failed master isn't fatal; commands fall back to ControlMaster=auto
+        if subprocess.call(command, shell=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
+          logger.error('Failed to open master connection to {}'.format(instance))
+          return False
+      self.masters.add(str(instance))
+      return True
+
+  def close(self, instance):
+    """Ask the master connection to `instance` to exit
+
+    Parameters
+    ----------
+    instance : instance.Instance
+      Instance of remote device
+    """
+    command = cmd.SSH_CONTROL.format(
+        ssh_opts=self.ssh_options(instance), operation='exit',
+        username=instance.username, host=instance.host)
+    subprocess.call(command, shell=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with self.lock:
+      self.masters.discard(str(instance))
+
+  def semaphore(self, instance):
+    """Get session semaphore of `instance`"""
+    with self.lock:
+      if str(instance) not in self.semaphores:
+        self.semaphores[str(instance)] = threading.BoundedSemaphore(self.max_sessions)
+      return self.semaphores[str(instance)]
+
+  @contextmanager
+  def session(self, instance):
+    """Hold one of `instance`'s sessions while the block executes
+
+    Opens the master connection on first use.
+
+    Parameters
+    ----------
+    instance : instance.Instance
+      Instance of remote device
+    """
+    self.open(instance)
+    with self.semaphore(instance):
+      yield
+
+
+# connection manager shared by the whole process
+manager = ConnectionManager()
+
+
+def ssh_options(instance=None, multiplex=True):
+  """Build ssh options for `instance` using the shared manager"""
+  return manager.ssh_options(instance, multiplex=multiplex)
+
+
+def session(instance):
+  """Hold a session of `instance` using the shared manager"""
+  return manager.session(instance)
@@ -0,0 +1,278 @@
+"""fetch.py
+
+A download manager that runs in the remote machine (`re data`).
+It is uploaded next to the agent (`$HOME/.recompute/`) and run by python3.
+
+  python3 fetch.py --dir data/ --jobs 4 URL[#sha256=HEX] ...
+
+* URLs are fetched concurrently, `--jobs` at a time
+* large files (`--segment-size` and up) are fetched in `--segments` byte ranges at once,
+  where the server accepts range requests
+* an interrupted download resumes from its `.part` file (fetched in a single stream)
+* a checksum in the fragment of a URL (`#sha256=..`, `#md5=..`, any `hashlib` algorithm) is verified
+* every file fetched is recorded in a manifest (`--dir`/.manifest.json : url, size, sha256);
+  files in the manifest are not fetched again
+* with `--cas`, files are kept in a content-addressed store shared by projects (`<cas>/<sha256>`)
+  and hardlinked into `--dir`; a URL whose content is in the store (by checksum, or fetched before
+  by any project : `<cas>/urls.json`) is linked rather than fetched
+
+A line is printed for every URL : status (ok/skip/link/fail), name, size, seconds.
+The exit code is the number of URLs that failed.
+
+NOTE : this file is executed by the remote python3. It must depend on nothing but the standard library.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib.request
+import urllib.parse
+import argparse
+import threading
+import hashlib
+import shutil
+import json
+import time
+import sys
+import os
+
+# manifest of files fetched, in download directory
+MANIFEST = '.manifest.json'
+# index of URLs fetched into content-addressed store { url : sha256 }
+CAS_URLS = 'urls.json'
+# bytes read at a time
+BLOCK_SIZE = 1 << 20
+# files this large (bytes) are fetched in segments
+SEGMENT_SIZE = 64 << 20
+# number of segments fetched at once, per file
+SEGMENTS = 4
+# seconds to wait for a server
+TIMEOUT = 60
+
+# guards the manifest
+lock = threading.Lock()
+
+
+def parse_url(url):
+  """Split checksum off `url`
+
+  Returns
+  -------
+  tuple
+    (url, name of file, (algorithm, hex digest) or None)
+  """
+  url, _, fragment = url.partition('#')
+  checksum = None
+  if '=' in fragment:
+    algorithm, _, digest = fragment.partition('=')
+    if algorithm.lower() in hashlib.algorithms_available:
+      checksum = (algorithm.lower(), digest.lower())
+  name = os.path.basename(urllib.parse.unquote(urllib.parse.urlparse(url).path)) or 'index.html'
+  return url, name, checksum
+
+
+def file_digest(path, algorithm='sha256'):
+  """Hex digest of file `path`"""
+  digest = hashlib.new(algorithm)
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def probe(url):
+  """Size of resource `url` and whether the server serves byte ranges
+
+  Returns
+  -------
+  tuple
+    (size or None, accepts ranges)
+  """
+  request = urllib.request.Request(url, headers={ 'Range' : 'bytes=0-0' })
+  with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+    if response.status == 206:  # Content-Range: bytes 0-0/size
+      total = response.headers.get('Content-Range', '').rpartition('/')[-1]
+      return (int(total) if total.isdigit() else None), True
+    length = response.headers.get('Content-Length')
+    return (int(length) if length else None), False
+
+
+def copy(response, f, length=None):
+  """Copy `response` into file `f` (at its position); up to `length` bytes"""
+  while length is None or length > 0:
+    block = response.read(BLOCK_SIZE if length is None else min(BLOCK_SIZE, length))
+    if not block:
+      break
+    f.write(block)
+    if length is not None:
+      length -= len(block)
+  if length:
+    raise IOError('Connection closed; {} bytes short'.format(length))
+
+
+def fetch_range(url, path, start, end):
+  """Fetch bytes [`start`, `end`] of `url` into file `path`, at `start`"""
+  request = urllib.request.Request(url, headers={ 'Range' : 'bytes={}-{}'.format(start, end) })
+  with urllib.request.urlopen(request, timeout=TIMEOUT) as response, open(path, 'r+b') as f:
+    if response.status != 206:
+      raise IOError('Range request ignored by server')
+    f.seek(start)
+    copy(response, f, end - start + 1)
+
+
+def fetch_stream(url, path, ranges):
+  """Fetch `url` into file `path`; resume from the size of `path` if the server serves ranges"""
+  offset = os.path.getsize(path) if ranges and os.path.exists(path) else 0
+  headers = { 'Range' : 'bytes={}-'.format(offset) } if offset else {}
+  request = urllib.request.Request(url, headers=headers)
+  with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+    if offset and response.status != 206:  # served from the start
+      offset = 0
+    with open(path, 'ab' if offset else 'wb') as f:
+      copy(response, f)
+
+
+def link(src, dst):
+  """Hardlink `src` to `dst`, in place of `dst` if it exists"""
+  tmp = dst + '.link'
+  if os.path.exists(tmp):
+    os.remove(tmp)
+  os.link(src, tmp)
+  os.rename(tmp, dst)
+
+
+def record(dir_, manifest, name, url, path, sha256):
+  """Record file `name` in manifest"""
+  with lock:
+    manifest[name] = { 'url' : url, 'size' : os.path.getsize(path), 'sha256' : sha256,
+        'time' : time.time() }
+    write_manifest(dir_, manifest)
+
+
+def fetch(url, dir_, manifest, segments=SEGMENTS, segment_size=SEGMENT_SIZE, cas=None):
+  """Fetch `url` into directory `dir_`
+
+  Returns
+  -------
+  tuple
+    (status, name, size) status is one of ok/skip/link/fail
+  """
+  url, name, checksum = parse_url(url)
+  path = os.path.join(dir_, name)
+  # fetched already?
+  entry = manifest.get(name)
+  if entry and entry['url'] == url and os.path.exists(path) \
+      and os.path.getsize(path) == entry['size'] \
+      and (not checksum or checksum[0] != 'sha256' or checksum[1] == entry['sha256']):
+    return 'skip', name, entry['size']
+  # in store?
+  if cas:
+    known = checksum[1] if checksum and checksum[0] == 'sha256' else read_json(cas, CAS_URLS).get(url)
+    if known and os.path.exists(os.path.join(cas, known)):
+      link(os.path.join(cas, known), path)
+      record(dir_, manifest, name, url, path, known)
+      return 'link', name, manifest[name]['size']
+  part = path + '.part'
+  size, ranges = probe(url)
+  # . fetch into .part file
+  # .. in segments, if large and the server serves ranges
+  if ranges and size and size >= segment_size and segments > 1:
+    with open(part, 'wb') as f:
+      f.truncate(size)
+    bounds = [ size * i // segments for i in range(segments + 1) ]
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+      for future in [ pool.submit(fetch_range, url, part, bounds[i], bounds[i + 1] - 1)
+          for i in range(segments) ]:
+        future.result()
+  else:
+    fetch_stream(url, part, ranges)
+  if size is not None and os.path.getsize(part) != size:
+    raise IOError('Expected {} bytes, got {}'.format(size, os.path.getsize(part)))
+  sha256 = file_digest(part)
+  if checksum:
+    digest = sha256 if checksum[0] == 'sha256' else file_digest(part, checksum[0])
+    if digest != checksum[1]:
+      os.remove(part)
+      raise IOError('{} mismatch : expected {}, got {}'.format(checksum[0], checksum[1], digest))
+  os.rename(part, path)
+  if cas:
+    deposit(cas, url, path, sha256)
+  record(dir_, manifest, name, url, path, sha256)
+  return 'ok', name, manifest[name]['size']
+
+
+def deposit(cas, url, path, sha256):
+  """Keep file `path` in store `cas`; a copy in store already takes its place"""
+  stored = os.path.join(cas, sha256)
+  try:
+    if os.path.exists(stored):
+      link(stored, path)
+    else:
+      os.link(path, stored)
+  except OSError as e:  # another file system
+    print('cas {} : {}'.format(path, e), file=sys.stderr)
+    return
+  with lock:
+    urls = read_json(cas, CAS_URLS)
+    urls[url] = sha256
+    write_json(cas, CAS_URLS, urls)
+
+
+def read_json(dir_, name):
+  path = os.path.join(dir_, name)
+  if not os.path.exists(path):
+    return {}
+  try:
+    return json.load(open(path))
+  except ValueError:
+    return {}
+
+
+def write_json(dir_, name, data):
+  path = os.path.join(dir_, name)
+  tmp = '{}.{}.tmp'.format(path, os.getpid())
+  with open(tmp, 'w') as f:
+    json.dump(data, f, indent=1, sort_keys=True)
+  shutil.move(tmp, path)
+
+
+def read_manifest(dir_):
+  return read_json(dir_, MANIFEST)
+
+
+def write_manifest(dir_, manifest):
+  write_json(dir_, MANIFEST, manifest)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Fetch URLs into a directory')
+  parser.add_argument('urls', nargs='+', help='URLs; "URL#sha256=HEX" to verify')
+  parser.add_argument('--dir', default='.', help='download directory')
+  parser.add_argument('--jobs', type=int, default=4, help='number of URLs fetched at once')
+  parser.add_argument('--segments', type=int, default=SEGMENTS,
+      help='number of segments of a large file fetched at once')
+  parser.add_argument('--segment-size', type=int, default=SEGMENT_SIZE,
+      help='files this large (bytes) are fetched in segments')
+  parser.add_argument('--cas', default=None, help='content-addressed store shared by projects')
+  args = parser.parse_args(argv)
+  for dir_ in [ args.dir, args.cas ]:
+    if dir_ and not os.path.exists(dir_):
+      os.makedirs(dir_)
+  manifest = read_manifest(args.dir)
+
+  def run(url):
+    start = time.time()
+    try:
+      status, name, size = fetch(url, args.dir, manifest, args.segments, args.segment_size,
+          args.cas)
+    except Exception as e:
+      status, name, size = 'fail', parse_url(url)[1], str(e)
+    print('{} {} {} {:.1f}s'.format(status, name, size, time.time() - start), flush=True)
+    return status
+
+  with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+    statuses = list(pool.map(run, args.urls))
+  return statuses.count('fail')
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,256 @@
+"""imports.py
+
+Resolves pypi package requirements of local python files, without leaving the process.
+
+* files are parsed with `ast`, across a pool of processes; top-level names of absolute imports are collected
+* import sets are cached per file content (sha1) in `.recompute/imports.cache`; unchanged files aren't parsed again
+* standard library modules and local modules (files and packages in the repository) are dropped
+* the rest are mapped to distributions (and versions) installed in the local environment;
+  no network is necessary
+
+Python 3.10 lists standard library modules (`sys.stdlib_module_names`) and maps modules to
+distributions (`importlib.metadata.packages_distributions`); older pythons (3.8+) get both by
+looking at the standard library directory and at the files of distributions.
+
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import importlib.metadata
+import sysconfig
+import inspect
+import hashlib
+import warnings
+import pickle
+import ast
+import sys
+import re
+import os
+
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# import cache
+IMPORTS_CACHE = '.recompute/imports.cache'
+# files parsed in a process pool only beyond this count
+POOL_THRESHOLD = 64
+# fallback for files `ast` can't parse (python 2 sources)
+IMPORT_LINE = re.compile(rb'^\s*(?:from\s+([A-Za-z_]\w*)[\w.]*\s+import|import\s+([A-Za-z_][\w., \t]*))', re.M)
+# modules whose distribution name differs, when not installed locally
+ALIASES = {
+    'cv2' : 'opencv-python',
+    'PIL' : 'Pillow',
+    'sklearn' : 'scikit-learn',
+    'skimage' : 'scikit-image',
+    'yaml' : 'PyYAML',
+    'bs4' : 'beautifulsoup4',
+    'dateutil' : 'python-dateutil'
+    }
+
+
+def scan(source):
+  """Top-level modules imported in python `source`
+
+  Parameters
+  ----------
+  source : bytes
+    Contents of a python file
+
+  Returns
+  -------
+  set
+    Names of top-level modules; relative imports are left out
+  """
+  try:
+    with warnings.catch_warnings():  # invalid escape sequences ..
+      warnings.simplefilter('ignore')
+      tree = ast.parse(source)
+  except (SyntaxError, ValueError):
+    modules = set()
+    for from_, import_ in IMPORT_LINE.findall(source):
+      if from_:
+        modules.add(from_.decode('utf-8'))
+      else:
+        modules.update(name.split()[0].split(b'.')[0].decode('utf-8')
+            for name in import_.split(b',') if name.strip())
+    return modules
+  modules = set()
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Import):
+      modules.update(alias.name.split('.')[0] for alias in node.names)
+    elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+      modules.add(node.module.split('.')[0])
+  return modules
+
+
+def scan_file(path):
+  """Digest of file `path` and modules imported in it
+
+  Returns
+  -------
+  tuple
+    (sha1 of contents, set of modules)
+  """
+  source = open(path, 'rb').read()
+  return hashlib.sha1(source).hexdigest(), scan(source)
+
+
+def local_modules(paths):
+  """Modules that resolve to files in the repository
+
+  Every file is importable from its own directory (scripts),
+  and every directory along a path is a package.
+  """
+  modules = set()
+  for path in paths:
+    parts = os.path.normpath(path).split(os.sep)
+    modules.update(part for part in parts[:-1] if part != '.')
+    modules.add(os.path.splitext(parts[-1])[0])
+  return modules
+
+
+def stdlib_modules():
+  """Names of standard library modules"""
+  if hasattr(sys, 'stdlib_module_names'):  # python 3.10+
+    return set(sys.stdlib_module_names) | set(sys.builtin_module_names)
+  stdlib = sysconfig.get_paths()['stdlib']
+  modules = set(sys.builtin_module_names)
+  for dir_ in [ stdlib, os.path.join(stdlib, 'lib-dynload') ]:
+    for name in os.listdir(dir_) if os.path.isdir(dir_) else []:
+      if os.path.isdir(os.path.join(dir_, name)):
+        if name not in [ 'site-packages', 'dist-packages', '__pycache__' ] and name.isidentifier():
+          modules.add(name)
+      elif inspect.getmodulename(name):
+        modules.add(inspect.getmodulename(name))
+  return modules
+
+
+def packages_distributions():
+  """Top-level modules of distributions installed
+
+  Returns
+  -------
+  dict
+    { module : [ distribution ] }
+  """
+  if hasattr(importlib.metadata, 'packages_distributions'):  # python 3.10+
+    return importlib.metadata.packages_distributions()
+  distributions = {}
+  for distribution in importlib.metadata.distributions():
+    # declared in top_level.txt, or else inferred from files of distribution
+    modules = (distribution.read_text('top_level.txt') or '').split() or [
+        path.parts[0] if len(path.parts) > 1 else inspect.getmodulename(str(path))
+        for path in distribution.files or [] ]
+    for module in set(module for module in modules if module):
+      distributions.setdefault(module, []).append(distribution.metadata['Name'])
+  return distributions
+
+
+def resolve(modules):
+  """Map top-level `modules` to requirements
+
+  Parameters
+  ----------
+  modules : set
+    Names of third-party modules
+
+  Returns
+  -------
+  list
+    Sorted requirements of form "distribution==version"
+  """
+  distributions = packages_distributions()
+  requirements = set()
+  for module in modules:
+    if module not in distributions:
+      logger.error('Import named [{}] not found locally'.format(module))
+      requirements.add(ALIASES.get(module, module))
+      continue
+    for distribution in distributions[module]:
+      requirements.add('{}=={}'.format(distribution, importlib.metadata.version(distribution)))
+  return sorted(requirements, key=str.lower)
+
+
+class ImportScanner(object):
+  """ImportScanner resolves requirements of local python files"""
+
+  def __init__(self, path=IMPORTS_CACHE):
+    """
+    Parameters
+    ----------
+    path : str, optional
+      Path to import cache (default IMPORTS_CACHE)
+    """
+    self.path = path
+    # files   : { path : digest }
+    # imports : { digest : set of modules }
+    self.files, self.imports = {}, {}
+    if os.path.exists(path):
+      try:
+        cache = pickle.load(open(path, 'rb'))
+        self.files, self.imports = cache['files'], cache['imports']
+      except (EOFError, pickle.UnpicklingError, KeyError):
+        logger.error('Import cache is corrupt; rebuild')
+
+  def save(self):
+    """Write cache to disk"""
+    pickle.dump({ 'files' : self.files, 'imports' : self.imports }, open(self.path, 'wb'))
+
+  def update(self, paths, changed=None):
+    """Parse files in `paths` that are new or `changed`
+
+    Parameters
+    ----------
+    paths : list
+      Paths to python files
+    changed : set, optional
+      Paths modified since the last update; every path when `None` (default None)
+    """
+    # . hash new and changed files
+    # .. parse contents not seen before, in a pool
+    stale = [ path for path in paths
+        if changed is None or path in changed or path not in self.files ]
+    for path in stale:
+      self.files[path] = hashlib.sha1(open(path, 'rb').read()).hexdigest()
+    unseen = [ path for path in stale if self.files[path] not in self.imports ]
+    if len(unseen) > POOL_THRESHOLD:
+      with ProcessPoolExecutor() as pool:
+        results = list(pool.map(scan_file, unseen, chunksize=32))
+    else:
+      results = [ scan_file(path) for path in unseen ]
+    for path, (digest, modules) in zip(unseen, results):
+      self.files[path] = digest
+      self.imports[digest] = modules
+    logger.info('{} files parsed'.format(len(unseen)))
+    # drop files that are gone
+    paths = set(paths)
+    self.files = { path : digest for path, digest in self.files.items() if path in paths }
+    digests = set(self.files.values())
+    self.imports = { digest : modules for digest, modules in self.imports.items()
+        if digest in digests }
+    self.save()
+
+  def requirements(self, paths, changed=None):
+    """Resolve requirements of python files in `paths`
+
+    Parameters
+    ----------
+    paths : list
+      Paths to python files
+    changed : set, optional
+      Paths modified since the last scan (default None)
+
+    Returns
+    -------
+    list
+      Sorted requirements of form "distribution==version"
+    """
+    self.update(paths, changed)
+    modules = set()
+    for path in paths:
+      modules.update(self.imports[self.files[path]])
+    # drop standard library and local modules
+    modules -= stdlib_modules()
+    modules -= local_modules(paths)
+    return resolve(modules)
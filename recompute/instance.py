@@ -1,17 +1,22 @@
 """instance.py
 
 We model (`username`, `host`, `password`) as an "instance".
+An instance is reached through a transport ("ssh" by default, see `transport.py`).
 `Instance` class holds username, host and password information.
 It can be saved to and read from the global configuration file.
 `InstanceManager` class reads instances from the configuration file by interacting with `ConfigManager`.
 
 """
 from recompute import process
+from recompute import channel
+from recompute import sampler
 from recompute import cmd
+from recompute import transport
 from recompute import utils
 
 import logging
 
+import asyncio
 import pickle
 import os
 
@@ -19,12 +24,14 @@ import os
 logger = utils.get_logger(__name__)
 # table cache
 PROBE_CACHE = '.recompute/table'
+# jobs of a project an instance runs at once, unless its config section says otherwise (`max_jobs`)
+MAX_JOBS = 1
 
 
 class Instance(object):
   """Instance is a container for (`username`, `password`, `host`)."""
 
-  def __init__(self, username=None, password=None, host=None):
+  def __init__(self, username=None, password=None, host=None, transport='ssh', max_jobs=None):
     """
     Parameters
     ----------
@@ -34,10 +41,17 @@ class Instance(object):
       Password to log in to remote machine (default None)
     host : str, optional
       IP address or host name of remote machine (default None)
+      For "loopback" transport, a local directory that acts as remote $HOME
+    transport : str, optional
+      Name of transport, see `transport.TRANSPORTS` (default 'ssh')
+    max_jobs : int, optional
+      Number of jobs the scheduler runs at once in the instance (default None : MAX_JOBS)
     """
     self.username = username
     self.password = password
     self.host = host
+    self.transport = transport
+    self.max_jobs = max_jobs
 
   def resolve_str(self, loginstr):
     """Create Instance object from string of type "username@host"
@@ -75,6 +89,8 @@ class Instance(object):
     self.username = conf['username']
     self.password = conf['password']
     self.host = conf['host']
+    self.transport = conf.get('transport', 'ssh')
+    self.max_jobs = int(conf['max_jobs']) if conf.get('max_jobs') else None
     return self
 
   def __repr__(self):
@@ -99,7 +115,8 @@ class Instance(object):
     """
     return self.username == other.username and \
         self.password == other.password and \
-        self.host == other.host
+        self.host == other.host and \
+        getattr(self, 'transport', 'ssh') == getattr(other, 'transport', 'ssh')
 
 
 class InstanceManager(object):
@@ -143,10 +160,22 @@ class InstanceManager(object):
     bool
       `True` if instance is active, `False` otherwise
     """
-    return not process.fetch_stderr( ' '.join([
-      cmd.SSH_HEADER.format(password=instance.password),
-      cmd.SSH_TEST.format(username=instance.username, host=instance.host)
-      ]))
+    return transport.get(instance).is_active()
+
+  async def is_active_async(self, instance):
+    """Is an instance active? Test without blocking the event loop
+
+    Parameters
+    ----------
+    instance : instance.Instance
+      An Instance object
+
+    Returns
+    -------
+    bool
+      `True` if instance is active, `False` otherwise
+    """
+    return await transport.get(instance).is_active_async()
 
   def get(self, idx=None):
     """Find instance section from config file.
@@ -168,7 +197,7 @@ class InstanceManager(object):
     # make sure the instance exists in config
     assert instance, 'Instance inactive or absent in config'
     # return an instance
-    return Instance(instance['username'], instance['password'], instance['host'])
+    return Instance().resolve_conf(instance)
 
   def get_all(self):
     """Return a list of instances from config file.
@@ -195,8 +224,21 @@ class InstanceManager(object):
     list
       A list of active Instance objects read from config
     """
-    return [ instance for instance in self.get_all()
-        if self.is_active(instance) ]
+    return process.run(self.get_active_async())
+
+  async def get_active_async(self):
+    """Return a list of active instances, tested concurrently
+
+    Returns
+    -------
+    list
+      A list of active Instance objects read from config
+    """
+    instances = self.get_all()
+    active = await asyncio.gather(*[ self.is_active_async(instance)
+      for instance in instances ])
+    return [ instance for instance, is_active in zip(instances, active)
+        if is_active ]
 
   def fetch(self):
     """Fetch an active instance by reading config file
@@ -232,32 +274,100 @@ class InstanceManager(object):
       return utils.tabulate_instances(pickle.load(open(PROBE_CACHE, 'rb')))
 
     # init dictionary of instances
-    instances = {}
-    # get active instances
-    for instance in self.get_active():
-      # init row
-      instances[str(instance)] = [ str(instance), 'active', '-', '-' ]
-      logger.info(instance)
-      try:
-        # gather info from remote machines
-        # TODO : execute them in one session
-        free_gpu_memory = int(
-            process.remote_execute(cmd.GPU_FREE_MEMORY, instance)[-1]
-            )
-        logger.info('FREE GPU')
-        logger.info(free_gpu_memory)
-        free_disk_space = utils.parse_free_results(
-            process.remote_execute(cmd.DISK_FREE_MEMORY, instance)[-1]
-            )
-        logger.info('FREE DISK')
-        logger.info(free_disk_space)
-        # update dictionary
-        instances[str(instance)][2] = free_gpu_memory
-        instances[str(instance)][3] = free_disk_space
-      except ValueError:
-        # something wrong? -> blame the host..
-        instances[str(instance)][1] = 'active'
-        continue
+    instances = { row[0] : row for row in process.run(self.probe_async()) }
     # cache table
     pickle.dump(instances, open(PROBE_CACHE, 'wb'))
     return utils.tabulate_instances(instances)
+
+  async def probe_async(self):
+    """Probe all the active instances concurrently
+
+    Returns
+    -------
+    list
+      A list of rows [ instance, status, free GPU memory, free disk space ]
+    """
+    return await asyncio.gather(*[ self.probe_instance(instance)
+      for instance in await self.get_active_async() ])
+
+  async def probe_instance(self, instance):
+    """Probe an instance for free GPU memory and free disk space
+
+    Parameters
+    ----------
+    instance : instance.Instance
+      An active Instance object
+
+    Returns
+    -------
+    list
+      [ instance, status, free GPU memory, free disk space ]
+    """
+    # init row
+    row = [ str(instance), 'active', '-', '-' ]
+    logger.info(instance)
+    # gather info from remote machine in one session
+    (_, gpu_output, _), (_, disk_output, _) = await transport.get(instance).execute_batch_async(
+        [ cmd.GPU_FREE_MEMORY, cmd.DISK_FREE_MEMORY ])
+    try:
+      row[2] = int(gpu_output)
+      logger.info('FREE GPU')
+      logger.info(row[2])
+    except ValueError:  # no GPU? -> blame the host..
+      pass
+    try:
+      row[3] = utils.parse_free_results(disk_output)
+      logger.info('FREE DISK')
+      logger.info(row[3])
+    except (ValueError, IndexError, AssertionError):
+      pass
+    return row
+
+  def top(self):
+    """Latest resource usage of jobs in all the active instances
+
+    Returns
+    -------
+    prettytable.PrettyTable
+      A table of CPU, RSS, I/O and GPU usage of jobs
+    """
+    rows = process.run(self.top_async())
+    return utils.tabulate_top([ row for rows_ in rows for row in rows_ ])
+
+  async def top_async(self):
+    """Read latest samples of jobs in all the active instances, concurrently
+
+    Returns
+    -------
+    list
+      A list of rows per instance
+    """
+    return await asyncio.gather(*[ self.top_instance(instance)
+      for instance in await self.get_active_async() ])
+
+  async def top_instance(self, instance):
+    """Read latest samples of jobs in an instance, in one round trip
+
+    Parameters
+    ----------
+    instance : instance.Instance
+      An active Instance object
+
+    Returns
+    -------
+    list
+      [ [ instance, job, processes, CPU %, RSS, read/s, write/s, GPU memory, GPU %, age ] ]
+    """
+    transport_ = transport.get(instance)
+    read = transport_.make_cmd(cmd.make_sampler_read(channel.agent_path(sampler), sampler.SAMPLES_DIR))
+    # . read samples
+    # .. no sampler in remote (older version, or no jobs yet)? upload it and read again
+    for attempt in range(2):
+      _, output = await transport_.run_cmd_async(read)
+      try:
+        return [ (str(instance),) + row for row in utils.parse_samples(output) ]
+      except (ValueError, KeyError, TypeError):
+        if attempt or not await channel.upload_async(transport_, sampler):
+          break
+    logger.error('Failed to read samples from {} : {}'.format(instance, output))
+    return [ (str(instance), 'sampler unavailable') + ('-',) * 8 ]
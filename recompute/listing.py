@@ -0,0 +1,152 @@
+"""listing.py
+
+Listing of the remote project tree (`re ls`, `re stat`, `re du`).
+
+* the whole tree of remote project (`data/` included) is listed by a single `find -printf` in remote machine
+* the listing is cached locally (`.recompute/listing`) for `LISTING_TTL` seconds
+* pushes and runs (anything that writes to remote project) drop the cache
+
+Queries are served from the cached listing, without a round trip.
+
+"""
+import pickle
+import time
+import os
+
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# local cache of remote listing
+LISTING = '.recompute/listing'
+# cached listing is valid for `LISTING_TTL` seconds
+LISTING_TTL = 60
+
+
+def normalize(path):
+  """'./a/b/' -> 'a/b'; '' -> '.'"""
+  return os.path.normpath(path.strip() or '.')
+
+
+def parse(output):
+  """Parse output of `cmd.LIST_TREE`
+
+  Returns
+  -------
+  dict
+    { path : (kind, size, mtime) } kind is one of f (file)/d (directory)/l (link)
+  """
+  entries = {}
+  for line in (output or '').splitlines():
+    fields = line.split(' ', 3)
+    if len(fields) != 4 or not fields[1].isdigit() or not fields[3]:
+      continue
+    kind, size, mtime, path = fields
+    entries[normalize(path)] = (kind, int(size), float(mtime))
+  return entries
+
+
+class Listing(object):
+  """Listing of remote project tree"""
+
+  def __init__(self, entries=None, time_=None):
+    """
+    Parameters
+    ----------
+    entries : dict, optional
+      { path : (kind, size, mtime) } (default None)
+    time_ : float, optional
+      Time of listing (default None : now)
+    """
+    self.entries = entries if entries else {}
+    self.time = time_ if time_ else time.time()
+    # { directory : [ size, files ] } of files under directories; on demand
+    self.totals = None
+
+  @classmethod
+  def load(cls, path=LISTING, ttl=LISTING_TTL):
+    """Read cached listing; `None` if there is none or it is older than `ttl` seconds"""
+    if not os.path.exists(path):
+      return
+    cache = pickle.load(open(path, 'rb'))
+    if time.time() - cache['time'] > ttl:
+      logger.info('Listing expired')
+      return
+    return cls(cache['entries'], cache['time'])
+
+  def save(self, path=LISTING):
+    pickle.dump({ 'entries' : self.entries, 'time' : self.time }, open(path, 'wb'))
+
+  @staticmethod
+  def invalidate(path=LISTING):
+    """Drop cached listing"""
+    if os.path.exists(path):
+      os.remove(path)
+
+  def total(self, path):
+    """(size, number) of files under directory `path`, at any depth"""
+    if self.totals is None:
+      # add every file to the directories along its path
+      self.totals = {}
+      for p, (kind, size, _) in self.entries.items():
+        while kind == 'f' and p != '.':
+          p = os.path.dirname(p) or '.'
+          total = self.totals.setdefault(p, [ 0, 0 ])
+          total[0], total[1] = total[0] + size, total[1] + 1
+    return tuple(self.totals.get(normalize(path), (0, 0)))
+
+  def stat(self, path):
+    """Stat `path`
+
+    Returns
+    -------
+    tuple
+      (kind, size, mtime, files) size of a directory is the size of files under it;
+      `None` if there is no such path
+    """
+    path = normalize(path)
+    entry = self.entries.get(path)
+    if path == '.':
+      entry = ('d', 0, max([ mtime for _, _, mtime in self.entries.values() ] or [ self.time ]))
+    if entry is None:
+      return
+    kind, size, mtime = entry
+    if kind != 'd':
+      return kind, size, mtime, 1
+    size, files = self.total(path)
+    return kind, size, mtime, files
+
+  def ls(self, path='.'):
+    """List directory `path` (a file lists itself)
+
+    Returns
+    -------
+    list
+      [ (path, kind, size, mtime, files) ]; `None` if there is no such path
+    """
+    path = normalize(path)
+    st = self.stat(path)
+    if st is None:
+      return
+    if st[0] != 'd':
+      return [ (path,) + st ]
+    children = [ p for p in self.entries if (os.path.dirname(p) or '.') == path ]
+    return [ (p,) + self.stat(p) for p in sorted(children) ]
+
+  def du(self, path='.'):
+    """Disk usage of directory `path`, by child; the last row is `path` itself
+
+    Returns
+    -------
+    list
+      [ (path, size, files) ] children by size, largest first; `None` if there is no such path
+    """
+    st = self.stat(path)
+    if st is None:
+      return
+    if st[0] != 'd':
+      return [ (normalize(path), st[1], st[3]) ]
+    rows = self.ls(path)
+    rows = sorted([ (p, size, files) for p, _, size, _, files in rows ], key=lambda r: -r[1])
+    return rows + [ (normalize(path), st[1], st[3]) ]
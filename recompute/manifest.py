@@ -0,0 +1,167 @@
+"""manifest.py
+
+Manifest is a Merkle tree of the files in bundle (`.recompute/rsync.db`).
+
+* every file is hashed (sha1 of contents); a file is hashed again only if its (size, mtime, inode) changed
+* every directory is hashed over the names and hashes of its children; the hash of `.` is the root
+* the manifest is kept in `.recompute/manifest` (JSON) and mirrored to the remote after each push
+
+Two manifests with the same root describe the same files; otherwise a diff compares
+only the files in directories whose hashes differ.
+
+"""
+import hashlib
+import json
+import os
+
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# local manifest
+MANIFEST = '.recompute/manifest'
+
+
+def normalize(path):
+  """'./a/b.py' -> 'a/b.py'"""
+  return os.path.normpath(path.strip())
+
+
+def hash_file(path):
+  """sha1 of contents of file `path`"""
+  digest = hashlib.sha1()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def hash_tree(files):
+  """Hash directories over their children
+
+  Parameters
+  ----------
+  files : dict
+    { path : hash } of files
+
+  Returns
+  -------
+  dict
+    { directory : hash }; '.' is the root
+  """
+  children = {}
+  for path, digest in files.items():
+    # register the file and every directory along its path
+    child, parent = path, os.path.dirname(path) or '.'
+    children.setdefault(parent, {})[child] = ('f', digest)
+    while parent != '.':
+      child, parent = parent, os.path.dirname(parent) or '.'
+      children.setdefault(parent, {}).setdefault(child, ('d', None))
+  dirs = {}
+  # deepest directories first; a directory is hashed after its children
+  for dir_ in sorted(children, key=lambda d: -1 if d == '.' else d.count('/'), reverse=True):
+    digest = hashlib.sha1()
+    for child, (kind, child_digest) in sorted(children[dir_].items()):
+      digest.update('{} {} {}\n'.format(kind, os.path.basename(child),
+        child_digest if kind == 'f' else dirs[child]).encode('utf-8'))
+    dirs[dir_] = digest.hexdigest()
+  if not dirs:
+    dirs['.'] = hashlib.sha1().hexdigest()
+  return dirs
+
+
+class Manifest(object):
+  """Manifest of files in bundle"""
+
+  def __init__(self, files=None, dirs=None, stats=None):
+    """
+    Parameters
+    ----------
+    files : dict, optional
+      { path : hash } of files (default None)
+    dirs : dict, optional
+      { directory : hash } (default None)
+    stats : dict, optional
+      { path : (size, mtime, inode) } of files when hashed (default None)
+    """
+    self.files = files if files else {}
+    self.dirs = dirs if dirs else hash_tree(self.files)
+    self.stats = stats if stats else {}
+
+  @property
+  def root(self):
+    return self.dirs['.']
+
+  @classmethod
+  def loads(cls, text):
+    """Manifest from JSON `text`; `None` if `text` is not a manifest"""
+    try:
+      data = json.loads(text)
+      return cls(data['files'], data['dirs'],
+          { path : tuple(stat) for path, stat in data.get('stats', {}).items() })
+    except (ValueError, KeyError, TypeError):
+      return
+
+  @classmethod
+  def load(cls, path=MANIFEST):
+    """Read manifest from file `path`; an empty manifest if there is none"""
+    manifest = cls.loads(open(path).read()) if os.path.exists(path) else None
+    return manifest if manifest else cls()
+
+  def save(self, path=MANIFEST):
+    """Write manifest (JSON) to file `path`"""
+    with open(path, 'w') as f:
+      json.dump({ 'root' : self.root, 'files' : self.files, 'dirs' : self.dirs,
+        'stats' : self.stats }, f, sort_keys=True)
+
+  def update(self, paths):
+    """Manifest of files in `paths`; files whose stat is unchanged keep their hash
+
+    Parameters
+    ----------
+    paths : list
+      Paths to files (relative to current directory)
+
+    Returns
+    -------
+    Manifest
+      A new manifest
+    """
+    files, stats = {}, {}
+    for path in set(normalize(path) for path in paths if path.strip()):
+      if not os.path.isfile(path):
+        continue
+      st = os.stat(path)
+      stats[path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+      files[path] = self.files[path] if self.stats.get(path) == stats[path] \
+          else hash_file(path)
+    return Manifest(files, hash_tree(files), stats)
+
+  def diff(self, other):
+    """Files that differ between `self` (local) and `other` (remote)
+
+    Files in directories whose hashes agree are not compared.
+
+    Returns
+    -------
+    tuple
+      (added, modified, removed) lists of paths;
+      added : only in `self`, modified : in both with different contents, removed : only in `other`
+    """
+    added, modified, removed = [], [], []
+    if self.root == other.root:
+      return added, modified, removed
+    # directories of both sides that differ
+    differ = set([ dir_ for dir_ in set(self.dirs) | set(other.dirs)
+      if self.dirs.get(dir_) != other.dirs.get(dir_) ])
+    for path in sorted(set(self.files) | set(other.files)):
+      if (os.path.dirname(path) or '.') not in differ:
+        continue
+      if path not in other.files:
+        added.append(path)
+      elif path not in self.files:
+        removed.append(path)
+      elif self.files[path] != other.files[path]:
+        modified.append(path)
+    return added, modified, removed
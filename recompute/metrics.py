@@ -0,0 +1,215 @@
+"""metrics.py
+
+Metrics are numbers a run writes to its log (loss, epoch, step, throughput ..).
+They are extracted from the log and kept in a columnar store under `.recompute/metrics/`.
+
+Recognized patterns
+
+* `key=value` and `key: value` anywhere in a line (`epoch: 3 loss=0.25 lr=1e-3`)
+* quoted keys, which covers JSON lines (`{"step": 10, "loss": 0.25}`) and python dicts (`{'loss': 0.25}`)
+  numeric fields are metrics; JSON is not decoded line by line
+
+Each metric is a column of two append-only binary files:
+`<key>.lines` (line numbers, int64) and `<key>.values` (float64), read back as NumPy arrays.
+The store remembers how far the log was read; an update parses only the lines appended since.
+A store of a remote log also remembers the remote log it copies, and how far that was read (`source`).
+
+"""
+import pickle
+import re
+import os
+
+import numpy as np
+
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# metrics directory
+METRICS_DIR = '.recompute/metrics'
+# log bytes parsed at a time
+CHUNK_SIZE = 64 * 1024 * 1024
+# a log that starts with different bytes (up to `HEAD_SIZE`) is a new run
+HEAD_SIZE = 4096
+# key=value / key: value / "key": value
+PAIR = re.compile(
+    rb'(?<![\w.])["\']?([A-Za-z_][\w./-]*)["\']?\s*[:=]\s*'
+    rb'([-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)(?![\w.])')
+
+
+def extract(data, first_line=0):
+  """Extract metrics from log `data`
+
+  Matches are found by a single regex scan over the whole chunk;
+  line numbers are resolved and values converted with NumPy, a column at a time.
+
+  Parameters
+  ----------
+  data : bytes
+    Complete lines of a log
+  first_line : int, optional
+    Line number of the first line in `data` (default 0)
+
+  Returns
+  -------
+  dict
+    { key : (line numbers, values) }; arrays sorted by line number
+  """
+  matches = [ (match.start(), match.group(1), match.group(2))
+      for match in PAIR.finditer(data) ]
+  if not matches:
+    return {}
+  starts, keys, values = zip(*matches)
+  # line number of a match : number of newlines before it
+  newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+  lines = np.searchsorted(newlines, np.array(starts, dtype=np.int64)) + first_line
+  values = np.array(values).astype(np.float64)
+  keys = np.array(keys)
+  # split into columns
+  names, inverse = np.unique(keys, return_inverse=True)
+  return { name.decode('utf-8') : (lines[inverse == i], values[inverse == i])
+      for i, name in enumerate(names) }
+
+
+def downsample(values, points):
+  """Reduce `values` to (at most) `points` bucket means"""
+  if len(values) <= points:
+    return values
+  bounds = np.linspace(0, len(values), points + 1).astype(np.int64)
+  return np.add.reduceat(values, bounds[:-1]) / np.diff(bounds)
+
+
+class MetricStore(object):
+  """MetricStore keeps metrics of a log in columns"""
+
+  def __init__(self, name, path=METRICS_DIR):
+    """
+    Parameters
+    ----------
+    name : str
+      Name of log (a directory of its own)
+    path : str, optional
+      Metrics directory (default METRICS_DIR)
+    """
+    self.path = os.path.join(path, name)
+    self.manifest_file = os.path.join(self.path, 'manifest')
+    if not os.path.exists(self.path):
+      os.makedirs(self.path)
+    self.manifest = pickle.load(open(self.manifest_file, 'rb')) \
+        if os.path.exists(self.manifest_file) else self.empty()
+
+  def empty(self):
+    """Manifest of an empty store"""
+    return { 'head' : b'', 'offset' : 0, 'lines' : 0, 'columns' : {},
+        'source' : None, 'source_offset' : 0 }
+
+  def reset(self):
+    """Drop all columns"""
+    for key in self.manifest['columns']:
+      for ext in [ 'lines', 'values' ]:
+        os.remove(self.column_file(key, ext))
+    self.manifest = self.empty()
+
+  def column_file(self, key, ext):
+    # keys may carry '/' (train/loss)
+    return os.path.join(self.path, '{}.{}'.format(key.replace('/', '%'), ext))
+
+  def update(self, logfile, source=None):
+    """Extract metrics from lines appended to `logfile` since the last update
+
+    Parameters
+    ----------
+    logfile : str
+      Path to log file
+    source : tuple, optional
+      (path, offset) Remote log that `logfile` copies, and how far it was read;
+      kept in manifest (default None)
+
+    Returns
+    -------
+    int
+      Number of new values
+    """
+    if not os.path.exists(logfile):
+      return 0
+    size = os.path.getsize(logfile)
+    with open(logfile, 'rb') as f:
+      # a new run : start over
+      head = f.read(len(self.manifest['head']))
+      if head != self.manifest['head'] or size < self.manifest['offset']:
+        logger.info('New log; reset metrics [{}]'.format(self.path))
+        self.reset()
+      f.seek(self.manifest['offset'])
+      count = 0
+      while True:
+        data = f.read(CHUNK_SIZE)
+        # parse complete lines only; the rest waits for the next update
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+          break
+        f.seek(self.manifest['offset'] + len(data))
+        for key, (lines, values) in extract(data, self.manifest['lines']).items():
+          self.append(key, lines, values)
+          count += len(values)
+        if len(self.manifest['head']) < HEAD_SIZE:
+          self.manifest['head'] = (self.manifest['head'] + data)[:HEAD_SIZE]
+        self.manifest['offset'] += len(data)
+        self.manifest['lines'] += data.count(b'\n')
+    if source:
+      self.manifest['source'], self.manifest['source_offset'] = source
+    pickle.dump(self.manifest, open(self.manifest_file, 'wb'))
+    logger.info('{} new values [{}]'.format(count, self.path))
+    return count
+
+  def append(self, key, lines, values):
+    """Append `lines`, `values` to column `key`"""
+    with open(self.column_file(key, 'lines'), 'ab') as f:
+      f.write(lines.astype('<i8').tobytes())
+    with open(self.column_file(key, 'values'), 'ab') as f:
+      f.write(values.astype('<f8').tobytes())
+    self.manifest['columns'][key] = self.manifest['columns'].get(key, 0) + len(values)
+
+  def keys(self):
+    """Names of columns"""
+    return sorted(self.manifest['columns'])
+
+  def column(self, key):
+    """Read column `key`
+
+    Returns
+    -------
+    tuple
+      (line numbers, values) NumPy arrays
+    """
+    return (np.fromfile(self.column_file(key, 'lines'), dtype='<i8'),
+        np.fromfile(self.column_file(key, 'values'), dtype='<f8'))
+
+  def summary(self):
+    """Summary of every column
+
+    Returns
+    -------
+    list
+      [ (key, count, last, min, max, mean) ]
+    """
+    rows = []
+    for key in self.keys():
+      _, values = self.column(key)
+      rows.append((key, len(values), values[-1],
+        np.nanmin(values), np.nanmax(values), np.nanmean(values)))
+    return rows
+
+  def series(self, key, points=20):
+    """Column `key` downsampled to `points` values
+
+    Returns
+    -------
+    tuple
+      (line numbers, values) of buckets; line number of the last line in each bucket
+    """
+    lines, values = self.column(key)
+    if len(values) <= points:
+      return lines, values
+    bounds = np.linspace(0, len(values), points + 1).astype(np.int64)
+    return lines[bounds[1:] - 1], downsample(values, points)
@@ -3,16 +3,31 @@
 A suite of functions to execute commands in local and remote machines,
 and to keep track (manage) of created processes.
 
+Blocking execution is a thin wrapper over an asyncio engine (`execute_async`).
+Coroutines can be gathered to overlap the I/O of several commands.
+The number of commands in flight is bounded globally (`MAX_CONCURRENCY`)
+and per instance (`connection.MAX_SESSIONS`).
+
 """
 import os
 import subprocess
 import logging
 import signal
+import asyncio
+import weakref
+import shlex
+import uuid
+import re
 
 from recompute import cmd
+from recompute import connection
 
 # setup logger
 logger = logging.getLogger(__name__)
+# max number of commands executing concurrently
+MAX_CONCURRENCY = 16
+# semaphores of each event loop
+_semaphores = weakref.WeakKeyDictionary()
 
 
 def is_process_alive(pid):
@@ -50,8 +65,8 @@ def is_remote_process_alive(pid, instance):
       `True` if the process is alive in remote device
       `False` otherwise
   """
-  _, output = remote_execute(cmd.PROCESS_PID_LINUX.format(pid=pid), instance)
-  return str(pid) in output
+  _, output = remote_execute(cmd.PROCESS_ALIVE.format(pid=pid), instance)
+  return output.split() == [ str(pid) ]
 
 
 def kill_process(pids):
@@ -85,6 +100,37 @@ def kill_remote_process(pids, instance):
   return output
 
 
+def make_remote_cmd(template, instance, multiplex=True, **kwargs):
+  """Build an ssh/scp/rsync command for `instance` from `template`
+
+  The command is routed through the instance's master connection.
+
+  Parameters
+  ----------
+  template : str
+    Command template from `cmd` (ex: `cmd.SSH_EXEC`)
+  instance : instance.Instance
+    Instance of remote device
+  multiplex : bool, optional
+    When set to `False`, the command opens a connection of its own (default True)
+  kwargs : dict
+    Other fields of `template`
+
+  Returns
+  -------
+  str
+    Command prefixed with `cmd.SSH_HEADER`
+  """
+  _header = cmd.SSH_HEADER.format(password=instance.password)
+  _body = template.format(
+      username=instance.username,
+      host=instance.host,
+      ssh_opts=connection.ssh_options(instance, multiplex=multiplex),
+      **kwargs
+      )
+  return ' '.join([_header, _body])
+
+
 def fetch_stderr(cmdstr):
   """Fetch STDERR from executing `cmdstr`
 
@@ -110,6 +156,144 @@ def fetch_stderr(cmdstr):
   return stderr.decode('utf-8')
 
 
+def semaphore(key, value):
+  """Get semaphore `key` of the running event loop
+
+  asyncio primitives are bound to an event loop, hence a set per loop.
+
+  Parameters
+  ----------
+  key : str
+    Name of semaphore (ex: "username@host")
+  value : int
+    Initial value of semaphore, if it is created
+
+  Returns
+  -------
+  asyncio.Semaphore
+    Semaphore named `key`
+  """
+  semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+  if key not in semaphores:
+    semaphores[key] = asyncio.Semaphore(value)
+  return semaphores[key]
+
+
+def run(coroutine):
+  """Run `coroutine` to completion and return its result
+
+  Parameters
+  ----------
+  coroutine : coroutine
+    Coroutine to run, ex: `execute_async('ls')`
+  """
+  return asyncio.run(coroutine)
+
+
+def kill_group(pid):
+  """Kill process group led by `pid`; a group that has exited already is let be"""
+  try:
+    os.killpg(pid, signal.SIGKILL)
+  except ProcessLookupError:
+    pass
+
+
+async def execute_async(cmdstr, timeout=None, input=None):
+  """Execute `cmdstr` without blocking the event loop
+
+  The process is killed if `timeout` expires or the coroutine is cancelled.
+
+  Parameters
+  ----------
+  cmdstr : str
+    Command to be executed
+  timeout : float, optional
+    Number of seconds to wait for completion (default None)
+  input : bytes, optional
+    Data fed to STDIN of the process (default None)
+
+  Returns
+  -------
+  pid : int
+    Process id of command executed
+  output : str
+    STDOUT of execution as a string
+
+  Raises
+  ------
+  asyncio.TimeoutError
+    If the process doesn't complete within `timeout` seconds
+  """
+  async with semaphore('*', MAX_CONCURRENCY):
+    # a process group of its own, so that children of the shell die along with it
+    process = await asyncio.create_subprocess_exec('/bin/sh', '-c', cmdstr,
+        stdin=asyncio.subprocess.PIPE if input is not None else None,
+        stdout=asyncio.subprocess.PIPE, start_new_session=True)
+    logger.info(cmdstr)
+    try:
+      output_bytes, _ = await asyncio.wait_for(process.communicate(input), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+      logger.error('Killed [{}]'.format(cmdstr))
+      kill_group(process.pid)
+      await process.wait()
+      raise
+  # bytes that aren't UTF-8 (binary data, a character cut by `head -c`) survive the round trip;
+  # `output_str.encode('utf-8', 'surrogateescape')` gives them back
+  output_str = output_bytes.decode('utf-8', 'surrogateescape')
+  logger.info(output_str)
+  return process.pid, output_str
+
+
+async def remote_execute_async(cmdstr, instance, timeout=None):
+  """Execute `cmdstr` in remote device without blocking the event loop
+
+  Parameters
+  ----------
+  cmdstr : str
+    Command to be executed
+  instance : instance.Instance
+    Instance of remote device
+  timeout : float, optional
+    Number of seconds to wait for completion (default None)
+
+  Returns
+  -------
+  tuple
+    (pid, output) Process id and STDOUT of execution
+  """
+  return await execute_remote_cmd_async(
+      make_remote_cmd(cmd.SSH_EXEC, instance, cmd=cmdstr),
+      instance, timeout)
+
+
+async def execute_remote_cmd_async(cmdstr, instance, timeout=None, input=None):
+  """Execute a local `cmdstr` (ssh/scp/rsync) that talks to `instance`
+
+  Holds one of `instance`'s sessions while `cmdstr` executes.
+
+  Parameters
+  ----------
+  cmdstr : str
+    Command built by `make_remote_cmd`
+  instance : instance.Instance
+    Instance of remote device
+  timeout : float, optional
+    Number of seconds to wait for completion (default None)
+  input : bytes, optional
+    Data fed to STDIN of `cmdstr` (default None)
+
+  Returns
+  -------
+  tuple
+    (pid, output) Process id and STDOUT of execution
+  """
+  async with semaphore(str(instance), connection.manager.max_sessions):
+    # open master connection without blocking the loop
+    await asyncio.get_running_loop().run_in_executor(
+        None, connection.manager.open, instance)
+    return await execute_async(cmdstr, timeout, input)
+
+
 def execute(cmdstr, run_async=False):
   """Execute `cmdstr` and return results
 
@@ -129,21 +313,13 @@ def execute(cmdstr, run_async=False):
     STDOUT of execution as a string
     `None` is returned when executed asynchronously
   """
-  # set stdout PIPE
-  stdout = open(os.devnull) if run_async else subprocess.PIPE
-  # create process
-  process = subprocess.Popen([cmdstr, '...'], stdout=stdout, shell=True)
-  logger.info(cmdstr)
-
   if run_async:  # return PID if running async
+    process = subprocess.Popen([cmdstr, '...'], stdout=open(os.devnull), shell=True)
+    logger.info(cmdstr)
     return process.pid, None
 
   try:  # else wait for process to complete
-    # get stdout
-    output_bytes, error = process.communicate()
-    output_str = output_bytes.decode('utf-8')
-    logger.info(output_str)
-    return process.pid, output_str
+    return run(execute_async(cmdstr))
   except KeyboardInterrupt:
     logger.error('Keyboard Interrupt')
     return None, None
@@ -170,6 +346,37 @@ def async_execute(cmdstr):
   return execute(cmdstr, run_async=True)
 
 
+def stream(cmdstr):
+  """Execute `cmdstr`, yield lines of STDOUT as they arrive
+
+  STDIN of the process stays open while lines are consumed;
+  it is closed (and the process is terminated) when the generator is closed.
+
+  Parameters
+  ----------
+  cmdstr : str
+    Command to be executed
+
+  Yields
+  ------
+  str
+    A line of STDOUT
+  """
+  logger.info(cmdstr)
+  process = subprocess.Popen(cmdstr, shell=True,
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+  try:
+    for line in iter(process.stdout.readline, b''):
+      yield line.decode('utf-8', 'replace')
+  finally:
+    process.stdin.close()
+    try:
+      process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+      process.kill()
+      process.wait()
+
+
 def remote_execute(cmdstr, instance, bypass_subprocess=False):
   """Execute `cmdstr` in remote device given by `instance`
 
@@ -188,20 +395,13 @@ def remote_execute(cmdstr, instance, bypass_subprocess=False):
   tuple
     (pid, output) Process id and STDOUT of execution
   """
-  _header = cmd.SSH_HEADER.format(password=instance.password)
-  _body = cmd.SSH_EXEC.format(
-      username=instance.username,
-      host=instance.host, cmd=cmdstr
-      )
   if bypass_subprocess:
-    _body = cmd.SSH_EXEC_PSEUDO_TERMINAL.format(
-          username=instance.username,
-          host=instance.host, cmd=cmdstr
-          )
-    os.system(' '.join([_header, _body]))
+    with connection.session(instance):
+      os.system(make_remote_cmd(cmd.SSH_EXEC_PSEUDO_TERMINAL, instance, cmd=cmdstr))
     return None, None
 
-  return execute(' '.join([_header, _body]))
+  with connection.session(instance):
+    return execute(make_remote_cmd(cmd.SSH_EXEC, instance, cmd=cmdstr))
 
 
 def remote_async_execute(cmdstr, instance, logfile='/dev/null'):
@@ -223,19 +423,125 @@ def remote_async_execute(cmdstr, instance, logfile='/dev/null'):
     (pid, output) `pid` contains the process id of command executed
     `output` is always `None` for aysnc execution
   """
-  _header = cmd.SSH_HEADER.format(password=instance.password)
-  _body = cmd.SSH_EXEC_ASYNC.format(
-      username=instance.username,
-      host=instance.host, cmd=cmdstr,
-      logfile=logfile
-      )
-  _, output = execute(' '.join([_header, _body]))
+  with connection.session(instance):
+    _, output = execute(make_remote_cmd(cmd.SSH_EXEC_ASYNC, instance,
+      cmd=cmdstr, logfile=logfile))
   # parse output to get PID of remote process
   pid = int(output.replace('\n', '').strip())
   return pid, None
 
 
-def create_runner(path, commands, logfile, run_async=False, name='re.runner'):
+def make_token():
+  """Make a random token that separates outputs of batched commands"""
+  return uuid.uuid4().hex
+
+
+def make_batch_cmd(commands, instance):
+  """Make a command that executes `commands` in one ssh session
+
+  Parameters
+  ----------
+  commands : list
+    A list of commands to be executed in remote device
+  instance : instance.Instance
+    Instance of remote device
+
+  Returns
+  -------
+  cmdstr : str
+    ssh command that executes the batch
+  token : str
+    Token that separates outputs of commands, see `parse_batch`
+  """
+  token = make_token()
+  script = cmd.make_sh(cmd.make_batch(commands, token))
+  return make_remote_cmd(cmd.SSH_EXEC_SCRIPT, instance,
+      script=shlex.quote(script)), token
+
+
+def parse_batch(output, token, n):
+  """Split output of a batch into results of individual commands
+
+  Parameters
+  ----------
+  output : str
+    STDOUT of batch execution
+  token : str
+    Token that separates outputs of commands
+  n : int
+    Number of commands in batch
+
+  Returns
+  -------
+  list
+    A list of `n` results (exit code, stdout, stderr)
+    (None, '', '') for commands that didn't run
+  """
+  results = [ [None, '', ''] for _ in range(n) ]
+  marker = re.compile('\n{}(?::(-?[0-9]+))?\n'.format(
+    cmd.BATCH_MARKER.format(token=token, idx='([0-9]+)', stream='(out|err|code)')
+    ))
+  # [ head, idx, stream, code, section, idx, stream, code, section ... ]
+  parts = marker.split(output if output else '')
+  for i in range(1, len(parts), 4):
+    idx, stream, code, section = parts[i:i + 4]
+    if stream == 'out':
+      results[int(idx)][1] = section
+    elif stream == 'err':
+      results[int(idx)][2] = section
+    else:
+      results[int(idx)][0] = int(code)
+  return [ tuple(result) for result in results ]
+
+
+def remote_execute_batch(commands, instance):
+  """Execute `commands` in remote device, in one ssh session
+
+  Commands are executed sequentially, by the same shell.
+
+  Parameters
+  ----------
+  commands : list
+    A list of commands to be executed
+  instance : instance.Instance
+    Instance of remote device
+
+  Returns
+  -------
+  list
+    A list of results (exit code, stdout, stderr), one per command
+  """
+  cmdstr, token = make_batch_cmd(commands, instance)
+  with connection.session(instance):
+    _, output = execute(cmdstr)
+  return parse_batch(output, token, len(commands))
+
+
+async def remote_execute_batch_async(commands, instance, timeout=None):
+  """Execute `commands` in remote device, in one ssh session,
+  without blocking the event loop
+
+  Parameters
+  ----------
+  commands : list
+    A list of commands to be executed
+  instance : instance.Instance
+    Instance of remote device
+  timeout : float, optional
+    Number of seconds to wait for completion (default None)
+
+  Returns
+  -------
+  list
+    A list of results (exit code, stdout, stderr), one per command
+  """
+  cmdstr, token = make_batch_cmd(commands, instance)
+  _, output = await execute_remote_cmd_async(cmdstr, instance, timeout)
+  return parse_batch(output, token, len(commands))
+
+
+def create_runner(path, commands, logfile, run_async=False, name='re.runner',
+    registry=None, job=None, sampler=None):
   """Create a bash script for executing `commands` sequentially in remote system
 
   Parameters
@@ -252,6 +558,12 @@ def create_runner(path, commands, logfile, run_async=False, name='re.runner'):
   name : str, optional
     Name of the script which contains `commands`
     The script that will be executed
+  registry : str, optional
+    Directory in remote device where the runner registers itself (default None : no registry)
+  job : str, optional
+    Name of the runner's entry in `registry` (default None)
+  sampler : str, optional
+    Command that starts the sampler of the job, see `cmd.make_sampler` (default None)
 
   Returns
   -------
@@ -260,15 +572,23 @@ def create_runner(path, commands, logfile, run_async=False, name='re.runner'):
   """
   # . set traps
   # .. change to path
-  lines = cmd.make_traps() + [ cmd.CD.format(path=path) ]
+  lines = cmd.make_traps() + [ cmd.REMOVE_SELF, cmd.CD.format(path=path) ]
+  if registry:  # register pid, pgid, start time, log file and commands
+    lines.append(cmd.REGISTER_JOB.format(registry=registry, job=job, logfile=logfile,
+      command=shlex.quote('; '.join(commands).replace('\n', ' '))))
+  if sampler:  # resource usage of the job (`re top`)
+    lines.append(sampler)
+  if run_async:  # start with an empty log file
+    lines += [ cmd.MAKE_DIR.format(path=os.path.dirname(logfile)),
+        cmd.TRUNCATE.format(path=logfile) ]
   # async execution
   for i, command in enumerate(commands):
-    if run_async:  # redirect stdout/stderr to log file
-      command = cmd.REDIRECT_STDOUT.format(command=command, logfile=logfile)
+    if run_async:  # append stdout/stderr to log file; commands share it
+      command = cmd.REDIRECT_APPEND.format(command=command, logfile=logfile)
       if i < len(commands) - 1:
         command = '{} &'.format(command)  # push to background
-      else:  # add EOF to log if last command
-        command = '({} && echo EOF >> {}) &'.format(command, logfile)
+      else:  # add EOF to log if last command (failed or not)
+        command = '({}; echo EOF >> {}) &'.format(command, logfile)
     # add to list of lines
     lines.append(command)
   # end with wait if "run_async"
@@ -8,6 +8,7 @@ Each feature, named `mode` here, corresponds to a particular operation.
 Scroll down for a table of available commands, options and how to use them.
 
 """
+from recompute import archive
 from recompute import utils
 from recompute.instance import Instance
 from recompute.config import ConfigManager
@@ -15,6 +16,9 @@ from recompute.instance import InstanceManager
 from recompute.remote import Remote
 from recompute.bundle import Bundle
 from recompute.remote import VOID_CACHE
+from recompute.archive import Archive
+from recompute.scheduler import Scheduler
+from recompute.scheduler import Queue
 
 from getpass import getpass
 
@@ -40,7 +44,13 @@ MAN_DOCU = """
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | rsync    | Use rsync to synchronize local files with remote    | --force               | $re rsync                           |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| diff     | Compare local files with files pushed to remote     | None                  | $re diff                            |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| watch    | Push local files to remote as they change           | --loop                | $re watch                           |
+|          |                                                     |                       | $re watch --loop=5                  |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | sshadd   | Add a new instance to config                        | --instance            | $re sshadd --instance="usr@host"    |
+|          |                                                     | --max-jobs            | $re sshadd --max-jobs=2 ...         |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | install  | Install pypi packages in requirements.txt in remote | cmd, --force          | $re install                         |
 |          |                                                     |                       | $re install "pytorch tqdm"          |
@@ -50,11 +60,29 @@ MAN_DOCU = """
 | async    | Asynchronous execution of "args.cmd" in remote      | cmd, --force, --rsync | $re async "python3 x.py"            |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | log      | Fetch log from remote machine                       | --loop, --filter      | $re log                             |
-|          |                                                     |                       | $re log --loop=2                    |
+|          |                                                     | --follow, --all       | $re log --loop=2                    |
 |          |                                                     |                       | $re log --filter="pattern"          |
+|          |                                                     |                       | $re log --follow --filter="loss"    |
+|          |                                                     |                       | $re log --all --loop=2              |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| grep     | Search logs of completed runs (archived by log)     | cmd, --run            | $re grep "val_loss"                 |
+|          |                                                     | --since, --until      | $re grep "acc" --since=2020-01-31   |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| metrics  | Metrics (key=value, JSON) in log of current run     | cmd, --points         | $re metrics                         |
+|          |                                                     |                       | $re metrics "loss acc" --points=10  |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | list     | List out processes alive in remote machine          | --force               | $re list                            |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| top      | CPU, RSS, I/O and GPU usage of jobs, all machines   | None                  | $re top                             |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| submit   | Queue a job; start it where there is room for it    | cmd, --gpu, --cpus    | $re submit "python3 x.py"           |
+|          |                                                     | --loop                | $re submit "python3 x.py" --gpu=4000|
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| schedule | Place queued jobs onto machines in config           | --loop                | $re schedule --loop=30              |
+|          | (every --loop seconds, till all jobs end)           |                       |                                     |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| queue    | List queued, running and ended jobs                 | None                  | $re queue                           |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | kill     | Kill a process by index                             | --idx                 | $re kill                            |
 |          |                                                     |                       | $re kill --idx=1                    |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
@@ -64,11 +92,22 @@ MAN_DOCU = """
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | notebook | Create jupyter notebook in remote machine           | --run-async           | $re notebook                        |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
-| push     | Upload file to remote machine                       | cmd                   | $re push "x.py y/"                  |
+| push     | Upload files to remote machine                      | cmd                   | $re push "x.py *.csv y/"            |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| pull     | Download files from remote machine                  | cmd                   | $re pull "y/*.py logs/ ."           |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
-| pull     | Download file from remote machine                   | cmd                   | $re pull "y/z.py ."                 |
+| artifacts| Pull new/changed files of bin/ (or cmd) from remote | cmd, --loop           | $re artifacts                       |
+|          | (every --loop seconds, while the latest job runs)   |                       | $re artifacts "bin/ ckpt/" --loop=30|
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
-| data     | Download data from web into data/ folder of remote  | cmd                   | $re data "url1 url2 url3"           |
+| ls       | List remote project (cached listing)                | cmd, --force          | $re ls                              |
+|          |                                                     |                       | $re ls data/ --force                |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| stat     | Size, files and modification time of a remote path  | cmd, --force          | $re stat data/iris.data             |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| du       | Disk usage of a remote directory, by child          | cmd, --force          | $re du data/                        |
++----------+-----------------------------------------------------+-----------------------+-------------------------------------+
+| data     | Download data from web into data/ folder of remote  | cmd, --jobs           | $re data "url1 url2 url3"           |
+|          |                                                     | --run-async           | $re data "url#sha256=hex" --jobs=8  |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
 | man      | Show this man page                                  | None                  | $re man                             |
 +----------+-----------------------------------------------------+-----------------------+-------------------------------------+
@@ -80,23 +119,45 @@ parser = argparse.ArgumentParser(
     )
 # NOTE : ffs! write a descriptive help for `mode`
 parser.add_argument('mode', type=str,
-    help='(init/sync/async/rsync/install/log/list/kill/purgessh/notebook/conf/probe/data/pull/push/sshadd/man) recompute mode')
+    help='(init/sync/async/rsync/diff/watch/install/log/grep/metrics/list/kill/purgessh/notebook/conf/probe/top/submit/schedule/queue/data/pull/push/artifacts/ls/stat/du/sshadd/man) recompute mode')
 parser.add_argument('cmd', nargs='?', default='None',
     help='command to run in remote system')
 parser.add_argument('--remote-home', nargs='?', default='projects/',
     help='remote projects/ directory')
 parser.add_argument('--urls', nargs='?', default='',
     help='comma-separated list of URLs')
+parser.add_argument('--jobs', nargs='?', default=4,
+    help='number of URLs downloaded at once')
 parser.add_argument('--instance', nargs='?', default='',
     help='[username@host] config.remotepass is used')
 parser.add_argument('--filter', nargs='?', default='',
-    help='keyword to filter log')
+    help='keyword to filter log (a regex with --follow)')
+parser.add_argument('--follow', default=False, action='store_true',
+    help='Stream log as it is written, till the run ends')
+parser.add_argument('--all', default=False, action='store_true',
+    help='Logs of all jobs, prefixed by job name')
 parser.add_argument('--loop', nargs='?', default='',
-    help='number of seconds to wait to fetch log')
+    help='number of seconds to wait to fetch log (watch : to wait for changes)')
+parser.add_argument('--run', nargs='?', default='',
+    help='archived run (id or a prefix of it) to search')
+parser.add_argument('--since', nargs='?', default='',
+    help='search runs that ended since "YYYY-MM-DD [HH:MM]"')
+parser.add_argument('--until', nargs='?', default='',
+    help='search runs that ended until "YYYY-MM-DD [HH:MM]"')
+parser.add_argument('--points', nargs='?', default=20,
+    help='number of points a metric is downsampled to')
 parser.add_argument('--idx', nargs='?', default='',
     help='process idx to operate on')
 parser.add_argument('--name', nargs='?', default='runner',
     help='name of process')
+parser.add_argument('--transport', nargs='?', default='ssh',
+    help='(ssh/loopback) transport of instance added with sshadd')
+parser.add_argument('--max-jobs', nargs='?', default='',
+    help='number of jobs the scheduler runs at once in instance added with sshadd')
+parser.add_argument('--gpu', nargs='?', default=0,
+    help='GPU memory (MB) a submitted job needs')
+parser.add_argument('--cpus', nargs='?', default=0,
+    help='CPU cores a submitted job needs')
 parser.add_argument('--instance-idx', nargs='?', default=0,
     help='remote instance to use')
 parser.add_argument('--force', default=False, action='store_true',
@@ -137,7 +198,7 @@ def init():
   # create bundle
   bundle = Bundle()
   # create remote instance handle
-  remote = Remote(instance, bundle, remote_home=args.remote_home)
+  remote = Remote(instance, bundle, remote_home=args.remote_home, force=args.force)
   # sync files
   remote.rsync()
   # install from requirements.txt
@@ -160,6 +221,13 @@ def get_remote():
   return init()
 
 
+def archive_log(remote):
+  """Archive local log file, if the run has ended"""
+  if archive.is_complete(remote.local_logfile):
+    Archive().add(remote.local_logfile, name=remote.bundle.name,
+        instance=str(remote.instance))
+
+
 def main():  # package entry point
 
   """ Boilerplate """
@@ -187,11 +255,12 @@ def main():  # package entry point
     """ Mode : Add remote instance to config """
     try:
       assert args.instance  # make sure user@host is given as input
-      # get password from user
-      password = getpass('Password:')
+      # get password from user (loopback needs none)
+      password = getpass('Password:') if args.transport == 'ssh' else ''
       # . create Instance instance
       # .. parse user@host
-      instance = Instance(password=password).resolve_str(args.instance)
+      instance = Instance(password=password, transport=args.transport,
+          max_jobs=int(args.max_jobs) if args.max_jobs else None).resolve_str(args.instance)
       # add instance to config
       instanceman.add_instance(instance)
     except AssertionError:
@@ -202,12 +271,39 @@ def main():  # package entry point
     """ Mode : Probe remote machines """
     print(instanceman.probe(force=args.force))
 
+  # ------------ top ------------- #
+  elif args.mode == 'top':  # resource usage of jobs
+    """ Mode : Latest CPU/RSS/IO/GPU usage of jobs in all remote machines """
+    print(instanceman.top())
+
+  # ------------ submit ---------- #
+  elif args.mode == 'submit':  # queue a job
+    """ Mode : Queue a job; place it onto an instance with room for it """
+    assert args.cmd != 'None'
+    job = Queue.submit(args.cmd, int(args.gpu), float(args.cpus))
+    print('#{} queued : {}'.format(job['id'], job['cmd']))
+    Scheduler(instanceman, Bundle(), args.remote_home).run(int(args.loop) if args.loop else None)
+
+  # ------------ schedule -------- #
+  elif args.mode == 'schedule':  # run the scheduler
+    """ Mode : Place queued jobs onto instances; every --loop seconds, till all jobs end """
+    Scheduler(instanceman, Bundle(), args.remote_home).run(int(args.loop) if args.loop else None)
+
+  # ------------ queue ----------- #
+  elif args.mode == 'queue':  # jobs in queue
+    """ Mode : List queued, running and ended jobs """
+    print(utils.tabulate_queue(Queue.load().jobs))
+
   # ------------ data ------------ #
   elif args.mode == 'data':
     """ Mode : GET data from web """
+    urls = args.urls if args.urls else args.cmd if args.cmd != 'None' else ''
     try:
-      assert args.urls
-      get_remote().download(args.urls.split(' '), run_async=args.run_async)
+      assert urls
+      _, output = get_remote().download(urls.split(), run_async=args.run_async,
+          jobs=int(args.jobs))
+      if output:
+        print(output.strip())
     except AssertionError:
       logger.error('Input a list of URLs to download')
 
@@ -246,6 +342,23 @@ def main():  # package entry point
     # create remote from cache
     get_remote().rsync(update=args.force)
 
+  # ------------ watch ----------- #
+  elif args.mode == 'watch':
+    """ Mode : Push files as they change """
+    if args.loop:
+      get_remote().watch(float(args.loop))
+    else:
+      get_remote().watch()
+
+  # ------------ diff ------------ #
+  elif args.mode == 'diff':
+    """ Mode : Compare local files with remote """
+    added, modified, removed = get_remote().diff()
+    if not added and not modified and not removed:
+      print('Remote is up to date')
+    else:
+      print(utils.tabulate_diff(added, modified, removed))
+
   # ------------ install --------- #
   elif args.mode == 'install':
     """ Mode : Rsync files """
@@ -261,16 +374,53 @@ def main():  # package entry point
     """ Mode : Copy log from remote machine """
     # get remote
     remote = get_remote()
-    # delete local log
-    # NOTE : i'm not sure if i should do this!
+    # delete local log (archived, if the run has ended)
     if os.path.exists(remote.local_logfile):  # if it exists
+      archive_log(remote)
       os.remove(remote.local_logfile)
-    if args.loop:  # --------- loop ----------- #
+    if args.all:  # ---------- all jobs ------- #
+      """ Mode : New lines of all job logs """
+      remote.loop_get_job_logs(int(args.loop) if args.loop else None)
+    elif args.follow:  # ------- follow --------- #
+      """ Mode : Stream filtered log from remote machine """
+      remote.follow_log(args.filter)
+    elif args.loop:  # --------- loop ----------- #
       """ Mode : Copy log from remote machine in a loop """
       remote.loop_get_remote_log(int(args.loop), args.filter)
+      archive_log(remote)
     else:  # --------------- no loop ---------- #
       log = remote.get_remote_log(args.filter)
       print(utils.parse_log(log))
+      archive_log(remote)
+
+  # ------------ grep ------------ #
+  elif args.mode == 'grep':  # search archived logs
+    """ Mode : Search logs of past runs """
+    try:
+      assert args.cmd != 'None'  # make sure a pattern is given
+      for run_id, lineno, line in Archive().search(args.cmd,
+          args.run, args.since, args.until):
+        print('{}:{}: {}'.format(run_id, lineno, line))
+    except AssertionError:
+      logger.error('Input a pattern to search for')
+    except ValueError as e:  # bad --since/--until
+      logger.error(e)
+
+  # ------------ metrics --------- #
+  elif args.mode == 'metrics':  # metrics of current run
+    """ Mode : Extract metrics from log """
+    # metrics of the latest job's log, kept under its name
+    store = get_remote().update_metrics()
+    if args.cmd != 'None':  # downsampled series of metrics
+      for key in args.cmd.split(' '):
+        try:
+          assert key in store.keys()
+          print(key)
+          print(utils.tabulate_series(*store.series(key, int(args.points))))
+        except AssertionError:
+          logger.error('Unknown metric [{}]'.format(key))
+    else:  # summary
+      print(utils.tabulate_metrics(store.summary()))
 
   # ------------ list ------------ #
   elif args.mode == 'list':  # list of processes
@@ -313,52 +463,50 @@ def main():  # package entry point
     get_remote().start_notebook(args.run_async)
 
   # ------------ pull ------------ #
-  elif args.mode == 'pull':  # copy log from remote
-    """ Mode : Download file from remote machine """
+  elif args.mode == 'pull':  # copy files from remote
+    """ Mode : Download files from remote machine """
     assert args.cmd  # make sure files are provided for download
-    # NOTE : relative path is used
-    # NOTE : copy one file/directory at a time
+    # NOTE : relative paths are used; globs are expanded in remote machine
+    # NOTE : with more than one path, the last one is the local destination
     remote = get_remote()
-
     # parse list of files/path
-    filepaths = args.cmd.split(' ')
-
-    try:  # make sure only one file is copied at a time
-      assert len(filepaths) <= 2
-    except AssertionError:
-      logger.error('Copy one file/directory at a time')
-      exit()
-
-    # get absolute paths of local file and remote path
-    remotefile = os.path.join(remote.remote_dir, filepaths[0])
-    localpath = None if len(filepaths) == 1 \
-        else os.path.join(remote.bundle.path, filepaths[1])
-
-    remote.get_file_from_remote(remotefile, localpath)
+    filepaths = args.cmd.split()
+    localpath = os.path.join(remote.bundle.path, filepaths.pop()) if len(filepaths) > 1 else None
+    remote.pull(filepaths, localpath)
+
+  # ------------ artifacts ------- #
+  elif args.mode == 'artifacts':
+    """ Mode : Pull new/changed artifacts from remote machine """
+    dirs = args.cmd.split() if args.cmd != 'None' else None
+    get_remote().sync_artifacts(dirs, int(args.loop) if args.loop else None)
+
+  # ------------ ls/stat/du ------ #
+  elif args.mode in [ 'ls', 'stat', 'du' ]:
+    """ Mode : Inspect remote project tree (served from cached listing) """
+    remote = get_remote()
+    path = remote.relpath(args.cmd if args.cmd != 'None' else '.')
+    listing_ = remote.get_listing(args.force)
+    if args.mode == 'stat':
+      st = listing_.stat(path)
+      rows = [ (path,) + st ] if st else None
+    else:
+      rows = listing_.du(path) if args.mode == 'du' else listing_.ls(path)
+    if rows is None:
+      logger.error('No such file or directory in remote [{}]'.format(path))
+    else:
+      print(utils.tabulate_usage(rows) if args.mode == 'du' else utils.tabulate_listing(rows))
 
   # ------------ push ------------ #
-  elif args.mode == 'push':  # copy log from remote
-    """ Mode : Upload file to remote machine """
-    assert args.cmd  # make sure files are provided for download
-    # NOTE : relative path is used
-    # NOTE : copy one file/directory at a time
+  elif args.mode == 'push':  # copy files to remote
+    """ Mode : Upload files to remote machine """
+    assert args.cmd  # make sure files are provided for upload
+    # NOTE : relative paths are used; globs are expanded in local machine
+    # NOTE : with more than one path, the last one is the remote destination
     remote = get_remote()
     # parse list of files/path
-    filepaths = args.cmd.split(' ')
-
-    try:  # make sure only one file is copied at a time
-      assert len(filepaths) <= 2
-    except AssertionError:
-      logger.error('Copy one file/directory at a time')
-      exit()
-
-    # get absolute paths of local file and remote path
-    localfile = os.path.join(remote.bundle.path, filepaths[0])
-    remotepath = None if len(filepaths) == 1 \
-        else os.path.join(remote.remote_dir, filepaths[1])
-
-    # copy file to remote
-    remote.copy_file_to_remote(localfile, remotepath)
+    filepaths = args.cmd.split()
+    remotepath = os.path.join(remote.remote_dir, filepaths.pop()) if len(filepaths) > 1 else None
+    remote.push(filepaths, remotepath)
 
   else:
     logger.error('Something went wrong! Check command-line arguments')
@@ -12,24 +12,91 @@ Interaction includes,
 
 """
 from __future__ import print_function
+import base64
+import glob
 import time
 import pickle
+import shlex
+import sys
 import os
 
+from recompute.metrics import MetricStore
+from recompute import manifest
+from recompute import listing
+from recompute import watcher
+from recompute import walker
+from recompute import channel
+from recompute import fetch
+from recompute import sampler
 from recompute import cmd
 from recompute import process
+from recompute import transport
+from recompute import transfer
 from recompute import utils
 
 # setup logger
 logger = utils.get_logger(__name__)
 # void cache
 VOID_CACHE = '.recompute/void'
+# bootstrap results stay valid for `BOOTSTRAP_TTL` seconds
+BOOTSTRAP_TTL = 24 * 60 * 60
+# serve process management, logs and commands through the remote agent, when available
+USE_AGENT = True
+# quiet logs are polled less often; the delay is multiplied by `LOG_BACKOFF`
+# after each empty fetch, up to `LOG_MAX_DELAY` seconds
+LOG_BACKOFF = 2
+LOG_MAX_DELAY = 60
+# number of jobs whose logs are remembered
+JOBS_KEPT = 32
+# local copies of job logs
+LOCAL_LOGS_DIR = '.recompute/logs'
+# registry of jobs in remote project; an entry per runner
+REGISTRY = '.recompute/jobs'
+# background jobs are sampled (CPU, RSS, I/O, GPU) every `SAMPLE_INTERVAL` seconds (`re top`)
+SAMPLE_INTERVAL = 2
+# list of files of a partial rsync
+RSYNC_PARTIAL = '.recompute/rsync.partial'
+# a push failed; remote may lack files of local manifest, till a full rsync (diff) succeeds
+RSYNC_DIRTY = '.recompute/rsync.dirty'
+# `re watch` waits for changes this long, before a rescan (polling)
+WATCH_DELAY = 2
+# number of URLs `re data` downloads at once
+DOWNLOAD_JOBS = 4
+# content-addressed store of data files, shared by projects in remote machine (relative to $HOME)
+REMOTE_CAS = '.recompute/cas'
+# artifacts pulled { path : (size, mtime) }
+ARTIFACTS = '.recompute/artifacts'
+# list of artifacts to pull
+ARTIFACTS_PARTIAL = '.recompute/artifacts.partial'
+# remote directories of artifacts, relative to project
+ARTIFACTS_DIRS = [ 'bin/' ]
+
+
+def parse_read_from(output, offset):
+  """Parse output of `cmd.READ_FROM`
+
+  Parameters
+  ----------
+  output : str
+    Size of file in the first line, data read in the rest
+  offset : int
+    Offset the data was read from
+
+  Returns
+  -------
+  tuple
+    (size, data) Size of file and bytes read
+  """
+  if not output:  # failed; try again later
+    return offset, b''
+  size, _, data = output.partition('\n')
+  return int(size), data.encode('utf-8', 'surrogateescape')
 
 
 class Remote(object):
   """Remote models the remote machine"""
 
-  def __init__(self, instance=None, bundle=None, remote_home=None):
+  def __init__(self, instance=None, bundle=None, remote_home=None, force=False, cache=None):
     """
     Parameters
     ----------
@@ -39,35 +106,52 @@ class Remote(object):
       Bundle object that encapsulates current working directory (default None)
     remote_home : str, optional
       Home directory of remote device (default None)
+    force : bool, optional
+      When set to `True`, bootstraps remote machine even if cached results are valid
+      (default False)
+    cache : str, optional
+      Local cache of self (default None : VOID_CACHE)
+      Handles of other instances (see `scheduler.py`) keep caches of their own
     """
     # cache name
-    self.CACHE = VOID_CACHE
+    self.CACHE = cache if cache else VOID_CACHE
     cache = None
 
     if not instance and not bundle:
       # read from cache
       assert os.path.exists(self.CACHE)
       cache = pickle.load(open(self.CACHE, 'rb'))
-      remote_home = cache['remote_home']
 
     self.instance = instance if instance else cache['instance']
     self.bundle = bundle if bundle else cache['bundle']
 
     # create an SSH Client
     self.client = None
+    # talk to remote agent?
+    self.use_agent = USE_AGENT
+    # commands and files travel through transport
+    self.transport = transport.get(self.instance)
 
     # projects/ folder in remote machine
     remote_home = remote_home if remote_home else 'projects/'
-    self.remote_home = os.path.join(self.get_remote_home_dir(), remote_home)
+
+    if not cache and not force:
+      # reuse results of a previous bootstrap if they are still valid
+      cache = self.read_bootstrap_cache(remote_home)
+
+    if cache:
+      self.bootstrap_info = cache.get('bootstrap')
+      self.remote_home = cache['remote_home']
+    else:
+      # resolve $HOME and make directories in remote machine
+      self.bootstrap_info = self.bootstrap(remote_home)
+      self.remote_home = os.path.join(self.bootstrap_info['home'], remote_home)
+
     # projects/project/ folder in remote machine
     self.remote_dir = os.path.join(self.remote_home, self.bundle.name)
     # projects/project/data/
     self.remote_data = os.path.join(self.remote_dir, 'data/')
 
-    if not cache:
-      # make directories in remote machine
-      self.make_dirs()
-
     # build remote log file path
     self.logfile = os.path.join(self.remote_dir,
         '{}.log'.format(self.bundle.name)
@@ -77,17 +161,140 @@ class Remote(object):
         self.bundle.path,
         self.logfile.split('/')[-1]
         )
-
-    # list spawned processes
-    self.processes = [] if not cache else cache['processes']
+    # job logs live in projects/project/logs/
+    self.remote_logs = os.path.join(self.remote_dir, 'logs/')
+    # manifest of files pushed, mirrored in remote
+    self.remote_manifest = os.path.join(self.remote_dir, manifest.MANIFEST)
+    # runners register themselves in projects/project/.recompute/jobs/
+    self.registry = os.path.join(self.remote_dir, REGISTRY)
+
+    # list spawned processes (a fresh remote starts with none)
+    self.processes = cache['processes'] if cache and not instance else []
+    # jobs started [ (name, pid, logfile) ]; the log of the latest job is `self.logfile`
+    self.jobs = cache.get('jobs', []) if cache and not instance else []
+    if self.jobs:
+      self.logfile = self.jobs[-1][-1]
+    # sampler uploaded to remote machine (path); valid as long as the bootstrap is
+    self.sampler = cache.get('sampler') if cache else None
     # cache void
     self.cache_()
 
   def get_remote_home_dir(self):
     """Get $HOME directory path from remote system"""
-    pid, output = process.remote_execute('pwd', self.instance)
+    pid, output = self.transport.execute('pwd')
     return output.replace('\n', '').strip()
 
+  def get_agent(self):
+    """Get a channel to the remote agent
+
+    Returns
+    -------
+    channel.AgentChannel
+      An open channel, `None` if the agent is disabled or unavailable
+    """
+    if not self.use_agent:
+      return
+    # the agent needs python3 in remote machine
+    if self.bootstrap_info and not self.bootstrap_info['python'].startswith('Python 3'):
+      return
+    return channel.get(self.transport)
+
+  def agent_request(self, op, **args):
+    """Send a request to the remote agent
+
+    Parameters
+    ----------
+    op : str
+      Operation, see `agent.OPS`
+    args : dict
+      Arguments of operation
+
+    Returns
+    -------
+    object
+      Result of operation, `None` if the agent is unavailable or the request failed
+    """
+    agent = self.get_agent()
+    if not agent:
+      return
+    try:
+      return agent.request(op, **args)
+    except channel.AgentError as e:
+      logger.error('Agent [{}] failed : {}'.format(op, e))
+
+  def bootstrap(self, remote_home):
+    """Prepare remote machine in a single round trip
+
+    * Resolve $HOME
+    * Make project and data/ directories
+    * Get version of remote python
+    * Get free disk space
+
+    Parameters
+    ----------
+    remote_home : str
+      projects/ directory, relative to $HOME
+
+    Returns
+    -------
+    dict
+      Results of bootstrap, cached along with self
+    """
+    # ssh sessions start at $HOME, relative paths resolve against it
+    remote_data = os.path.join(remote_home, self.bundle.name, 'data/')
+    (_, home, _), (code, _, _), (_, python_out, python_err), (_, df, _) = \
+        self.transport.execute_batch([
+          'pwd',
+          cmd.MAKE_DIR.format(path=remote_data),
+          cmd.PYTHON_VERSION,
+          cmd.DISK_FREE_SPACE.format(path=remote_data)
+          ])
+    assert home.strip(), 'Failed to bootstrap {}'.format(self.instance)
+    assert code == 0, 'Failed to make remote directories'
+    info = {
+        'key' : self.bootstrap_key(remote_home),
+        'time' : time.time(),
+        'home' : home.strip(),
+        # python2 writes its version to stderr
+        'python' : (python_out + python_err).strip(),
+        'disk_free' : utils.parse_df_results(df)
+        }
+    logger.info(info)
+    return info
+
+  def bootstrap_key(self, remote_home):
+    """Bootstrap results are valid only for the same (instance, remote_home, project)"""
+    return (str(self.instance), remote_home, self.bundle.name)
+
+  def read_bootstrap_cache(self, remote_home):
+    """Read VOID cache, if it holds valid bootstrap results
+
+    Results are valid when they were generated for the same
+    instance, remote home and project, less than `BOOTSTRAP_TTL` seconds ago.
+
+    Parameters
+    ----------
+    remote_home : str
+      projects/ directory, relative to $HOME
+
+    Returns
+    -------
+    dict
+      Cache, if valid, `None` otherwise
+    """
+    if not os.path.exists(self.CACHE):
+      return
+    cache = pickle.load(open(self.CACHE, 'rb'))
+    info = cache.get('bootstrap')
+    if not info or cache['instance'] != self.instance:
+      return
+    if info['key'] != self.bootstrap_key(remote_home):
+      return
+    if time.time() - info['time'] > BOOTSTRAP_TTL:
+      return
+    logger.info('Bootstrap cache is valid')
+    return cache
+
   def cache_(self, name=None):
     """Cache attributes of self (Remote).
 
@@ -103,10 +310,13 @@ class Remote(object):
         'instance' : self.instance,
         'bundle': self.bundle,
         'remote_home' : self.remote_home,
-        'processes' : self.processes
+        'processes' : self.processes,
+        'jobs' : self.jobs,
+        'bootstrap' : self.bootstrap_info,
+        'sampler' : self.sampler
         }
     # dump dictionary
-    pickle.dump(void_as_dict, open(self.CACHE, 'wb'))
+    pickle.dump(void_as_dict, open(name, 'wb'))
 
   def make_mkcmd(self, dir_=None):
     """Make mkdir command
@@ -124,64 +334,169 @@ class Remote(object):
     # resolve directory to make
     dir_ = dir_ if dir_ else self.remote_dir
     # create directory in remote machine
-    _header = cmd.SSH_HEADER.format(password=self.instance.password)
-    _body = cmd.SSH_MAKE_DIR.format(
-        username=self.instance.username,
-        host=self.instance.host,
-        remote_dir=dir_
-        )
-    # join
-    return ' '.join([_header, _body])
+    return process.make_remote_cmd(cmd.SSH_MAKE_DIR, self.instance,
+        remote_dir=dir_)
 
-  def make_rsync_cmd(self):
+  def make_rsync_cmd(self, files_from=None):
     """Make rsync command
 
+    Parameters
+    ----------
+    files_from : str, optional
+      File that lists files to copy (default local database)
+
     Returns
     -------
     str
       rsync-based command that copies local files to remote
     """
-    _header = cmd.SSH_HEADER.format(password=self.instance.password)
-    _body = cmd.RSYNC.format(
-            deps_file=self.bundle.db,
-            username=self.instance.username,
-            host=self.instance.host,
-            remote_dir=self.remote_dir
-            )
-
-    return ' '.join([_header, _body])
+    files_from = files_from if files_from else self.bundle.db
+    return self.transport.make_sync_cmd(files_from, self.remote_dir)
 
   def make_dirs(self):
     """Make necessary directories in remote machine"""
-    # execute make directory command from local machine
-    mkcmd = self.make_mkcmd()
-    logger.info(mkcmd)
-    assert process.execute(mkcmd)
-    # make data/ directory
-    remote_data_ = self.make_mkcmd(self.remote_data)
-    logger.info(remote_data_)
-    assert process.execute(remote_data_)
-
-  def rsync(self, update=False):
+    # make project and data/ directories in one session
+    results = self.transport.execute_batch([
+      cmd.MAKE_DIR.format(path=self.remote_dir),
+      cmd.MAKE_DIR.format(path=self.remote_data)
+      ])
+    logger.info(results)
+    assert all(code == 0 for code, _, _ in results), 'Failed to make remote directories'
+
+  def rsync(self, update=False, paths=None):
     """Rsync files between local and remote systems
 
     Parameters
     ----------
     update : bool, optional
       When set to `True` updates dependencies in local database (default False)
+    paths : list, optional
+      Files known to have changed since the last push; only these are transferred
+      and remote manifest is not read (default None)
+      After a failed push, manifests are compared (all of `paths` included) till one succeeds
 
     Returns
     -------
-    tuple
-      (pid, output) Process id and output of execution
+    bool
+      `True` if remote is up to date
     """
     if update:  # update bundle
       self.bundle.update_dependencies()
 
-    # execute rsync
-    rsync_cmd = self.make_rsync_cmd()
+    # . compare manifests
+    # .. transfer files that changed
+    # local manifest is mirrored as a whole; a partial push is safe only if remote held the rest
+    if paths is None or os.path.exists(RSYNC_DIRTY):
+      added, modified, _ = self.diff()
+      changed = added + modified
+    else:
+      local = self.update_manifest()
+      changed = [ path for path in paths if path in local.files ]
+    if not changed:
+      logger.info('Remote is up to date; nothing to transfer')
+      return True
+    logger.info('{} files to transfer'.format(len(changed)))
+    # mirror manifest in remote, once files are in place
+    if not self.sync_files(changed) or not self.sync_files([ manifest.MANIFEST ]):
+      logger.error('rsync failed; manifests are compared on the next push')
+      open(RSYNC_DIRTY, 'w').close()
+      return False
+    if os.path.exists(RSYNC_DIRTY):
+      os.remove(RSYNC_DIRTY)
+    return True
+
+  def diff(self):
+    """Compare local files with files pushed to remote
+
+    Local manifest is updated (`.recompute/manifest`); remote manifest is read in one round trip.
+
+    Returns
+    -------
+    tuple
+      (added, modified, removed) lists of paths;
+      added : only in local, modified : in both with different contents, removed : only in remote
+    """
+    local = self.update_manifest()
+    _, output = self.transport.execute(cmd.READ_FILE.format(path=self.remote_manifest))
+    remote = manifest.Manifest.loads(output) if output else None
+    return local.diff(remote if remote else manifest.Manifest())
+
+  def update_manifest(self):
+    """Update local manifest with files in local database
+
+    Returns
+    -------
+    manifest.Manifest
+      Local manifest
+    """
+    local = manifest.Manifest.load().update(open(self.bundle.db).readlines())
+    local.save()
+    return local
+
+  def watch(self, delay=WATCH_DELAY):
+    """Push files of bundle as they change, till interrupted
+
+    Directories of bundle are watched (inotify; polled if not available);
+    once something is touched, bundle is rescanned (stat index) and files that changed are pushed.
+    Directories are walked again only when one is created, removed or moved (or events were lost).
+
+    Parameters
+    ----------
+    delay : int, optional
+      Number of seconds to wait for changes, before a rescan (default WATCH_DELAY)
+    """
+    # bring remote up to date
+    self.rsync(update=True)
+    watcher_ = watcher.get()
+    dirs = None
+    try:
+      while True:
+        # . wait for changes in directories of bundle
+        # .. rescan bundle; push files that changed
+        if dirs is None and not isinstance(watcher_, watcher.PollingWatcher):
+          dirs = set(os.path.normpath(dir_) for dir_ in self.bundle.get_local_dirs())
+          try:
+            watcher_.watch(dirs)
+          except OSError as e:
+            logger.error('{}; poll for changes'.format(e))
+            watcher_.close()
+            watcher_ = watcher.PollingWatcher()
+        touched = watcher_.wait(delay)
+        if touched is not None and not touched:
+          continue
+        # a directory created, removed or moved (or events lost); walk directories again
+        if touched is None or any(path in dirs or os.path.isdir(path) for path in touched):
+          dirs = None
+        self.bundle.update_dependencies()
+        files = set(self.bundle.files)
+        paths = sorted([ path for path in self.bundle.changed if path in files ])
+        if paths and self.rsync(paths=paths):
+          print('{} | pushed {}'.format(time.strftime('%H:%M:%S'), ' '.join(paths)))
+    except KeyboardInterrupt:
+      logger.info('You did this! You did this to us!!')
+    finally:
+      watcher_.close()
+
+  def sync_files(self, paths):
+    """Rsync files in `paths` (relative to current directory) to remote
+
+    Returns
+    -------
+    bool
+      `True` if rsync succeeded
+    """
+    listing.Listing.invalidate()
+    with open(RSYNC_PARTIAL, 'w') as f:
+      for path in paths:
+        f.write(path)
+        f.write('\n')
+    token = process.make_token()
+    rsync_cmd = cmd.ECHO_ON_SUCCESS.format(
+        command=self.make_rsync_cmd(RSYNC_PARTIAL),
+        token=token)
     logger.info(rsync_cmd)
-    return process.execute(rsync_cmd)
+    _, output = self.transport.run_cmd(rsync_cmd)
+    return bool(output) and output.split()[-1:] == [ token ]
 
   def async_execute(self, commands, logfile=None, name='runner'):
     return self.execute(commands, run_async=True, log=True, logfile=logfile, name=name)
@@ -199,7 +514,8 @@ class Remote(object):
     log : bool, optional
       Enables or disables logging output of execution (default True)
     logfile : str, optional
-      Log file to redirect output of execution to (default None)
+      Log file to redirect output of execution to
+      (default None : a log file of its own, in `remote_logs`)
     name : str, optional
       Name of process (default 'runner')
 
@@ -208,26 +524,55 @@ class Remote(object):
     tuple
       (pid, output) Process id and STDOUT of execution
     """
+    # a run writes to remote project; cached listing is stale
+    listing.Listing.invalidate()
+    # every job gets a log file and a runner of its own; concurrent jobs don't clobber each other
+    job = '{}-{}-{}'.format(name, time.strftime('%Y%m%d-%H%M%S'), process.make_token()[:4])
     # resolve log file
-    logfile = logfile if logfile else self.logfile
+    logfile = logfile if logfile else os.path.join(self.remote_logs, '{}.log'.format(job))
+    # the runner starts a sampler of the job (`re top`); background jobs only
+    sampler_path = self.upload_sampler() if run_async else None
+    sampler_cmd = cmd.make_sampler(sampler_path, os.path.join(sampler.SAMPLES_DIR,
+      '{}.{}'.format(self.bundle.name, job)), SAMPLE_INTERVAL) if sampler_path else None
     # create runner
-    runner = process.create_runner(self.remote_dir, commands, logfile, run_async=run_async)
+    runner = process.create_runner(self.remote_dir, commands, logfile, run_async=run_async,
+        registry=self.registry, job=job, sampler=sampler_cmd)
     # push runner to remote
+    runner_abs_path = os.path.join(self.remote_dir, '{}.{}'.format(runner, job))
     self.copy_file_to_remote(
         os.path.join(self.bundle.path, runner),  # abs path of current dir
-        self.remote_dir
+        runner_abs_path
         )
-    # get absolute path of runner
-    runner_abs_path = os.path.join(self.remote_dir, runner)
     # execute runner in remote machine
-    exec_fn = process.remote_async_execute if run_async else process.remote_execute
-    pid, output = exec_fn(cmd.EXEC_RUNNER.format(runner=runner_abs_path), instance=self.instance)
+    if run_async:  # a session of its own; the job is killed as a group
+      pid, output = self.transport.async_execute(cmd.EXEC_RUNNER_ASYNC.format(runner=runner_abs_path))
+    else:
+      pid, output = self.transport.execute(cmd.EXEC_RUNNER.format(runner=runner_abs_path))
 
     # add pid to processes
     self.processes.append((name, pid))
+    if run_async:  # remember job's log; `re log` follows the latest job
+      self.jobs = (self.jobs + [ (name, pid, logfile) ])[-JOBS_KEPT:]
+      self.logfile = logfile
     self.cache_()
     return pid, output
 
+  def upload_sampler(self):
+    """Upload the sampler to remote machine, unless it is there already (as far as the cache knows)
+
+    Returns
+    -------
+    str
+      Path to sampler, relative to $HOME; `None` if it couldn't be uploaded
+    """
+    path = channel.agent_path(sampler)
+    if self.sampler != path:
+      if not channel.upload(self.transport, sampler):
+        logger.error('Failed to upload sampler')
+        return
+      self.sampler = path
+    return path
+
   def execute_command(self, cmdstr, run_async=False,
       log=False, logfile=None, bypass_subprocess=True):
     """Execute `cmdstr` in remote device
@@ -256,11 +601,33 @@ class Remote(object):
     logger.info(cmdstr)
     # if we are running async
     if run_async:
-      return process.remote_async_execute(cmdstr, self.instance, logfile)
+      return self.transport.async_execute(cmdstr, logfile)
     # --- sync execution --- #
+    if not bypass_subprocess:  # no terminal required; try the agent
+      result = self.agent_request('exec', cmd=cmdstr, wait=None)  # runs as long as it takes
+      if result is not None:
+        sys.stderr.write(result['stderr'])
+        return result['pid'], result['stdout']
     # execute in remote machine
-    return process.remote_execute(cmdstr, self.instance,
-        bypass_subprocess=bypass_subprocess)
+    return self.transport.execute(cmdstr, bypass_subprocess=bypass_subprocess)
+
+  async def execute_command_async(self, cmdstr, timeout=None):
+    """Execute `cmdstr` in remote device without blocking the event loop
+
+    Parameters
+    ----------
+    cmdstr : str
+      Command to be executed
+    timeout : float, optional
+      Number of seconds to wait for completion (default None)
+
+    Returns
+    -------
+    tuple
+      (pid, output) Process id and STDOUT of execution
+    """
+    logger.info(cmdstr)
+    return await self.transport.execute_async(cmdstr, timeout)
 
   def async_execute_command(self, cmdstr, logfile=None):
     """Execute `cmdstr` in remote device, asynchronously
@@ -288,20 +655,90 @@ class Remote(object):
       Path to local file to be copied to remote machine
     remotepath : str, optional
       Path in remote machine where local file should be copied to
+
+    Files copied into "data/" are kept in the content-addressed store (`REMOTE_CAS`) and
+    hardlinked into place; a file whose content is in store is linked rather than copied.
+
+    Returns
+    -------
+    bool
+      `True` if a large file was copied in chunks (`transfer.push`) and verified
+      or a file was linked from store; `None` for other files (a single scp stream)
     """
     # default remote path
     remotepath = remotepath if remotepath else self.remote_data
-    # build copy cmd
-    _header = cmd.SSH_HEADER.format(password=self.instance.password)
-    _body = cmd.SCP_TO_REMOTE.format(
-        username=self.instance.username,
-        host=self.instance.host,
-        remotepath=remotepath,
-        localpath=localpath
-        )
-    copy_cmd = ' '.join([_header, _body])
+    listing.Listing.invalidate()
+    # data files go through the store
+    if os.path.isfile(localpath) and os.path.join(remotepath, '').startswith(self.remote_data):
+      return self.copy_data_file_to_remote(localpath, remotepath)
+    # large files move in chunks, over parallel streams
+    if os.path.isfile(localpath) and os.path.getsize(localpath) >= transfer.CHUNKED_SIZE:
+      # a directory in remote? the file goes in it
+      _, output = self.transport.execute(cmd.IS_DIR.format(path=shlex.quote(remotepath)))
+      if remotepath.endswith('/') or (output and output.strip() == 'dir'):
+        remotepath = os.path.join(remotepath, os.path.basename(localpath))
+      return transfer.push(self.transport, localpath, remotepath)
     # local execute scp
-    process.execute(copy_cmd)
+    self.transport.put(localpath, remotepath)
+
+  def copy_data_file_to_remote(self, localpath, remotepath):
+    """Copy file to "data/" in remote machine, through the content-addressed store
+
+    Parameters
+    ----------
+    localpath : str
+      Path to local file
+    remotepath : str
+      Path in remote machine (a file or a directory) under "data/"
+
+    Returns
+    -------
+    bool
+      `True` if the file was linked from store or copied and verified
+    """
+    digest = transfer.digest(localpath)
+    if remotepath.endswith('/'):
+      remotepath = os.path.join(remotepath, os.path.basename(localpath))
+    # . link from store
+    # .. or copy and keep in store
+    _, output = self.transport.run_cmd(self.transport.make_cmd(cmd.CAS_LINK.format(
+      dst=shlex.quote(remotepath), name=shlex.quote(os.path.basename(localpath)),
+      cas=REMOTE_CAS, digest=digest)))
+    output = output.strip() if output else ''
+    if output == 'linked':
+      logger.info('[{}] linked from store'.format(localpath))
+      return True
+    if not output:
+      logger.error('Failed to resolve [{}] in remote'.format(remotepath))
+      return False
+    remotepath = output
+    if os.path.getsize(localpath) >= transfer.CHUNKED_SIZE:
+      if not transfer.push(self.transport, localpath, remotepath):
+        return False
+    else:
+      self.transport.put(localpath, remotepath)
+    _, output = self.transport.run_cmd(self.transport.make_cmd(cmd.CAS_DEPOSIT.format(
+      path=shlex.quote(remotepath), cas=REMOTE_CAS, digest=digest)))
+    if not output or output.strip() != 'ok':
+      logger.error('Failed to copy [{}] to remote'.format(localpath))
+      return False
+    return True
+
+  async def copy_file_to_remote_async(self, localpath, remotepath=None, timeout=None):
+    """Copy file to remote machine without blocking the event loop
+
+    Parameters
+    ----------
+    localpath : str
+      Path to local file to be copied to remote machine
+    remotepath : str, optional
+      Path in remote machine where local file should be copied to
+    timeout : float, optional
+      Number of seconds to wait for completion (default None)
+    """
+    # default remote path
+    remotepath = remotepath if remotepath else self.remote_data
+    await self.transport.put_async(localpath, remotepath, timeout)
 
   def get_file_from_remote(self, remotepath, localpath=None):
     """Copy file to local machine
@@ -312,20 +749,199 @@ class Remote(object):
       Path to remote file to be copied to local machine
     remotepath : str, optional
       Path in local machine where remote file should be copied to
+
+    Returns
+    -------
+    bool
+      `True` if a large file was copied in chunks (`transfer.pull`) and verified;
+      `None` for other files (a single scp stream)
     """
     # default local path
     localpath = localpath if localpath else self.bundle.path
-    # build copy cmd
-    _header = cmd.SSH_HEADER.format(password=self.instance.password)
-    _body = cmd.SCP_FROM_REMOTE.format(
-        username=self.instance.username,
-        host=self.instance.host,
-        remotepath=remotepath,
-        localpath=localpath
-        )
-    copy_cmd = ' '.join([_header, _body])
+    # large files move in chunks, over parallel streams
+    _, output = self.transport.execute(cmd.FILE_STAT.format(path=shlex.quote(remotepath)))
+    if output and int(output.split()[0]) >= transfer.CHUNKED_SIZE:
+      if os.path.isdir(localpath) or localpath.endswith('/'):
+        localpath = os.path.join(localpath, os.path.basename(remotepath))
+      return transfer.pull(self.transport, remotepath, localpath)
     # execute scp command
-    process.execute(copy_cmd)
+    self.transport.get(remotepath, localpath)
+
+  async def get_file_from_remote_async(self, remotepath, localpath=None, timeout=None):
+    """Copy file to local machine without blocking the event loop
+
+    Parameters
+    ----------
+    remotepath : str
+      Path to remote file to be copied to local machine
+    localpath : str, optional
+      Path in local machine where remote file should be copied to
+    timeout : float, optional
+      Number of seconds to wait for completion (default None)
+    """
+    # default local path
+    localpath = localpath if localpath else self.bundle.path
+    await self.transport.get_async(remotepath, localpath, timeout)
+
+  def push(self, paths, remotepath=None):
+    """Copy local files to remote machine; many paths (and globs) move in a single tar stream
+
+    Parameters
+    ----------
+    paths : list
+      Paths or globs, relative to local bundle
+    remotepath : str, optional
+      Path in remote machine where files should be copied to (default "data/")
+
+    Returns
+    -------
+    bool
+      `True` if every file was copied
+    """
+    remotepath = remotepath if remotepath else self.remote_data
+    listing.Listing.invalidate()
+    # . expand globs
+    # .. a single file goes alone (chunked, through the store)
+    matches = []
+    for path in paths:
+      found = sorted(glob.glob(os.path.join(self.bundle.path, path), recursive=True))
+      if not found:
+        logger.error('No such file [{}]'.format(path))
+        return False
+      matches.extend(found)
+    if len(matches) == 1 and not any(walker.GLOB_CHARS & set(path) for path in paths):
+      return self.copy_file_to_remote(matches[0], remotepath) is not False
+    return transfer.push_paths(self.transport, matches, remotepath)
+
+  def pull(self, patterns, localpath=None):
+    """Copy remote files to local machine; many paths (and globs) move in a single tar stream
+
+    Parameters
+    ----------
+    patterns : list
+      Paths or globs in remote machine, relative to remote directory
+    localpath : str, optional
+      Path in local machine where files should be copied to (default local bundle)
+
+    Returns
+    -------
+    bool
+      `True` if every pattern matched and the files were copied
+    """
+    localpath = localpath if localpath else self.bundle.path
+    # a single file goes alone (chunked)
+    if len(patterns) == 1 and not walker.GLOB_CHARS & set(patterns[0]):
+      return self.get_file_from_remote(os.path.join(self.remote_dir, patterns[0]),
+          localpath) is not False
+    return transfer.pull_paths(self.transport, patterns, self.remote_dir, localpath)
+
+  def list_artifacts(self, dirs=None):
+    """List files under `dirs` in remote project, in one round trip
+
+    Returns
+    -------
+    dict
+      { path : (size, mtime) } path relative to remote project
+    """
+    dirs = dirs if dirs else ARTIFACTS_DIRS
+    _, output = self.transport.execute('cd {} && {}'.format(shlex.quote(self.remote_dir),
+      cmd.LIST_FILES.format(dirs=' '.join(shlex.quote(dir_) for dir_ in dirs))))
+    listing = {}
+    for line in (output or '').splitlines():
+      fields = line.split(' ', 2)
+      if len(fields) == 3 and fields[0].isdigit():
+        listing[os.path.normpath(fields[2])] = (int(fields[0]), fields[1])
+    return listing
+
+  def pull_artifacts(self, dirs=None):
+    """Pull files under `dirs` that are new or changed since the last pull
+
+    Files pulled are recorded in `ARTIFACTS`; a file cut short is resumed next time.
+
+    Parameters
+    ----------
+    dirs : list, optional
+      Directories in remote project (default ARTIFACTS_DIRS)
+
+    Returns
+    -------
+    list
+      Paths pulled; `None` if the pull failed
+    """
+    pulled = pickle.load(open(ARTIFACTS, 'rb')) if os.path.exists(ARTIFACTS) else {}
+    listing = self.list_artifacts(dirs)
+    # . new, changed or missing locally
+    # .. pull in one transfer
+    paths = sorted([ path for path, stat in listing.items() if pulled.get(path) != stat
+      or not os.path.exists(os.path.join(self.bundle.path, path)) ])
+    if not paths:
+      return paths
+    with open(ARTIFACTS_PARTIAL, 'w') as f:
+      for path in paths:
+        f.write(path)
+        f.write('\n')
+    token = process.make_token()
+    _, output = self.transport.run_cmd(cmd.ECHO_ON_SUCCESS.format(
+      command=self.transport.make_sync_pull_cmd(ARTIFACTS_PARTIAL, self.remote_dir, self.bundle.path),
+      token=token))
+    if not output or output.split()[-1:] != [ token ]:
+      logger.error('Failed to pull artifacts; pull again to resume')
+      return
+    pulled.update((path, listing[path]) for path in paths)
+    pickle.dump(pulled, open(ARTIFACTS, 'wb'))
+    return paths
+
+  def sync_artifacts(self, dirs=None, delay=None):
+    """Pull artifacts as they are written, while the latest job runs
+
+    Parameters
+    ----------
+    dirs : list, optional
+      Directories in remote project (default ARTIFACTS_DIRS)
+    delay : int, optional
+      Number of seconds between pulls, till the latest job ends;
+      a last pull follows (default None : pull once)
+    """
+    pid = self.jobs[-1][1] if self.jobs and delay else None
+    try:
+      while True:
+        running = pid is not None and self.is_process_alive(pid)
+        paths = self.pull_artifacts(dirs)
+        if paths:
+          print('{} | pulled {}'.format(time.strftime('%H:%M:%S'), ' '.join(paths)))
+        if not running:
+          break
+        time.sleep(delay)
+    except KeyboardInterrupt:
+      logger.info('You did this! You did this to us!!')
+
+  def get_listing(self, force=False):
+    """Listing of remote project tree; served from cache (`listing.LISTING_TTL`)
+
+    Parameters
+    ----------
+    force : bool, optional
+      When set to `True`, lists remote project even if cached listing is valid (default False)
+
+    Returns
+    -------
+    listing.Listing
+      Listing of remote project
+    """
+    cached = None if force else listing.Listing.load()
+    if cached:
+      return cached
+    _, output = self.transport.execute(cmd.LIST_TREE.format(dir=shlex.quote(self.remote_dir)))
+    listing_ = listing.Listing(listing.parse(output))
+    listing_.save()
+    return listing_
+
+  def relpath(self, path):
+    """Path relative to remote project (absolute paths in remote project, too)"""
+    path = path if path else '.'
+    if os.path.isabs(path):
+      return os.path.relpath(path, self.remote_dir)
+    return path
 
   def get_remote_log(self, keyword=None):
     """Copy log file in remote system to local machine
@@ -340,8 +956,13 @@ class Remote(object):
     str
       Contents of log file in remote machine
     """
-    # copy to local
-    self.get_file_from_remote(self.logfile, self.bundle.path)  # '.'
+    # read through agent
+    result = self.agent_request('read', path=self.logfile)
+    if result is not None:
+      with open(self.local_logfile, 'wb') as f:
+        f.write(base64.b64decode(result['data']))
+    else:  # copy to local
+      self.get_file_from_remote(self.logfile, self.local_logfile)
     return self.get_local_log(keyword)
 
   def get_local_log(self, keyword=None):
@@ -362,7 +983,7 @@ class Remote(object):
       return ''
 
     # read from log file
-    log = open(os.path.join(self.bundle.path, self.logfile.split('/')[-1])).read()
+    log = open(self.local_logfile).read()
 
     if keyword:    # if keyword is given
       log = '\n'.join([ line for line in log.split('\n') if keyword in line])
@@ -370,11 +991,156 @@ class Remote(object):
     logger.info('\n{}'.format(log))
     return log
 
+  def read_remote_log(self, offset=0):
+    """Read bytes of remote log file from `offset` onwards
+
+    Parameters
+    ----------
+    offset : int, optional
+      Number of bytes already seen (default 0)
+
+    Returns
+    -------
+    tuple
+      (size, data) Size of remote log file and bytes read
+    """
+    # read through agent
+    result = self.agent_request('read', path=self.logfile, offset=offset)
+    if result is not None:
+      return result['size'], base64.b64decode(result['data'])
+    _, output = self.transport.execute(cmd.READ_FROM.format(path=self.logfile, offset=offset))
+    return parse_read_from(output, offset)
+
+  def read_job_logs(self):
+    """Fetch bytes appended to the logs of all jobs, in one round trip
+
+    Local copies of job logs are kept in `LOCAL_LOGS_DIR`;
+    their sizes are the offsets to read from.
+
+    Returns
+    -------
+    list
+      [ (name, pid, data) ] Bytes appended to each job's log
+    """
+    if not os.path.exists(LOCAL_LOGS_DIR):
+      os.makedirs(LOCAL_LOGS_DIR)
+    local_logs = [ os.path.join(LOCAL_LOGS_DIR, os.path.basename(logfile))
+        for _, _, logfile in self.jobs ]
+    offsets = [ os.path.getsize(path) if os.path.exists(path) else 0
+        for path in local_logs ]
+    results = self.transport.execute_batch([
+      cmd.READ_FROM.format(path=logfile, offset=offset)
+      for (_, _, logfile), offset in zip(self.jobs, offsets) ])
+    new = []
+    for (name, pid, _), path, offset, (_, output, _) in zip(
+        self.jobs, local_logs, offsets, results):
+      size, data = parse_read_from(output, offset)
+      if size < offset:  # log was rewritten; read it anew next time
+        open(path, 'wb').close()
+        data = b''
+      with open(path, 'ab') as f:
+        f.write(data)
+      new.append((name, pid, data))
+    return new
+
+  def loop_get_job_logs(self, delay=None):
+    """Print new lines of all job logs, prefixed by job name
+
+    Parameters
+    ----------
+    delay : int, optional
+      Number of seconds to wait till next fetch, in a loop,
+      till every job writes "EOF" or dies (default None : fetch once)
+    """
+    if not self.jobs:
+      logger.error('No jobs yet; start one with `re async`')
+      return
+    ended = set()
+    # { pid : bytes } unterminated last line of each job's log; printed once it is complete
+    tails = {}
+    try:
+      while True:
+        new = self.read_job_logs()
+        for name, pid, data in new:
+          *lines, tails[pid] = (tails.get(pid, b'') + data).split(b'\n')
+          lines = [ line.decode('utf-8', 'replace') for line in lines ]
+          for line in lines:
+            print('{}:{} | {}'.format(name, pid, line))
+          if 'EOF' in lines:
+            ended.add(pid)
+        if not delay or len(ended) == len(self.jobs):
+          break
+        # quiet logs; are the jobs still running? (killed jobs never write "EOF")
+        if not any(data for _, _, data in new):
+          alive = set([ pid for _, pid in self.list_processes(force=True) ])
+          if not alive & set([ pid for _, pid, _ in self.jobs ]) - ended:
+            break
+        time.sleep(delay)
+    except KeyboardInterrupt:
+      logger.info('You did this! You did this to us!!')
+    # last lines of logs that don't end with a newline
+    for name, pid, _ in self.jobs:
+      if tails.get(pid):
+        print('{}:{} | {}'.format(name, pid, tails[pid].decode('utf-8', 'replace')))
+
+  def update_local_log(self, offset=0, local_logfile=None):
+    """Append bytes added to remote log since `offset` to local log file
+
+    Parameters
+    ----------
+    offset : int, optional
+      Number of bytes already copied to local log (default 0)
+    local_logfile : str, optional
+      Local copy of remote log (default None : `self.local_logfile`)
+
+    Returns
+    -------
+    tuple
+      (offset, data) New offset and bytes appended to local log
+    """
+    local_logfile = local_logfile if local_logfile else self.local_logfile
+    size, data = self.read_remote_log(offset)
+    if size < offset:  # remote log was truncated (a new run); start over
+      logger.info('Remote log truncated')
+      open(local_logfile, 'wb').close()
+      offset = 0
+      size, data = self.read_remote_log(offset)
+    with open(local_logfile, 'ab') as f:
+      f.write(data)
+    return offset + len(data), data
+
+  def update_metrics(self):
+    """Extract metrics from lines appended to the log of the latest job (`self.logfile`)
+
+    Metrics and a local copy of the log are kept under the name of the log (`metrics.MetricStore`);
+    the store remembers which remote log it copies, and how far it was read.
+
+    Returns
+    -------
+    metrics.MetricStore
+      Metrics of the log
+    """
+    store = MetricStore(os.path.basename(self.logfile))
+    local_logfile = os.path.join(store.path, 'log')
+    offset = store.manifest.get('source_offset', 0)
+    # . another log under the same name (or a fresh store) : start over
+    # .. fetch what was appended to remote log
+    # ... extract metrics from new lines
+    if store.manifest.get('source') != self.logfile:
+      store.reset()
+      open(local_logfile, 'wb').close()
+      offset = 0
+    offset, _ = self.update_local_log(offset, local_logfile)
+    store.update(local_logfile, source=(self.logfile, offset))
+    return store
+
   def loop_get_remote_log(self, delay, keyword=None):
     """ Fetch log file in a loop.
 
     Get log from remote machine every `delay` seconds.
-    Print only the difference between local and remote log.
+    Only bytes appended since the last fetch travel; they are appended to local log file.
+    Print only the new lines.
+    While the log is quiet, the delay grows (up to `LOG_MAX_DELAY` seconds).
     End loop when "EOF" is seen in log file.
 
     Parameters
@@ -384,26 +1150,63 @@ class Remote(object):
     keyword : str, optional
       A keyword to filter out log file (default None)
     """
+    # resume from local log
+    offset = os.path.getsize(self.local_logfile) \
+        if os.path.exists(self.local_logfile) else 0
+    wait = delay
     try:
       while True:  # tis a loop, my liege.
-        # . get local log
-        local_log = self.get_local_log()
-        # .. get remote log
-        remote_log = self.get_remote_log()
-        # ... compare
-        diff = remote_log.replace(local_log, '')
+        # . get new bytes of remote log
+        offset, data = self.update_local_log(offset)
+        diff = data.decode('utf-8', 'replace')
+        if keyword:  # filter new lines
+          diff = ''.join([ line for line in diff.splitlines(True) if keyword in line ])
 
         # print the diff
         if diff.strip():  # if there is a difference
           logger.info('\n{}'.format(diff))
           print(diff, end='')
 
-        if 'EOF' in diff:  # has the execution ended?
+        if 'EOF' in data.decode('utf-8', 'replace').split():  # has the execution ended?
           break
+        # .. back off while the log is quiet
+        wait = delay if data else min(wait * LOG_BACKOFF, max(delay, LOG_MAX_DELAY))
         # and now we wait
-        time.sleep(delay)
+        time.sleep(wait)
+    except KeyboardInterrupt:
+      logger.info('You did this! You did this to us!!')
+
+  def follow_log(self, pattern=None):
+    """Follow log file over a single channel, till "EOF" is seen in log file
+
+    Lines are filtered in remote machine; only matching lines travel.
+    They are printed as soon as they are written.
+
+    Parameters
+    ----------
+    pattern : str, optional
+      A regular expression (awk) to filter log file (default None)
+
+    Returns
+    -------
+    str
+      Lines received
+    """
+    follower = cmd.FOLLOW_LOG.format(path=shlex.quote(self.logfile),
+        pattern=shlex.quote(pattern if pattern else ''))
+    lines = []
+    lines_stream = process.stream(self.transport.make_cmd(follower))
+    try:
+      for line in lines_stream:
+        print(line, end='', flush=True)
+        lines.append(line)
+        if line.strip() == 'EOF':  # has the execution ended?
+          break
     except KeyboardInterrupt:
       logger.info('You did this! You did this to us!!')
+    finally:
+      lines_stream.close()
+    return ''.join(lines)
 
   def install_deps(self, update=False):
     """Install dependencies in remote system
@@ -464,9 +1267,14 @@ class Remote(object):
     """
     return 'cd {}'.format(self.remote_data)
 
-  def download(self, urls, change_to=None, run_async=False):
+  def download(self, urls, change_to=None, run_async=False, jobs=DOWNLOAD_JOBS):
     """Download from web to remote machine's "data/" directory
 
+    URLs are downloaded concurrently by the download manager (`fetch.py`), uploaded on demand.
+    A checksum may follow a URL ("URL#sha256=HEX"); files downloaded already are skipped.
+    Files are kept in the content-addressed store (`REMOTE_CAS`) and hardlinked into `change_to`;
+    a URL whose content is in store is linked rather than downloaded.
+
     Parameters
     ----------
     urls : list
@@ -474,36 +1282,33 @@ class Remote(object):
     change_to : str, optional
       Directory where downloaded files go (default None)
     run_async : bool, optional
-      Download asynchronously (default False)
+      Download asynchronously, as a job (`re log --all`) (default False)
+    jobs : int, optional
+      Number of URLs downloaded at once (default DOWNLOAD_JOBS)
+
+    Returns
+    -------
+    tuple
+      (pid, output) Process id and a line per URL (status, name, size, seconds)
     """
-    # resolve cd directory
+    # resolve download directory
     change_to = change_to if change_to else self.remote_data
-    # build cmd header
-    _cmd_header = self._header_cd(change_to)
-    # build cmd body
-    _cmd_body = cmd.make_wget(urls)
-    # build cmd footer
-    data_logfile = os.path.join(change_to, 'data.log')
-    _cmd_footer = cmd.CMD_LOG_FOOTER.format(logfile=data_logfile)
-    # join
-    cmd_str = ' && '.join([ _cmd_header, _cmd_body ])
-
-    if run_async:  # run (download) async
-      self.async_remote_exec(cmd_str, logfile=data_logfile)
-
-    # run (download) sync
-    logger.info(self.execute_command(cmd_str + _cmd_footer))
+    listing.Listing.invalidate()
+    # . upload download manager (next to agent)
+    # .. run it
+    if not channel.upload(self.transport, fetch):
+      logger.error('Failed to upload download manager')
+      return None, None
+    fetch_cmd = cmd.make_fetch(channel.agent_path(fetch), change_to, urls, jobs, cas=REMOTE_CAS)
+    if run_async:  # a job of its own
+      return self.execute([ fetch_cmd ], run_async=True, name='data')
+    pid, output = self.execute_command(fetch_cmd, bypass_subprocess=False)
+    logger.info(output)
+    return pid, output
 
   def get_session(self):
     """Create an ssh session"""
-    os.system(
-        cmd.SSH_INTO_REMOTE_DIR.format(
-          username=self.instance.username,
-          password=self.instance.password,
-          host=self.instance.host,
-          remote_dir=self.remote_dir
-          )
-        )
+    os.system(self.transport.make_session_cmd(self.remote_dir))
 
   def start_notebook(self, run_async=False, name='jupyter:{}'):
     """Create and connect to remote notebook server
@@ -538,13 +1343,7 @@ class Remote(object):
     # . choose a client port number
     # .. build notebook client command
     client_port_num = utils.rand_client_port()
-    cmd_local = cmd.JUPYTER_CLIENT.format(
-        username=self.instance.username,
-        password=self.instance.password,
-        host=self.instance.host,
-        client_port_num=client_port_num,
-        server_port_num=server_port_num
-        )
+    cmd_local = self.transport.make_forward_cmd(client_port_num, server_port_num)
 
     logger.info('Starting local notebook ')
     logger.info('\thttp://localhost:{}/tree'.format(client_port_num))
@@ -588,26 +1387,37 @@ class Remote(object):
 
     """
     if force:
-      # get list of processes
-      command = ' '.join([
-        cmd.SSH_HEADER.format(password=self.instance.password),
-        cmd.SSH_EXEC.format(username=self.instance.username, host=self.instance.host,
-          cmd=cmd.PROCESS_LIST_LINUX.format(username=self.instance.username)
-          )
-        ])
-      pid, output = process.execute(command)
-      pids = utils.parse_ps_results(output)
-      known_pids = [ proc[-1] for proc in self.processes ]
-      self.processes = [ (name, pid) for name, pid in self.processes
-          if pid in pids ]
-      self.processes.extend([ ('zombie/spawn', pid) for pid in pids
-        if pid not in known_pids ])
+      # jobs alive, from registry
+      self.processes = [ (job.rsplit('-', 3)[0], pid)
+          for job, state, pid, _, _, _, _ in self.job_status() if state == 'alive' ]
       # update cache
       self.cache_()
 
     logger.info(self.processes)
     return self.processes
 
+  def job_status(self):
+    """Status of every job in registry, in one round trip
+
+    Liveness is checked in `/proc` : pid alive, with the start time registered (pid not reused)
+    and not a zombie. Dead jobs are reported once, then dropped from registry.
+
+    Returns
+    -------
+    list
+      [ (job, state, pid, pgid, start, logfile, command) ] state is alive/dead
+    """
+    _, output = self.transport.run_cmd(self.transport.make_cmd(
+      cmd.JOBS_STATUS.format(registry=shlex.quote(self.registry))))
+    jobs = []
+    for line in (output or '').splitlines():
+      fields = line.split('\t', 6)
+      if len(fields) == 7 and fields[2].isdigit():
+        job, state, pid, pgid, start, logfile, command = fields
+        jobs.append((job, state, int(pid), int(pgid) if pgid.isdigit() else None,
+          start, logfile, command))
+    return jobs
+
   def kill(self, idx, force=False):
     """Kill process by index
 
@@ -623,6 +1433,25 @@ class Remote(object):
     if len(processes) > 0:
       procs_to_kill = processes if idx == 0 else [processes[idx - 1]]
       if len(procs_to_kill) > 0:
-        process.kill_remote_process(
-            [ p[-1] for p in procs_to_kill ],  # separate pid
-            instance=self.instance)
+        pids = [ p[-1] for p in procs_to_kill ]  # separate pid
+        # jobs lead process groups; kill them whole
+        self.transport.execute(cmd.kill_groups(pids))
+
+  def is_process_alive(self, pid):
+    """Is process `pid` alive in remote machine?
+
+    Parameters
+    ----------
+    pid : int
+      Process id
+
+    Returns
+    -------
+    bool
+      `True` if the process is alive, `False` otherwise
+    """
+    result = self.agent_request('alive', pids=[pid])
+    if result is not None:
+      return result[str(pid)]
+    _, output = self.transport.execute(cmd.PROCESS_ALIVE.format(pid=pid))
+    return bool(output) and output.split() == [ str(pid) ]
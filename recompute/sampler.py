@@ -0,0 +1,289 @@
+"""sampler.py
+
+Samples resource usage of a job in the remote machine (`re top`).
+It is uploaded next to the agent (`$HOME/.recompute/`), started alongside every background job
+and run by python3.
+
+  python3 sampler.py --pid PID --out FILE [--interval 2] [--slots 512]
+  python3 sampler.py --read DIR [--last 2]
+
+* the job is the process tree of `--pid` : its process group if it leads one (`setsid`), its descendants otherwise
+* every `--interval` seconds, CPU time, RSS, bytes read/written (storage) of the job and,
+  where `nvidia-smi` is available, GPU memory/utilization are recorded
+* `nvidia-smi` is queried every `GPU_INTERVAL` seconds, by one of the samplers of the host;
+  the results are shared by all of them (`GPU_CACHE`, next to the ring buffers)
+* samples go into a ring buffer file of `--slots` fixed-size records; the file never grows
+* the sampler exits along with the job
+* `--read` prints the latest samples of every ring buffer in a directory, and the time (JSON)
+
+NOTE : this file is executed by the remote python3. It must depend on nothing but the standard library.
+
+"""
+import subprocess
+import argparse
+import struct
+import json
+import time
+import sys
+import os
+
+# ring buffers of jobs, relative to $HOME
+SAMPLES_DIR = '.recompute/samples'
+# magic, slots, record size, samples written
+HEADER = struct.Struct('<4sIIQ')
+MAGIC = b'RESM'
+# time, CPU seconds, RSS bytes, bytes read, bytes written, GPU memory bytes, GPU utilization (-1 : no GPU),
+# number of processes
+RECORD = struct.Struct('<ddQQQQfI')
+FIELDS = [ 'time', 'cpu', 'rss', 'read', 'write', 'gpu_mem', 'gpu_util', 'procs' ]
+# seconds between samples
+INTERVAL = 2.
+# records in a ring buffer
+SLOTS = 512
+# ring buffers untouched this long (seconds) are removed by `--read`
+KEEP = 24 * 60 * 60
+# seconds to wait for `nvidia-smi`
+GPU_TIMEOUT = 5
+# seconds between queries of `nvidia-smi`
+GPU_INTERVAL = 10.
+# results of the latest query of `nvidia-smi`, in the directory of ring buffers (JSON)
+GPU_CACHE = '.gpu'
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class Ring(object):
+  """Ring buffer of samples in a file"""
+
+  def __init__(self, path, slots=SLOTS):
+    """
+    Parameters
+    ----------
+    path : str
+      Ring buffer file; created if missing
+    slots : int, optional
+      Number of records, for a new ring buffer (default SLOTS)
+    """
+    self.path = path
+    if not os.path.exists(path):
+      with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, slots, RECORD.size, 0))
+        f.truncate(HEADER.size + slots * RECORD.size)
+    self.f = open(path, 'r+b')
+    header = self.f.read(HEADER.size)
+    magic, self.slots, size, self.count = HEADER.unpack(header) if len(header) == HEADER.size \
+        else (None, 0, 0, 0)
+    if magic != MAGIC or size != RECORD.size or not self.slots:
+      self.f.close()
+      raise ValueError('Not a ring buffer [{}]'.format(path))
+
+  def append(self, record):
+    """Write `record` over the oldest, once the ring is full"""
+    self.f.seek(HEADER.size + (self.count % self.slots) * RECORD.size)
+    self.f.write(RECORD.pack(*record))
+    self.count += 1
+    self.f.seek(0)
+    self.f.write(HEADER.pack(MAGIC, self.slots, RECORD.size, self.count))
+    self.f.flush()
+
+  def read(self, last=None):
+    """Latest `last` records (all, if `None`), oldest first"""
+    self.f.seek(0)
+    _, _, _, self.count = HEADER.unpack(self.f.read(HEADER.size))
+    n = min(self.count, self.slots, last if last else self.slots)
+    records = []
+    for i in range(self.count - n, self.count):
+      self.f.seek(HEADER.size + (i % self.slots) * RECORD.size)
+      records.append(RECORD.unpack(self.f.read(RECORD.size)))
+    return records
+
+  def close(self):
+    self.f.close()
+
+
+def stat(pid):
+  """Fields of `/proc/<pid>/stat` that follow the command name (state first); `None` if `pid` is gone"""
+  try:
+    with open('/proc/{}/stat'.format(pid)) as f:
+      return f.read().rsplit(')', 1)[1].split()
+  except (IOError, OSError, IndexError):
+    return
+
+
+def tree(root):
+  """Processes of the job led by `root`
+
+  Returns
+  -------
+  dict
+    { pid : stat fields }
+  """
+  stats = {}
+  for entry in os.listdir('/proc'):
+    if entry.isdigit() and int(entry) != os.getpid():
+      fields = stat(entry)
+      if fields and fields[0] != 'Z':
+        stats[int(entry)] = fields
+  # . leads a process group? the group is the job
+  # .. otherwise, descendants of `root`
+  root_stat = stat(root)
+  if root_stat is None or int(root_stat[2]) == root:
+    return { pid : fields for pid, fields in stats.items() if int(fields[2]) == root }
+  children = {}
+  for pid, fields in stats.items():
+    children.setdefault(int(fields[1]), []).append(pid)
+  job, stack = {}, [ root ]
+  while stack:
+    pid = stack.pop()
+    if pid in stats:
+      job[pid] = stats[pid]
+    stack.extend(children.get(pid, []))
+  return job
+
+
+def io(pid):
+  """(bytes read, bytes written) from/to storage by `pid`"""
+  counters = {}
+  try:
+    with open('/proc/{}/io'.format(pid)) as f:
+      for line in f:
+        key, _, value = line.partition(':')
+        counters[key] = int(value)
+  except (IOError, OSError, ValueError):
+    pass
+  return counters.get('read_bytes', 0), counters.get('write_bytes', 0)
+
+
+def query_gpu():
+  """Processes on GPUs [ (uuid, pid, memory MB) ] and utilization of GPUs { uuid : % }; `None` without `nvidia-smi`"""
+  def query(args):
+    output = subprocess.check_output([ 'nvidia-smi' ] + args + [ '--format=csv,noheader,nounits' ],
+        stderr=subprocess.DEVNULL, timeout=GPU_TIMEOUT).decode('utf-8')
+    return [ [ field.strip() for field in line.split(',') ] for line in output.splitlines() if line.strip() ]
+  try:
+    apps = query([ '--query-compute-apps=gpu_uuid,pid,used_memory' ])
+    utilization = dict(query([ '--query-gpu=uuid,utilization.gpu' ]))
+  except (OSError, subprocess.SubprocessError):
+    return
+  apps = [ (uuid, int(pid), int(memory)) for uuid, pid, memory in apps
+      if pid.isdigit() and memory.isdigit() ]
+  return apps, { uuid : float(util) for uuid, util in utilization.items()
+      if util.replace('.', '', 1).isdigit() }
+
+
+def cached_gpu(cache):
+  """Results of `query_gpu`, from file `cache` if they are less than `GPU_INTERVAL` seconds old
+
+  Fresh results are written to `cache` (atomically), for the other samplers of the host.
+  """
+  try:
+    with open(cache) as f:
+      cached = json.load(f)
+    if time.time() - cached['time'] < GPU_INTERVAL:
+      return cached['gpu']
+  except (IOError, OSError, ValueError, KeyError, TypeError):
+    pass
+  result = query_gpu()
+  try:
+    tmp = '{}.{}'.format(cache, os.getpid())
+    with open(tmp, 'w') as f:
+      json.dump({ 'time' : time.time(), 'gpu' : result }, f)
+    os.replace(tmp, cache)
+  except (IOError, OSError):
+    pass
+  return result
+
+
+def gpu(pids, cache=None):
+  """GPU memory (bytes) used by `pids` and utilization (%) of GPUs they use; (0, -1) without `nvidia-smi`
+
+  `nvidia-smi` results are shared through file `cache`; queried every time if `None`
+  """
+  result = cached_gpu(cache) if cache else query_gpu()
+  if not result:
+    return 0, -1.
+  apps, utilization = result
+  apps = [ (uuid, pid, memory) for uuid, pid, memory in apps if pid in pids ]
+  used = [ utilization[uuid] for uuid in set(uuid for uuid, _, _ in apps) if uuid in utilization ]
+  return sum(memory for _, _, memory in apps) << 20, max(used) if used else (0. if apps else -1.)
+
+
+def sample(root, cache=None):
+  """A record of the job led by `root`; `None` if the job is gone (`cache` : see `gpu`)"""
+  job = tree(root)
+  if not job:
+    return
+  cpu = sum(int(fields[11]) + int(fields[12]) for fields in job.values()) / CLOCK_TICKS
+  rss = sum(int(fields[21]) for fields in job.values()) * PAGE_SIZE
+  read, write = [ sum(counters) for counters in zip(*[ io(pid) for pid in job ]) ]
+  gpu_mem, gpu_util = gpu(set(job), cache)
+  return (time.time(), cpu, rss, read, write, gpu_mem, gpu_util, len(job))
+
+
+def run(root, path, interval=INTERVAL, slots=SLOTS):
+  """Sample the job led by `root` into ring buffer `path`, every `interval` seconds, till it ends"""
+  ring = Ring(path, slots)
+  # `nvidia-smi` results shared by samplers of the host
+  cache = os.path.join(os.path.dirname(os.path.abspath(path)), GPU_CACHE)
+  try:
+    while True:
+      record = sample(root, cache)
+      if record is None:
+        return
+      ring.append(record)
+      time.sleep(interval)
+  finally:
+    ring.close()
+
+
+def read(dir_, last=2):
+  """Latest `last` samples of every ring buffer in `dir_`
+
+  Returns
+  -------
+  dict
+    { name : [ { field : value } ] }
+  """
+  samples = {}
+  if not os.path.isdir(dir_):
+    return samples
+  for name in sorted(os.listdir(dir_)):
+    if name.startswith('.'):  # not a ring buffer (`GPU_CACHE`)
+      continue
+    path = os.path.join(dir_, name)
+    if time.time() - os.path.getmtime(path) > KEEP:
+      os.remove(path)
+      continue
+    try:
+      ring = Ring(path)
+    except ValueError:
+      continue
+    samples[name] = [ dict(zip(FIELDS, record)) for record in ring.read(last) ]
+    ring.close()
+  return samples
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Sample resource usage of a job')
+  parser.add_argument('--pid', type=int, help='process that leads the job')
+  parser.add_argument('--out', help='ring buffer file')
+  parser.add_argument('--interval', type=float, default=INTERVAL, help='seconds between samples')
+  parser.add_argument('--slots', type=int, default=SLOTS, help='records in ring buffer')
+  parser.add_argument('--read', help='print latest samples of ring buffers in this directory')
+  parser.add_argument('--last', type=int, default=2, help='number of samples printed per job')
+  args = parser.parse_args(argv)
+  if args.read:
+    print(json.dumps({ 'time' : time.time(), 'samples' : read(args.read, args.last) }))
+    return 0
+  if not os.path.isdir('/proc'):
+    print('sampler : no /proc', file=sys.stderr)
+    return 1
+  if os.path.dirname(args.out) and not os.path.exists(os.path.dirname(args.out)):
+    os.makedirs(os.path.dirname(args.out))
+  run(args.pid, args.out, args.interval, args.slots)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
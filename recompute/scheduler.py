@@ -0,0 +1,357 @@
+"""scheduler.py
+
+A queue of jobs, placed onto the instances in config (`re submit`, `re schedule`, `re queue`).
+
+* `re submit` queues a command along with the resources it needs (GPU memory, CPU cores)
+* the queue is kept locally (`.recompute/queue`), per project
+* a pass of the scheduler probes every active instance, concurrently, in one round trip each :
+  total/free GPU memory, CPU cores and load, jobs of the project alive (registry, see `Remote.job_status`)
+* jobs that ended free their slots; queued jobs are then placed, in order of submission,
+  onto the instance with the most room that fits them. A job that fits nowhere waits;
+  jobs behind it may go ahead
+* an instance runs up to `max_jobs` jobs of the project at once
+  (instance section in config; `instance.MAX_JOBS` by default)
+* a pass holds a lock on the queue (`QUEUE`.lock); schedulers running side by side
+  (two `re schedule`) take turns, and never start a job twice
+
+Resources declared by running jobs are held for them, even before the jobs allocate them.
+
+"""
+from contextlib import contextmanager
+import asyncio
+import pickle
+import fcntl
+import shlex
+import time
+import re
+import os
+
+from recompute.remote import Remote
+from recompute.remote import REGISTRY
+from recompute.remote import VOID_CACHE
+from recompute import instance as instance_
+from recompute import process
+from recompute import cmd
+from recompute import transport
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# local queue of jobs
+QUEUE = '.recompute/queue'
+# number of ended jobs remembered
+ENDED_KEPT = 32
+# a job is given this long (seconds) to register itself in remote, before it is taken for ended
+GRACE = 15
+
+
+@contextmanager
+def lock(path=QUEUE):
+  """Hold an exclusive lock on the queue in `path` while the block executes"""
+  with open(path + '.lock', 'a') as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def parse_probe(gpu_output, cpu_output, jobs_output):
+  """Parse outputs of `cmd.GPU_MEMORY`, `cmd.CPU_LOAD` and `cmd.JOBS_STATUS`
+
+  Returns
+  -------
+  dict
+    { gpu_total, gpu_free, cpus, load, alive } GPU memory in MB (0 without GPU),
+    free GPU memory is that of the GPU with the most; `alive` is a set of pids of jobs alive
+  """
+  gpus = []
+  for line in (gpu_output or '').splitlines():
+    fields = [ field.strip() for field in line.split(',') ]
+    if len(fields) == 2 and all(field.isdigit() for field in fields):
+      gpus.append((int(fields[0]), int(fields[1])))
+  try:
+    cpus, load = (cpu_output or '').split()
+    cpus, load = int(cpus), float(load)
+  except ValueError:
+    cpus, load = 0, 0.
+  alive = set()
+  for line in (jobs_output or '').splitlines():
+    fields = line.split('\t')
+    if len(fields) > 2 and fields[1] == 'alive' and fields[2].isdigit():
+      alive.add(int(fields[2]))
+  return {
+      'gpu_total' : sum(total for total, _ in gpus),
+      'gpu_free' : max([ free for _, free in gpus ] or [ 0 ]),
+      'cpus' : cpus,
+      'load' : load,
+      'alive' : alive
+      }
+
+
+def room(probe, running, max_jobs):
+  """Room left in an instance
+
+  Parameters
+  ----------
+  probe : dict
+    Probe of instance, see `parse_probe`
+  running : list
+    Jobs of the queue running in instance
+  max_jobs : int
+    Number of jobs the instance runs at once
+
+  Returns
+  -------
+  list
+    [ free slots, free GPU memory (MB), free CPU cores ]
+  """
+  jobs = probe['alive'] | set(job['pid'] for job in running)
+  gpu = min(probe['gpu_free'], probe['gpu_total'] - sum(job['gpu'] for job in running))
+  cpus = min(probe['cpus'] - probe['load'], probe['cpus'] - sum(job['cpus'] for job in running))
+  return [ max_jobs - len(jobs), gpu, cpus ]
+
+
+def place(job, rooms):
+  """Pick an instance for `job`
+
+  Parameters
+  ----------
+  job : dict
+    A queued job
+  rooms : dict
+    { instance : room } see `room`
+
+  Returns
+  -------
+  str
+    Instance with the most room (slots, CPU cores, GPU memory) that fits `job`; `None` if none does
+  """
+  fits = [ (room_, instance) for instance, room_ in rooms.items()
+      if room_[0] >= 1 and (not job['gpu'] or room_[1] >= job['gpu'])
+      and (not job['cpus'] or room_[2] >= job['cpus']) ]
+  if fits:
+    return max(fits, key=lambda fit: (fit[0][0], fit[0][2], fit[0][1]))[1]
+
+
+class Queue(object):
+  """Queue of jobs, kept locally"""
+
+  def __init__(self, jobs=None, count=0):
+    """
+    Parameters
+    ----------
+    jobs : list, optional
+      Jobs [ { id, cmd, gpu, cpus, state, instance, pid, logfile, submitted, started, ended } ]
+      state is one of queued/running/ended (default None)
+    count : int, optional
+      Number of jobs ever submitted; ids of jobs (default 0)
+    """
+    self.jobs = jobs if jobs else []
+    self.count = count
+
+  @classmethod
+  def load(cls, path=QUEUE):
+    if not os.path.exists(path):
+      return cls()
+    cache = pickle.load(open(path, 'rb'))
+    return cls(cache['jobs'], cache['count'])
+
+  def save(self, path=QUEUE):
+    # forget the oldest of ended jobs
+    ended = [ job for job in self.jobs if job['state'] == 'ended' ]
+    forget = set(job['id'] for job in ended[:-ENDED_KEPT]) if len(ended) > ENDED_KEPT else set()
+    self.jobs = [ job for job in self.jobs if job['id'] not in forget ]
+    # readers (`re queue`) never see a partial queue
+    with open(path + '.tmp', 'wb') as f:
+      pickle.dump({ 'jobs' : self.jobs, 'count' : self.count }, f)
+    os.replace(path + '.tmp', path)
+
+  @classmethod
+  def submit(cls, command, gpu=0, cpus=0, path=QUEUE):
+    """Add a job to the queue in `path`
+
+    Parameters
+    ----------
+    command : str
+      Command to run in remote project
+    gpu : int, optional
+      GPU memory (MB) the job needs (default 0)
+    cpus : float, optional
+      CPU cores the job needs (default 0)
+
+    Returns
+    -------
+    dict
+      The job queued
+    """
+    with lock(path):
+      queue = cls.load(path)
+      queue.count += 1
+      job = { 'id' : queue.count, 'cmd' : command, 'gpu' : gpu, 'cpus' : cpus, 'state' : 'queued',
+          'instance' : None, 'pid' : None, 'logfile' : None,
+          'submitted' : time.time(), 'started' : None, 'ended' : None }
+      queue.jobs.append(job)
+      queue.save(path)
+    return job
+
+  @classmethod
+  def update(cls, jobs, path=QUEUE):
+    """Write `jobs` over their entries in the queue in `path`
+
+    The queue is read afresh; jobs submitted meanwhile are kept.
+    Call it under `lock`.
+    """
+    queue = cls.load(path)
+    jobs = { job['id'] : job for job in jobs }
+    queue.jobs = [ jobs.get(job['id'], job) for job in queue.jobs ]
+    queue.save(path)
+    return queue
+
+  def with_state(self, state):
+    return [ job for job in self.jobs if job['state'] == state ]
+
+
+class Scheduler(object):
+  """Places queued jobs onto active instances"""
+
+  def __init__(self, instanceman, bundle, remote_home=None, path=QUEUE):
+    """
+    Parameters
+    ----------
+    instanceman : instance.InstanceManager
+      Instance Manager; jobs are placed onto its instances
+    bundle : bundle.Bundle
+      Bundle of current working directory
+    remote_home : str, optional
+      projects/ directory in remote machines, relative to $HOME (default None : 'projects/')
+    path : str, optional
+      Local queue (default QUEUE)
+    """
+    self.instanceman = instanceman
+    self.bundle = bundle
+    self.remote_home = remote_home if remote_home else 'projects/'
+    self.path = path
+    # { instance : remote.Remote } instances set up (files synced, dependencies installed)
+    self.remotes = {}
+
+  def get_remote(self, instance):
+    """Handle of `instance`; files are synced and dependencies installed the first time
+
+    Every instance keeps a cache of its own, `VOID_CACHE`.<instance>
+    An instance whose files couldn't be synced fails (AssertionError); it is set up again next time.
+    """
+    if str(instance) not in self.remotes:
+      remote = Remote(instance, self.bundle, remote_home=self.remote_home,
+          cache='{}.{}'.format(VOID_CACHE, re.sub(r'[^\w.@-]', '_', str(instance))))
+      assert remote.rsync(), 'failed to sync files'
+      remote.install_deps()
+      self.remotes[str(instance)] = remote
+    return self.remotes[str(instance)]
+
+  async def probe_instance(self, instance):
+    """Probe `instance` for GPU memory, CPU load and jobs alive, in one round trip
+
+    Returns
+    -------
+    dict
+      See `parse_probe`
+    """
+    registry = os.path.join(self.remote_home, self.bundle.name, REGISTRY)
+    (_, gpu_output, _), (_, cpu_output, _), (_, jobs_output, _) = \
+        await transport.get(instance).execute_batch_async([
+          cmd.GPU_MEMORY,
+          cmd.CPU_LOAD,
+          # a subshell; `cd` and `exit` stay in it
+          '( {} )'.format(cmd.JOBS_STATUS.format(registry=shlex.quote(registry)))
+          ])
+    return parse_probe(gpu_output, cpu_output, jobs_output)
+
+  async def probe_async(self):
+    """Probe all the active instances concurrently
+
+    Returns
+    -------
+    dict
+      { instance : (instance.Instance, probe) }
+    """
+    instances = await self.instanceman.get_active_async()
+    probes = await asyncio.gather(*[ self.probe_instance(instance) for instance in instances ])
+    return { str(instance) : (instance, probe) for instance, probe in zip(instances, probes) }
+
+  def step(self):
+    """A pass of the scheduler
+
+    * Probe active instances
+    * Mark jobs that ended
+    * Place and start queued jobs
+
+    The queue is locked for the whole pass.
+
+    Returns
+    -------
+    list
+      Events [ (event, job) ] event is one of started/ended
+    """
+    with lock(self.path):
+      return self.step_()
+
+  def step_(self):
+    queue = Queue.load(self.path)
+    if not queue.with_state('queued') and not queue.with_state('running'):
+      return []
+    probes = process.run(self.probe_async())
+    events, changed = [], []
+    # . jobs no longer alive have ended
+    # .. unless they have just started (not registered yet) or their instance is out of reach
+    for job in queue.with_state('running'):
+      if job['instance'] in probes and job['pid'] not in probes[job['instance']][1]['alive'] \
+          and time.time() - job['started'] > GRACE:
+        job['state'], job['ended'] = 'ended', time.time()
+        events.append(('ended', job))
+        changed.append(job)
+    rooms = {}
+    for name, (instance, probe) in probes.items():
+      running = [ job for job in queue.with_state('running') if job['instance'] == name ]
+      rooms[name] = room(probe, running,
+          getattr(instance, 'max_jobs', None) or instance_.MAX_JOBS)
+    # place queued jobs, in order of submission
+    for job in queue.with_state('queued'):
+      name = place(job, rooms)
+      if name is None:
+        continue
+      try:
+        remote = self.get_remote(probes[name][0])
+        pid, _ = remote.execute([ job['cmd'] ], run_async=True, name='job{}'.format(job['id']))
+      except AssertionError as e:  # failed to set up instance; try the others
+        logger.error('Failed to start job #{} in {} : {}'.format(job['id'], name, e))
+        rooms.pop(name)
+        continue
+      job.update({ 'state' : 'running', 'instance' : name, 'pid' : pid,
+        'logfile' : remote.jobs[-1][2], 'started' : time.time() })
+      rooms[name] = [ rooms[name][0] - 1, rooms[name][1] - job['gpu'], rooms[name][2] - job['cpus'] ]
+      events.append(('started', job))
+      changed.append(job)
+    Queue.update(changed, self.path)
+    return events
+
+  def run(self, delay=None):
+    """Schedule queued jobs; every `delay` seconds, till the queue drains and all jobs end
+
+    Parameters
+    ----------
+    delay : int, optional
+      Number of seconds between passes (default None : a single pass)
+    """
+    try:
+      while True:
+        for event, job in self.step():
+          print('{} | #{} {} in {} (pid {}) : {}'.format(time.strftime('%H:%M:%S'),
+            job['id'], event, job['instance'], job['pid'], job['cmd']))
+        queue = Queue.load(self.path)
+        if not delay or not (queue.with_state('queued') or queue.with_state('running')):
+          break
+        time.sleep(delay)
+    except KeyboardInterrupt:
+      logger.info('You did this! You did this to us!!')
@@ -0,0 +1,406 @@
+"""transfer.py
+
+Chunked transfer of large files between local and remote machines (`re push`, `re pull`).
+
+* a file is split into chunks of `CHUNK_SIZE` bytes; `STREAMS` chunks move at once,
+  each over a connection of its own (multiplexing off), so that one slow TCP stream doesn't cap the transfer
+* chunks are written in place into `<file>.part` at the other end (`dd` in remote machine)
+* completed chunks are recorded in a journal (`.recompute/transfers/`);
+  an interrupted transfer resumes with the chunks that are missing, as long as the source is unchanged
+* the reassembled file is verified (sha256 at both ends) before it takes the place of the destination
+
+Many files (or globs) move together in a single tar stream, over one connection (`push_paths`, `pull_paths`).
+
+"""
+import asyncio
+import hashlib
+import pickle
+import shlex
+import time
+import os
+
+from recompute import process
+from recompute import cmd
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# journals of transfers
+TRANSFERS_DIR = '.recompute/transfers'
+# sha256 of files pushed { path : (size, mtime, inode, sha256) }
+DIGESTS = '.recompute/digests'
+# files this large (bytes) are transferred in chunks
+CHUNKED_SIZE = 256 << 20
+# bytes in a chunk
+CHUNK_SIZE = 64 << 20
+# bytes read/written at a time; chunks are made of whole blocks
+BLOCK_SIZE = 1 << 20
+# number of chunks in flight
+STREAMS = 4
+
+
+class Journal(object):
+  """Journal of a transfer; remembers the chunks completed"""
+
+  def __init__(self, direction, src, dst, size, mtime, chunk_size):
+    """
+    Parameters
+    ----------
+    direction : str
+      'push' or 'pull'
+    src : str
+      Source file
+    dst : str
+      Destination file
+    size : int
+      Size of source
+    mtime : int
+      Modification time of source; a modified source starts over
+    chunk_size : int
+      Bytes in a chunk
+    """
+    self.info = { 'direction' : direction, 'src' : src, 'dst' : dst,
+        'size' : size, 'mtime' : mtime, 'chunk_size' : chunk_size }
+    key = hashlib.sha1('{} {} {}'.format(direction, src, dst).encode('utf-8')).hexdigest()
+    self.path = os.path.join(TRANSFERS_DIR, key)
+    self.done = set()
+    if os.path.exists(self.path):
+      journal = pickle.load(open(self.path, 'rb'))
+      if journal['info'] == self.info:
+        self.done = journal['done']
+        logger.info('Resume transfer; {} chunks done'.format(len(self.done)))
+
+  def add(self, idx):
+    """Record chunk `idx` as completed"""
+    self.done.add(idx)
+    if not os.path.exists(TRANSFERS_DIR):
+      os.makedirs(TRANSFERS_DIR)
+    pickle.dump({ 'info' : self.info, 'done' : self.done }, open(self.path, 'wb'))
+
+  def remove(self):
+    """Forget the transfer"""
+    self.done = set()
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+
+def make_chunks(size, chunk_size):
+  """Split `size` bytes into chunks
+
+  Returns
+  -------
+  list
+    [ (idx, offset, length) ]
+  """
+  return [ (idx, offset, min(chunk_size, size - offset))
+      for idx, offset in enumerate(range(0, size, chunk_size)) ]
+
+
+def sha256(path):
+  """sha256 of local file `path`"""
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def digest(path):
+  """sha256 of local file `path`; hashed again only if its (size, mtime, inode) changed"""
+  digests = pickle.load(open(DIGESTS, 'rb')) if os.path.exists(DIGESTS) else {}
+  st, path = os.stat(path), os.path.abspath(path)
+  key = (st.st_size, st.st_mtime_ns, st.st_ino)
+  if digests.get(path, (None,))[:3] != key:
+    digests[path] = key + (sha256(path),)
+    if not os.path.exists(os.path.dirname(DIGESTS)):
+      os.makedirs(os.path.dirname(DIGESTS))
+    pickle.dump(digests, open(DIGESTS, 'wb'))
+  return digests[path][3]
+
+
+async def run_chunk(cmdstr, feed=None, drain=None):
+  """Run `cmdstr`; `feed` STDIN or `drain` STDOUT through coroutines
+
+  Returns
+  -------
+  bool
+    `True` if the command succeeded and `feed`/`drain` moved every byte
+  """
+  pipe = asyncio.subprocess.PIPE
+  proc = await asyncio.create_subprocess_exec('/bin/sh', '-c', cmdstr,
+      stdin=pipe if feed else asyncio.subprocess.DEVNULL,
+      stdout=pipe if drain else asyncio.subprocess.DEVNULL, start_new_session=True)
+  try:
+    complete = await (feed(proc.stdin) if feed else drain(proc.stdout))
+    if feed:
+      proc.stdin.close()
+    return await proc.wait() == 0 and complete
+  except (ConnectionError, OSError) as e:
+    logger.error('Chunk failed : {}'.format(e))
+    process.kill_group(proc.pid)
+    await proc.wait()
+    return False
+  except asyncio.CancelledError:
+    process.kill_group(proc.pid)
+    await proc.wait()
+    raise
+
+
+async def move_chunks(chunks, journal, streams, move):
+  """Move `chunks` with coroutine `move`, `streams` at a time; record completed chunks"""
+  limit = asyncio.Semaphore(streams)
+
+  async def move_one(chunk):
+    async with limit:
+      if await move(*chunk):
+        journal.add(chunk[0])
+        return True
+      return False
+
+  return await asyncio.gather(*[ move_one(chunk) for chunk in chunks ])
+
+
+def report(direction, path, size, start):
+  """Print (and log) bytes moved and throughput of a transfer"""
+  seconds = max(time.time() - start, 1e-6)
+  summary = '{} [{}] {:.1f} MB in {:.1f}s ({:.1f} MB/s)'.format(direction, path,
+    size / (1 << 20), seconds, size / seconds / (1 << 20))
+  logger.info(summary)
+  print('{} | {}'.format(time.strftime('%H:%M:%S'), summary))
+
+
+async def pipe(src_cmd, dst_cmd):
+  """Run `src_cmd` and `dst_cmd`; STDOUT of `src_cmd` flows into STDIN of `dst_cmd`
+
+  Returns
+  -------
+  tuple
+    (success, bytes moved)
+  """
+  pipe_ = asyncio.subprocess.PIPE
+  src = await asyncio.create_subprocess_exec('/bin/sh', '-c', src_cmd,
+      stdin=asyncio.subprocess.DEVNULL, stdout=pipe_, start_new_session=True)
+  dst = await asyncio.create_subprocess_exec('/bin/sh', '-c', dst_cmd,
+      stdin=pipe_, stdout=asyncio.subprocess.DEVNULL, start_new_session=True)
+  moved = 0
+  try:
+    while True:
+      block = await src.stdout.read(BLOCK_SIZE)
+      if not block:
+        break
+      dst.stdin.write(block)
+      await dst.stdin.drain()
+      moved += len(block)
+    dst.stdin.close()
+    return (await src.wait() == 0) and (await dst.wait() == 0), moved
+  except (ConnectionError, OSError) as e:
+    logger.error('Stream failed : {}'.format(e))
+    return False, moved
+  finally:
+    for proc in [ src, dst ]:
+      if proc.returncode is None:
+        process.kill_group(proc.pid)
+        await proc.wait()
+
+
+def push_paths(transport, paths, dst):
+  """Copy local files/directories `paths` into directory `dst` in remote machine, in a tar stream
+
+  Parameters
+  ----------
+  transport : transport.Transport
+    Transport of remote device
+  paths : list
+    Paths to local files or directories
+  dst : str
+    Directory in remote machine; created if missing
+
+  Returns
+  -------
+  bool
+    `True` if every path was copied
+  """
+  members = ' '.join('-C {} {}'.format(shlex.quote(os.path.dirname(os.path.abspath(path))),
+    shlex.quote(os.path.basename(os.path.abspath(path)))) for path in paths)
+  start = time.time()
+  ok, moved = process.run(pipe(cmd.TAR_CREATE.format(members=members),
+    transport.make_cmd(cmd.TAR_EXTRACT.format(path=shlex.quote(dst)))))
+  if not ok:
+    logger.error('Failed to push {} paths to [{}]'.format(len(paths), dst))
+    return False
+  report('push', '{} paths -> {}'.format(len(paths), dst), moved, start)
+  return True
+
+
+def pull_paths(transport, patterns, base, dst):
+  """Copy files that match `patterns` in remote machine into local directory `dst`, in a tar stream
+
+  Globs are expanded in remote machine, in the same round trip.
+
+  Parameters
+  ----------
+  transport : transport.Transport
+    Transport of remote device
+  patterns : list
+    Paths or globs in remote machine, relative to `base`
+  base : str
+    Directory in remote machine
+  dst : str
+    Local directory; created if missing
+
+  Returns
+  -------
+  bool
+    `True` if every pattern matched and the files were copied
+  """
+  start = time.time()
+  ok, moved = process.run(pipe(transport.make_cmd(cmd.TAR_CREATE_GLOB.format(base=shlex.quote(base),
+    patterns=' '.join(cmd.quote_glob(pattern) for pattern in patterns))),
+    cmd.TAR_EXTRACT.format(path=shlex.quote(dst))))
+  if not ok:
+    logger.error('Failed to pull [{}] to [{}]'.format(' '.join(patterns), dst))
+    return False
+  report('pull', '{} -> {}'.format(' '.join(patterns), dst), moved, start)
+  return True
+
+
+def push(transport, src, dst, streams=STREAMS, chunk_size=CHUNK_SIZE):
+  """Copy local file `src` to `dst` in remote machine, in chunks
+
+  Parameters
+  ----------
+  transport : transport.Transport
+    Transport of remote device
+  src : str
+    Path to local file
+  dst : str
+    Path to file in remote machine
+  streams : int, optional
+    Number of chunks in flight (default STREAMS)
+  chunk_size : int, optional
+    Bytes in a chunk; a multiple of `BLOCK_SIZE` if larger (default CHUNK_SIZE)
+
+  Returns
+  -------
+  bool
+    `True` if `dst` is a verified copy of `src`
+  """
+  block_size = min(BLOCK_SIZE, chunk_size)
+  assert chunk_size % block_size == 0, 'chunk size is a multiple of {}'.format(block_size)
+  st = os.stat(src)
+  journal = Journal('push', os.path.abspath(src), dst, st.st_size, st.st_mtime_ns, chunk_size)
+  part = dst + '.part'
+  start = time.time()
+  # . start afresh
+  # .. send missing chunks
+  if not journal.done:
+    results = transport.execute_batch([ cmd.MAKE_DIR.format(path=shlex.quote(os.path.dirname(dst) or '.')),
+      cmd.TRUNCATE.format(path=shlex.quote(part)) ])
+    if not all(code == 0 for code, _, _ in results):
+      logger.error('Failed to create [{}] in remote'.format(part))
+      return False
+
+  async def put_chunk(idx, offset, length):
+    async def feed(stdin):
+      with open(src, 'rb') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+          block = f.read(min(BLOCK_SIZE, remaining))
+          if not block:
+            break
+          stdin.write(block)
+          await stdin.drain()
+          remaining -= len(block)
+      return remaining == 0
+    return await run_chunk(transport.make_cmd(cmd.WRITE_CHUNK.format(path=shlex.quote(part),
+      bs=block_size, blocks=offset // block_size), multiplex=False), feed=feed)
+
+  chunks = [ chunk for chunk in make_chunks(st.st_size, chunk_size) if chunk[0] not in journal.done ]
+  if not all(process.run(move_chunks(chunks, journal, streams, put_chunk))):
+    logger.error('{} chunks failed; push again to resume'.format(
+      len(make_chunks(st.st_size, chunk_size)) - len(journal.done)))
+    return False
+  # verify and move into place
+  _, output = transport.run_cmd(transport.make_cmd(cmd.MOVE_IF_SHA256.format(
+    path=shlex.quote(part), dst=shlex.quote(dst), digest=digest(src))))
+  journal.remove()
+  if not output or output.strip() != 'ok':
+    logger.error('Checksum mismatch [{}]; push again'.format(dst))
+    return False
+  report('push', src, st.st_size, start)
+  return True
+
+
+def pull(transport, src, dst, streams=STREAMS, chunk_size=CHUNK_SIZE):
+  """Copy file `src` in remote machine to local file `dst`, in chunks
+
+  Parameters
+  ----------
+  transport : transport.Transport
+    Transport of remote device
+  src : str
+    Path to file in remote machine
+  dst : str
+    Path to local file
+  streams : int, optional
+    Number of chunks in flight (default STREAMS)
+  chunk_size : int, optional
+    Bytes in a chunk; a multiple of `BLOCK_SIZE` if larger (default CHUNK_SIZE)
+
+  Returns
+  -------
+  bool
+    `True` if `dst` is a verified copy of `src`
+  """
+  block_size = min(BLOCK_SIZE, chunk_size)
+  assert chunk_size % block_size == 0, 'chunk size is a multiple of {}'.format(block_size)
+  _, output = transport.run_cmd(transport.make_cmd(cmd.FILE_STAT.format(path=shlex.quote(src))))
+  if not output or len(output.split()) != 2:
+    logger.error('No such file in remote [{}]'.format(src))
+    return False
+  size, mtime = [ int(field) for field in output.split() ]
+  journal = Journal('pull', src, os.path.abspath(dst), size, mtime, chunk_size)
+  part = dst + '.part'
+  start = time.time()
+  # . start afresh
+  # .. fetch missing chunks
+  if not journal.done or not os.path.exists(part):
+    journal.remove()
+    if os.path.dirname(dst) and not os.path.exists(os.path.dirname(dst)):
+      os.makedirs(os.path.dirname(dst))
+    with open(part, 'wb') as f:
+      f.truncate(size)
+
+  async def get_chunk(idx, offset, length):
+    async def drain(stdout):
+      with open(part, 'r+b') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+          block = await stdout.read(min(BLOCK_SIZE, remaining))
+          if not block:
+            break
+          f.write(block)
+          remaining -= len(block)
+      return remaining == 0
+    return await run_chunk(transport.make_cmd(cmd.READ_CHUNK.format(path=shlex.quote(src),
+      bs=block_size, blocks=offset // block_size, count=-(-length // block_size)),
+      multiplex=False), drain=drain)
+
+  chunks = [ chunk for chunk in make_chunks(size, chunk_size) if chunk[0] not in journal.done ]
+  if not all(process.run(move_chunks(chunks, journal, streams, get_chunk))):
+    logger.error('{} chunks failed; pull again to resume'.format(
+      len(make_chunks(size, chunk_size)) - len(journal.done)))
+    return False
+  # verify and move into place
+  _, output = transport.run_cmd(transport.make_cmd(cmd.FILE_SHA256.format(path=shlex.quote(src))))
+  journal.remove()
+  if not output or output.strip() != sha256(part):
+    logger.error('Checksum mismatch [{}]; pull again'.format(dst))
+    os.remove(part)
+    return False
+  os.rename(part, dst)
+  report('pull', src, size, start)
+  return True
@@ -0,0 +1,374 @@
+"""transport.py
+
+A Transport carries commands and files between the local and the remote machine.
+
+* `SSHTransport` talks to a remote machine via sshpass/ssh/scp/rsync
+* `LoopbackTransport` treats a local directory as the "remote home" and runs commands as local subprocesses
+
+Everything above this layer (`Remote`, `InstanceManager`, the agent channel) talks to a Transport,
+so that `re` can be exercised and profiled on a single machine without an ssh server.
+An instance picks its transport by `Instance.transport` ("ssh" or "loopback").
+
+"""
+import os
+import shlex
+
+from recompute import cmd
+from recompute import connection
+from recompute import process
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+
+class Transport(object):
+  """Transport interface
+
+  Every command runs in remote machine, from `$HOME`.
+  """
+
+  def __init__(self, instance):
+    """
+    Parameters
+    ----------
+    instance : instance.Instance
+      Instance of remote device
+    """
+    self.instance = instance
+
+  def make_cmd(self, script, multiplex=True):
+    """Make a local command that runs shell `script` in remote machine
+
+    STDIN and STDOUT of the local command are connected to the script's.
+
+    Parameters
+    ----------
+    script : str
+      Shell script
+    multiplex : bool, optional
+      When set to `False`, the command gets a connection of its own (a TCP stream)
+      rather than a session over the master connection (default True)
+
+    Returns
+    -------
+    str
+      Local command
+    """
+    raise NotImplementedError
+
+  def is_active(self):
+    """Is remote machine reachable?"""
+    raise NotImplementedError
+
+  async def is_active_async(self):
+    """Is remote machine reachable? Test without blocking the event loop"""
+    raise NotImplementedError
+
+  def execute(self, cmdstr, bypass_subprocess=False):
+    """Execute `cmdstr` in remote machine
+
+    Parameters
+    ----------
+    cmdstr : str
+      Command to be executed
+    bypass_subprocess : bool, optional
+      When set to `True`, `os.system` is used for execution, (None, None) is returned
+      When set to `False`, subprocess module is used for execution (default False)
+
+    Returns
+    -------
+    tuple
+      (pid, output) Process id and STDOUT of execution
+    """
+    raise NotImplementedError
+
+  async def execute_async(self, cmdstr, timeout=None, input=None):
+    """Execute `cmdstr` in remote machine without blocking the event loop
+
+    Parameters
+    ----------
+    cmdstr : str
+      Command to be executed
+    timeout : float, optional
+      Number of seconds to wait for completion (default None)
+    input : bytes, optional
+      Data fed to STDIN of `cmdstr` (default None)
+
+    Returns
+    -------
+    tuple
+      (pid, output) Process id and STDOUT of execution
+    """
+    raise NotImplementedError
+
+  def async_execute(self, cmdstr, logfile='/dev/null'):
+    """Start `cmdstr` in background in remote machine
+
+    Parameters
+    ----------
+    cmdstr : str
+      Command to be executed
+    logfile : str, optional
+      File that STDOUT/STDERR are redirected to (default '/dev/null')
+
+    Returns
+    -------
+    tuple
+      (pid, None) Process id of the remote process
+    """
+    raise NotImplementedError
+
+  def execute_batch(self, commands):
+    """Execute `commands` in remote machine, in one session
+
+    Returns
+    -------
+    list
+      A list of results (exit code, stdout, stderr), one per command
+    """
+    cmdstr, token = self.make_batch_cmd(commands)
+    _, output = self.run_cmd(cmdstr)
+    return process.parse_batch(output, token, len(commands))
+
+  async def execute_batch_async(self, commands, timeout=None):
+    """Execute `commands` in remote machine, in one session,
+    without blocking the event loop
+
+    Returns
+    -------
+    list
+      A list of results (exit code, stdout, stderr), one per command
+    """
+    cmdstr, token = self.make_batch_cmd(commands)
+    _, output = await self.run_cmd_async(cmdstr, timeout)
+    return process.parse_batch(output, token, len(commands))
+
+  def make_batch_cmd(self, commands):
+    """Make a local command that executes a batch of `commands`"""
+    token = process.make_token()
+    return self.make_cmd(cmd.make_batch(commands, token)), token
+
+  def run_cmd(self, cmdstr):
+    """Run a local command built by this transport"""
+    return process.execute(cmdstr)
+
+  async def run_cmd_async(self, cmdstr, timeout=None, input=None):
+    """Run a local command built by this transport, without blocking the event loop"""
+    return await process.execute_async(cmdstr, timeout, input)
+
+  def put(self, localpath, remotepath):
+    """Copy file/directory `localpath` to remote machine"""
+    return self.run_cmd(self.make_put_cmd(localpath, remotepath))
+
+  async def put_async(self, localpath, remotepath, timeout=None):
+    """Copy file/directory `localpath` to remote machine, without blocking the event loop"""
+    return await self.run_cmd_async(self.make_put_cmd(localpath, remotepath), timeout)
+
+  def get(self, remotepath, localpath):
+    """Copy file/directory `remotepath` to local machine"""
+    return self.run_cmd(self.make_get_cmd(remotepath, localpath))
+
+  async def get_async(self, remotepath, localpath, timeout=None):
+    """Copy file/directory `remotepath` to local machine, without blocking the event loop"""
+    return await self.run_cmd_async(self.make_get_cmd(remotepath, localpath), timeout)
+
+  def sync(self, files_from, remote_dir):
+    """Copy files listed in `files_from` (relative to current directory) to `remote_dir`"""
+    return self.run_cmd(self.make_sync_cmd(files_from, remote_dir))
+
+  def make_put_cmd(self, localpath, remotepath):
+    raise NotImplementedError
+
+  def make_get_cmd(self, remotepath, localpath):
+    raise NotImplementedError
+
+  def make_sync_cmd(self, files_from, remote_dir):
+    raise NotImplementedError
+
+  def make_sync_pull_cmd(self, files_from, remote_dir, local_dir):
+    """Make a local command that copies files listed in `files_from` (relative to `remote_dir`)
+    to `local_dir`; a file cut short is resumed next time"""
+    raise NotImplementedError
+
+  def make_session_cmd(self, remote_dir):
+    """Make a local command that opens an interactive shell in `remote_dir`"""
+    raise NotImplementedError
+
+  def make_forward_cmd(self, client_port_num, server_port_num):
+    """Make a local command that forwards local `client_port_num` to remote `server_port_num`"""
+    raise NotImplementedError
+
+
+class SSHTransport(Transport):
+  """SSHTransport talks to remote machine via sshpass/ssh/scp/rsync
+
+  Commands are multiplexed over the instance's master connection (see `connection.py`).
+  """
+
+  def make_cmd(self, script, multiplex=True):
+    return process.make_remote_cmd(cmd.SSH_EXEC_SCRIPT, self.instance, multiplex=multiplex,
+        script=shlex.quote(cmd.make_sh(script)))
+
+  def is_active(self):
+    # a successful test leaves a master connection behind for later calls
+    return not process.fetch_stderr(
+        process.make_remote_cmd(cmd.SSH_TEST, self.instance))
+
+  async def is_active_async(self):
+    _, stderr = await process.execute_async(cmd.STDERR_ONLY.format(
+      command=process.make_remote_cmd(cmd.SSH_TEST, self.instance)))
+    return not stderr
+
+  def execute(self, cmdstr, bypass_subprocess=False):
+    return process.remote_execute(cmdstr, self.instance,
+        bypass_subprocess=bypass_subprocess)
+
+  async def execute_async(self, cmdstr, timeout=None, input=None):
+    if input is None:
+      return await process.remote_execute_async(cmdstr, self.instance, timeout)
+    return await self.run_cmd_async(self.make_cmd(cmdstr), timeout, input)
+
+  def async_execute(self, cmdstr, logfile='/dev/null'):
+    return process.remote_async_execute(cmdstr, self.instance, logfile)
+
+  def run_cmd(self, cmdstr):
+    with connection.session(self.instance):
+      return process.execute(cmdstr)
+
+  async def run_cmd_async(self, cmdstr, timeout=None, input=None):
+    return await process.execute_remote_cmd_async(cmdstr, self.instance, timeout, input)
+
+  def make_put_cmd(self, localpath, remotepath):
+    return process.make_remote_cmd(cmd.SCP_TO_REMOTE, self.instance,
+        remotepath=remotepath,
+        localpath=localpath
+        )
+
+  def make_get_cmd(self, remotepath, localpath):
+    return process.make_remote_cmd(cmd.SCP_FROM_REMOTE, self.instance,
+        remotepath=remotepath,
+        localpath=localpath
+        )
+
+  def make_sync_cmd(self, files_from, remote_dir):
+    return process.make_remote_cmd(cmd.RSYNC, self.instance,
+        deps_file=files_from,
+        remote_dir=remote_dir
+        )
+
+  def make_sync_pull_cmd(self, files_from, remote_dir, local_dir):
+    return process.make_remote_cmd(cmd.RSYNC_PULL, self.instance,
+        files_from=files_from,
+        remote_dir=remote_dir,
+        local_dir=local_dir
+        )
+
+  def make_session_cmd(self, remote_dir):
+    return cmd.SSH_INTO_REMOTE_DIR.format(
+        username=self.instance.username,
+        password=self.instance.password,
+        host=self.instance.host,
+        remote_dir=remote_dir,
+        ssh_opts=connection.ssh_options(self.instance)
+        )
+
+  def make_forward_cmd(self, client_port_num, server_port_num):
+    return cmd.JUPYTER_CLIENT.format(
+        username=self.instance.username,
+        password=self.instance.password,
+        host=self.instance.host,
+        client_port_num=client_port_num,
+        server_port_num=server_port_num,
+        ssh_opts=connection.ssh_options(self.instance)
+        )
+
+
+class LoopbackTransport(Transport):
+  """LoopbackTransport treats a local directory as the remote machine's $HOME
+
+  The directory is `Instance.host`. Commands are local subprocesses,
+  executed from the directory with `$HOME` pointing at it.
+  """
+
+  def __init__(self, instance):
+    Transport.__init__(self, instance)
+    self.root = os.path.abspath(os.path.expanduser(instance.host))
+    if not os.path.exists(self.root):
+      os.makedirs(self.root)
+
+  def resolve(self, path):
+    """Resolve `path` in remote machine; relative paths are relative to $HOME"""
+    return os.path.join(self.root, path)
+
+  def make_cmd(self, script, multiplex=True):
+    return cmd.LOOPBACK_EXEC.format(root=shlex.quote(self.root),
+        script=shlex.quote(script))
+
+  def is_active(self):
+    return os.path.isdir(self.root)
+
+  async def is_active_async(self):
+    return self.is_active()
+
+  def execute(self, cmdstr, bypass_subprocess=False):
+    if bypass_subprocess:
+      os.system(self.make_cmd(cmdstr))
+      return None, None
+    return self.run_cmd(self.make_cmd(cmdstr))
+
+  async def execute_async(self, cmdstr, timeout=None, input=None):
+    return await self.run_cmd_async(self.make_cmd(cmdstr), timeout, input)
+
+  def async_execute(self, cmdstr, logfile='/dev/null'):
+    _, output = self.run_cmd(self.make_cmd(
+      cmd.NOHUP.format(cmd=cmdstr, logfile=logfile)))
+    # parse output to get PID of remote process
+    return int(output.replace('\n', '').strip()), None
+
+  def make_put_cmd(self, localpath, remotepath):
+    return cmd.COPY.format(src=shlex.quote(localpath),
+        dst=shlex.quote(self.resolve(remotepath)))
+
+  def make_get_cmd(self, remotepath, localpath):
+    return cmd.COPY.format(src=shlex.quote(self.resolve(remotepath)),
+        dst=shlex.quote(localpath))
+
+  def make_sync_cmd(self, files_from, remote_dir):
+    return cmd.TAR_SYNC.format(files_from=shlex.quote(files_from),
+        remote_dir=shlex.quote(self.resolve(remote_dir)))
+
+  def make_sync_pull_cmd(self, files_from, remote_dir, local_dir):
+    return cmd.TAR_SYNC_PULL.format(files_from=shlex.quote(os.path.abspath(files_from)),
+        remote_dir=shlex.quote(self.resolve(remote_dir)), local_dir=shlex.quote(local_dir))
+
+  def make_session_cmd(self, remote_dir):
+    return self.make_cmd(cmd.LOOPBACK_SESSION.format(
+      remote_dir=shlex.quote(self.resolve(remote_dir))))
+
+  def make_forward_cmd(self, client_port_num, server_port_num):
+    raise AssertionError('Port forwarding is unsupported by loopback transport')
+
+
+# transport classes by name
+TRANSPORTS = {
+    'ssh' : SSHTransport,
+    'loopback' : LoopbackTransport
+    }
+
+
+def get(instance):
+  """Get transport of `instance`
+
+  Parameters
+  ----------
+  instance : instance.Instance
+    Instance of remote device
+
+  Returns
+  -------
+  Transport
+    SSHTransport, unless the instance asks for another transport
+  """
+  # instances pickled before transports existed are ssh instances
+  return TRANSPORTS[getattr(instance, 'transport', 'ssh')](instance)
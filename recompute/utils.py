@@ -3,6 +3,8 @@
 from prettytable import PrettyTable
 
 import os
+import json
+import time
 import logging
 import random
 
@@ -103,6 +105,48 @@ def tabulate_instances(instances):
   return table
 
 
+def tabulate_metrics(rows):
+  """Convert a summary of metrics into a Pretty Table
+
+  Parameters
+  ----------
+  rows : list
+    Summary of metrics [ (key, count, last, min, max, mean) ]
+
+  Returns
+  -------
+  PrettyTable
+    A table of metrics
+  """
+  table = PrettyTable()
+  table.field_names = [ "Metric", "Count", "Last", "Min", "Max", "Mean" ]
+  for key, count, last, min_, max_, mean in rows:
+    table.add_row([ key, count ] + [ '{:.6g}'.format(v) for v in (last, min_, max_, mean) ])
+  return table
+
+
+def tabulate_series(lines, values):
+  """Convert a series of metric values into a Pretty Table
+
+  Parameters
+  ----------
+  lines : list
+    Line numbers (in log)
+  values : list
+    Values
+
+  Returns
+  -------
+  PrettyTable
+    A table of (line, value)
+  """
+  table = PrettyTable()
+  table.field_names = [ "Line", "Value" ]
+  for line, value in zip(lines, values):
+    table.add_row([ line + 1, '{:.6g}'.format(value) ])
+  return table
+
+
 def resolve_relative_path(filename, path):
   """Convert relative path to absolute"""
   return os.path.join(path, filename)
@@ -177,6 +221,25 @@ def parse_free_results(stdout):
   return int(line.split()[3])
 
 
+def parse_df_results(stdout):
+  """Parse results of `df -Pm` command
+
+  Parameters
+  ----------
+  stdout : str
+    Output of running `df -Pm` command
+
+  Returns
+  -------
+  int
+    Free Disk space in MB, `None` if `stdout` is unparsable
+  """
+  try:
+    return int(stdout.split('\n')[1].split()[3])
+  except (IndexError, ValueError):
+    return
+
+
 def rand_server_port(a=8824, b=8850):
   """Get a random integer between `a` and `b`"""
   return random.randint(a, b)
@@ -185,3 +248,161 @@ def rand_server_port(a=8824, b=8850):
 def rand_client_port(a=8850, b=8890):
   """Get a random integer between `a` and `b`"""
   return random.randint(a, b)
+
+
+def tabulate_diff(added, modified, removed):
+  """Convert a diff of local and remote files into a Pretty Table
+
+  Parameters
+  ----------
+  added : list
+    Files only in local
+  modified : list
+    Files that differ
+  removed : list
+    Files only in remote
+
+  Returns
+  -------
+  PrettyTable
+    A table of (file, status)
+  """
+  table = PrettyTable()
+  table.field_names = [ "File", "Status" ]
+  table.align["File"] = 'l'
+  for paths, status in [ (added, 'local only'), (modified, 'modified'), (removed, 'remote only') ]:
+    for path in paths:
+      table.add_row((path, status))
+  return table
+
+
+def format_size(size):
+  """1536 -> '1.5K'"""
+  for unit in [ 'B', 'K', 'M', 'G', 'T' ]:
+    if size < 1024 or unit == 'T':
+      return '{:.1f}{}'.format(size, unit) if unit != 'B' else '{}B'.format(int(size))
+    size /= 1024.
+
+
+def tabulate_listing(rows):
+  """Convert a listing of remote files into a Pretty Table
+
+  Parameters
+  ----------
+  rows : list
+    Entries [ (path, kind, size, mtime, files) ]
+
+  Returns
+  -------
+  PrettyTable
+    A table of (path, kind, size, files, modified)
+  """
+  table = PrettyTable()
+  table.field_names = [ "Path", "Kind", "Size", "Files", "Modified" ]
+  table.align["Path"] = 'l'
+  table.align["Size"] = 'r'
+  for path, kind, size, mtime, files in rows:
+    table.add_row((path + '/' if kind == 'd' else path, kind, format_size(size), files,
+      time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))))
+  return table
+
+
+def tabulate_usage(rows):
+  """Convert disk usage of remote directories into a Pretty Table
+
+  Parameters
+  ----------
+  rows : list
+    Usage [ (path, size, files) ]
+
+  Returns
+  -------
+  PrettyTable
+    A table of (size, files, path)
+  """
+  table = PrettyTable()
+  table.field_names = [ "Size", "Files", "Path" ]
+  table.align["Size"] = 'r'
+  table.align["Path"] = 'l'
+  for path, size, files in rows:
+    table.add_row((format_size(size), files, path))
+  return table
+
+
+def parse_samples(output):
+  """Summarize latest samples of jobs (output of `sampler.py --read`)
+
+  Rates (CPU, I/O) are taken over the last two samples of a job.
+
+  Parameters
+  ----------
+  output : str
+    JSON { time, samples : { job : [ sample ] } }
+
+  Returns
+  -------
+  list
+    [ (job, processes, CPU %, RSS, read/s, write/s, GPU memory, GPU %, seconds since last sample) ]
+  """
+  data = json.loads(output)
+  rows = []
+  for job, samples in sorted(data['samples'].items()):
+    if not samples:
+      continue
+    last = samples[-1]
+    cpu, read, write = '-', '-', '-'
+    if len(samples) > 1 and last['time'] > samples[-2]['time']:
+      first, seconds = samples[-2], last['time'] - samples[-2]['time']
+      cpu = '{:.0f}'.format(max(last['cpu'] - first['cpu'], 0) / seconds * 100)
+      read = format_size(max(last['read'] - first['read'], 0) / seconds) + '/s'
+      write = format_size(max(last['write'] - first['write'], 0) / seconds) + '/s'
+    gpu_mem, gpu_util = ('-', '-') if last['gpu_util'] < 0 \
+        else (format_size(last['gpu_mem']), '{:.0f}'.format(last['gpu_util']))
+    rows.append((job, last['procs'], cpu, format_size(last['rss']), read, write,
+      gpu_mem, gpu_util, int(data['time'] - last['time'])))
+  return rows
+
+
+def tabulate_top(rows):
+  """Convert resource usage of jobs into a Pretty Table
+
+  Parameters
+  ----------
+  rows : list
+    Usage [ (instance, job, processes, CPU %, RSS, read/s, write/s, GPU memory, GPU %, age) ]
+
+  Returns
+  -------
+  PrettyTable
+    A table of resource usage
+  """
+  table = PrettyTable()
+  table.field_names = [ "Machine", "Job", "Procs", "CPU %", "RSS", "Read", "Write",
+      "GPU Mem", "GPU %", "Age (s)" ]
+  table.align["Job"] = 'l'
+  for row in rows:
+    table.add_row(row)
+  return table
+
+
+def tabulate_queue(jobs):
+  """Convert jobs of the scheduler's queue into a Pretty Table
+
+  Parameters
+  ----------
+  jobs : list
+    Jobs [ { id, cmd, gpu, cpus, state, instance, pid, .. } ] see `scheduler.Queue`
+
+  Returns
+  -------
+  PrettyTable
+    A table of jobs
+  """
+  table = PrettyTable()
+  table.field_names = [ "#", "State", "Machine", "PID", "GPU (MB)", "CPUs", "Submitted", "Command" ]
+  table.align["Command"] = 'l'
+  for job in jobs:
+    table.add_row([ job['id'], job['state'], job['instance'] or '-', job['pid'] or '-',
+      job['gpu'] or '-', job['cpus'] or '-',
+      time.strftime('%m-%d %H:%M', time.localtime(job['submitted'])), job['cmd'] ])
+  return table
@@ -0,0 +1,177 @@
+"""walker.py
+
+Walks the local repository for files to bundle, pruning whole subtrees that are excluded.
+
+Patterns follow `.gitignore`
+
+* blank lines and lines that start with `#` are skipped
+* a trailing `/` matches directories only
+* a pattern with a `/` elsewhere is anchored to the directory it is read in; others match a name at any depth
+* `*` and `?` don't match `/`; `**` matches any number of directories
+* `!` negates a pattern; the last pattern that matches wins
+
+Exclusion patterns are read from every `.gitignore` on the way down and `.recompute/exclude`,
+in this order, after `DEFAULT_EXCLUDE`; `.recompute/exclude` has the last word. Directories with `pyvenv.cfg` (virtualenvs) are skipped.
+
+"""
+import re
+import os
+
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# excluded unless a pattern says otherwise
+DEFAULT_EXCLUDE = [ '.git/', '.hg/', '.svn/', '.recompute/', '__pycache__/',
+    'node_modules/', '.venv/', '/data/', '/bin/' ]
+# a directory that holds this is a virtualenv
+VENV_MARKER = 'pyvenv.cfg'
+# glob metacharacters
+GLOB_CHARS = set('*?[')
+
+
+def translate(pattern):
+  """Translate glob `pattern` (`**` aware) into a regex"""
+  i, regex = 0, ''
+  while i < len(pattern):
+    if pattern.startswith('**/', i):
+      regex, i = regex + '(?:.*/)?', i + 3
+    elif pattern.startswith('**', i):
+      regex, i = regex + '.*', i + 2
+    elif pattern[i] == '*':
+      regex, i = regex + '[^/]*', i + 1
+    elif pattern[i] == '?':
+      regex, i = regex + '[^/]', i + 1
+    elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+      end = pattern.index(']', i + 2)
+      class_ = pattern[i + 1:end]
+      regex, i = regex + '[{}]'.format('^' + class_[1:] if class_[0] == '!' else class_), end + 1
+    else:
+      regex, i = regex + re.escape(pattern[i]), i + 1
+  return regex + r'\Z'
+
+
+def compile_patterns(lines, base=''):
+  """Compile gitignore-style `lines`
+
+  Parameters
+  ----------
+  lines : list
+    Patterns
+  base : str, optional
+    Directory the patterns are read in, relative to root (default '')
+
+  Returns
+  -------
+  list
+    [ (base, regex, negate, directory only, anchored) ]
+  """
+  rules = []
+  for line in lines:
+    line = line.rstrip('\n').rstrip()
+    if not line or line.startswith('#'):
+      continue
+    negate = line.startswith('!')
+    line = line[1:] if negate else line
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if line.startswith('./'):
+      line = line[2:]
+    anchored = '/' in line
+    rules.append((base, re.compile(translate(line.lstrip('/'))), negate, dir_only, anchored))
+  return rules
+
+
+def read_patterns(path, base=''):
+  """Compile patterns in file `path`; none if there is no such file"""
+  if not os.path.exists(path):
+    return []
+  return compile_patterns(open(path).readlines(), base)
+
+
+def matches(rules, path, is_dir):
+  """Does `path` (relative to root) match `rules`? (last match wins)"""
+  matched = False
+  name = path.rsplit('/', 1)[-1]
+  for base, regex, negate, dir_only, anchored in rules:
+    if dir_only and not is_dir:
+      continue
+    if base:
+      if not path.startswith(base + '/'):
+        continue
+      relpath = path[len(base) + 1:]
+    else:
+      relpath = path
+    if regex.match(relpath if anchored else name):
+      matched = not negate
+  return matched
+
+
+def scan(root='.', exclude=None):
+  """Scan `root` for entries that aren't excluded
+
+  Parameters
+  ----------
+  root : str, optional
+    Directory to scan (default '.')
+  exclude : list, optional
+    Compiled exclusion rules, applied after `DEFAULT_EXCLUDE` (default None)
+
+  Yields
+  ------
+  tuple
+    (path, is directory) Path relative to `root`
+  """
+  default = compile_patterns(DEFAULT_EXCLUDE)
+  exclude = exclude if exclude else []
+  # . scan a directory
+  # .. descend into directories that aren't excluded
+  stack = [ ('', []) ]
+  while stack:
+    dir_, gitignore = stack.pop()
+    try:
+      entries = list(os.scandir(os.path.join(root, dir_) if dir_ else root))
+    except OSError as e:
+      logger.error('Failed to scan [{}] : {}'.format(dir_, e))
+      continue
+    names = set(entry.name for entry in entries)
+    if dir_ and VENV_MARKER in names:
+      logger.info('Skip virtualenv [{}]'.format(dir_))
+      continue
+    if '.gitignore' in names:
+      gitignore = gitignore + read_patterns(os.path.join(root, dir_, '.gitignore'), dir_)
+    rules = default + gitignore + exclude
+    for entry in entries:
+      path = '{}/{}'.format(dir_, entry.name) if dir_ else entry.name
+      is_dir = entry.is_dir(follow_symlinks=False)
+      if matches(rules, path, is_dir):
+        continue
+      if is_dir:
+        stack.append((path, gitignore))
+      yield path, is_dir
+
+
+def walk(root='.', exclude=None, include=None, suffix='.py'):
+  """Walk `root` for files to bundle
+
+  Parameters
+  ----------
+  root : str, optional
+    Directory to walk (default '.')
+  exclude : list, optional
+    Compiled exclusion rules, applied after `DEFAULT_EXCLUDE` (default None)
+  include : list, optional
+    Compiled rules of files to bundle besides `suffix` (default None)
+  suffix : str, optional
+    Files with this suffix are bundled (default '.py')
+
+  Yields
+  ------
+  str
+    Path to file, relative to `root`
+  """
+  include = include if include else []
+  for path, is_dir in scan(root, exclude):
+    if not is_dir and (path.endswith(suffix) or matches(include, path, False)):
+      yield path
@@ -0,0 +1,166 @@
+"""watcher.py
+
+Watches directories of the bundle for changes.
+
+* `InotifyWatcher` subscribes to inotify events of the directories (Linux; through `ctypes`, no extra dependency)
+* `PollingWatcher` is the fallback; it sleeps and leaves change detection to a rescan (stat index of bundle)
+
+Directories are watched rather than files, so that files replaced by editors (write + rename),
+created or deleted are noticed. Bursts of events (a save, a `git checkout`) are debounced into one change.
+
+"""
+import ctypes.util
+import ctypes
+import select
+import struct
+import time
+import os
+
+from recompute import utils
+
+# setup logger
+logger = utils.get_logger(__name__)
+
+# inotify events
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+EVENT = struct.Struct('iIII')
+# events closer than `DEBOUNCE` seconds are one change; a burst is cut at `MAX_BURST` seconds
+DEBOUNCE = 0.2
+MAX_BURST = 2.
+
+
+class PollingWatcher(object):
+  """Wait a while; changes are found by a rescan"""
+
+  def watch(self, dirs):
+    pass
+
+  def wait(self, timeout, debounce=DEBOUNCE):
+    """Sleep `timeout` seconds
+
+    Returns
+    -------
+    None
+      Paths touched are unknown; rescan
+    """
+    time.sleep(timeout)
+
+  def close(self):
+    pass
+
+
+class InotifyWatcher(object):
+  """Watch directories through inotify"""
+
+  def __init__(self):
+    """
+    Raises
+    ------
+    OSError
+      If inotify is not available
+    """
+    self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    if not hasattr(self.libc, 'inotify_init1'):
+      raise OSError('inotify is not available')
+    self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    # { wd : directory }, { directory : wd }
+    self.dirs, self.wds = {}, {}
+
+  def watch(self, dirs):
+    """Watch directories in `dirs` (and only those)
+
+    Raises
+    ------
+    OSError
+      If a watch can't be added (fs.inotify.max_user_watches)
+    """
+    dirs = set(dirs)
+    for dir_ in set(self.wds) - dirs:
+      self.libc.inotify_rm_watch(self.fd, self.wds.pop(dir_))
+    for dir_ in dirs - set(self.wds):
+      wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_), IN_MASK)
+      if wd < 0:
+        errno = ctypes.get_errno()
+        if errno == 2:  # gone already
+          continue
+        raise OSError(errno, 'inotify_add_watch failed [{}]'.format(dir_))
+      self.wds[dir_], self.dirs[wd] = wd, dir_
+
+  def read(self):
+    """Read pending events
+
+    Returns
+    -------
+    set
+      Paths touched; `None` if events were lost (queue overflow)
+    """
+    paths = set()
+    while True:
+      try:
+        data = os.read(self.fd, 64 * 1024)
+      except BlockingIOError:
+        return paths
+      offset = 0
+      while offset < len(data):
+        wd, mask, _, length = EVENT.unpack_from(data, offset)
+        name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+        offset += EVENT.size + length
+        if mask & IN_Q_OVERFLOW:
+          return
+        if mask & IN_IGNORED:  # watch removed; directory is gone
+          self.wds.pop(self.dirs.pop(wd, None), None)
+          continue
+        dir_ = self.dirs.get(wd)
+        if dir_ is None:
+          continue
+        paths.add(os.path.normpath(os.path.join(dir_, os.fsdecode(name))))
+
+  def wait(self, timeout, debounce=DEBOUNCE):
+    """Wait (up to `timeout` seconds) for changes; collect a burst of events
+
+    Returns
+    -------
+    set
+      Paths touched; empty if nothing happened, `None` if events were lost
+    """
+    if not select.select([ self.fd ], [], [], timeout)[0]:
+      return set()
+    paths, start = set(), time.time()
+    # . read events
+    # .. until there are none for `debounce` seconds
+    while True:
+      events = self.read()
+      if events is None:
+        logger.error('inotify queue overflowed; rescan')
+        return
+      paths |= events
+      if time.time() - start > MAX_BURST \
+          or not select.select([ self.fd ], [], [], debounce)[0]:
+        return paths
+
+  def close(self):
+    os.close(self.fd)
+
+
+def get():
+  """Get an inotify watcher; a polling watcher where inotify is not available"""
+  try:
+    return InotifyWatcher()
+  except (OSError, AttributeError) as e:
+    logger.error('{}; poll for changes'.format(e))
+    return PollingWatcher()
@@ -21,5 +21,5 @@ setuptools.setup(
     entry_points={
       'console_scripts' : [ 're=recompute.recompute:main' ],
       },
-    install_requires=['prettytable', 'pipreqs', 'pytest'],
+    install_requires=['prettytable', 'pytest', 'numpy'],
 )
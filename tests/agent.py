@@ -0,0 +1,79 @@
+import pytest
+from recompute.channel import AgentChannel, AgentError
+
+
+@pytest.fixture
+def agent():
+  # a local agent, talking over a pipe instead of ssh
+  import sys
+  from recompute import agent as agent_module
+  channel = AgentChannel('{} -u {}'.format(sys.executable, agent_module.__file__))
+  channel.start()
+  yield channel
+  channel.close()
+
+
+def test_start(agent):
+  assert agent.info['version'] > 0
+  assert agent.info['pid']
+
+
+def test_exec(agent):
+  result = agent.request('exec', cmd='echo 42; echo oops >&2; exit 3')
+  assert result['stdout'] == '42\n'
+  assert result['stderr'] == 'oops\n'
+  assert result['code'] == 3
+
+
+def test_exec_timeout(agent):
+  import time
+  # `timeout` goes to the agent; `wait` bounds the client
+  start = time.time()
+  result = agent.request('exec', cmd='sleep 5; echo late', timeout=0.5, wait=4)
+  assert time.time() - start < 3
+  assert result['stdout'] == '' and result['code'] != 0
+
+
+def test_concurrent_requests(agent):
+  import threading
+  import time
+  results = []
+  threads = [ threading.Thread(target=lambda: results.append(
+    agent.request('exec', cmd='sleep 0.5; echo done')))
+    for _ in range(4) ]
+  start = time.time()
+  [ t.start() for t in threads ]
+  [ t.join() for t in threads ]
+  assert len(results) == 4
+  assert time.time() - start < 1.5
+
+
+def test_read_tail_stat(agent, tmpdir):
+  import base64
+  logfile = str(tmpdir.join('x.log'))
+  with open(logfile, 'w') as f:
+    f.write('\n'.join([ str(i) for i in range(1000) ]) + '\nEOF\n')
+  result = agent.request('read', path=logfile, offset=4, length=4)
+  assert base64.b64decode(result['data']) == b'2\n3\n'
+  assert agent.request('tail', path=logfile, lines=2).split() == ['999', 'EOF']
+  stats = agent.request('stat', paths=[logfile, '/does/not/exist'])
+  assert stats[logfile]['size'] == result['size']
+  assert stats['/does/not/exist'] is None
+
+
+def test_ps_alive_kill(agent):
+  import subprocess
+  proc = subprocess.Popen(['sleep', '60'])
+  pids = [ pid for pid, _ in agent.request('ps', pattern='sleep 60') ]
+  assert proc.pid in pids
+  assert agent.request('alive', pids=[proc.pid]) == { str(proc.pid) : True }
+  agent.request('kill', pids=[proc.pid])
+  proc.wait()
+  assert agent.request('alive', pids=[proc.pid]) == { str(proc.pid) : False }
+
+
+def test_error(agent):
+  with pytest.raises(AgentError):
+    agent.request('read', path='/does/not/exist')
+  with pytest.raises(AgentError):
+    agent.request('no-such-op')
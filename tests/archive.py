@@ -0,0 +1,51 @@
+import pytest
+from recompute.archive import Archive, is_complete
+
+import time
+
+
+@pytest.fixture
+def archive(tmpdir, monkeypatch):
+  monkeypatch.setattr('recompute.archive.BLOCK_LINES', 10)
+  archive = Archive(str(tmpdir.join('archive')))
+  for i, end_time in enumerate([ '2020-01-01', '2020-02-01' ]):
+    logfile = tmpdir.join('{}.log'.format(i))
+    logfile.write(''.join([ 'epoch {} loss {} val_loss {}\n'.format(j, j + i, j * i)
+      for j in range(100) ]) + 'run{} done\nEOF\n'.format(i))
+    archive.add(str(logfile), name='x', instance='me@host',
+        end_time=time.mktime(time.strptime(end_time, '%Y-%m-%d')))
+  return archive
+
+
+def test_add(archive, tmpdir):
+  assert len(archive.runs) == 2
+  # archived already
+  assert archive.add(str(tmpdir.join('0.log'))) is None
+  # archive is reloaded from disk
+  assert Archive(archive.path).runs == archive.runs
+  assert is_complete(str(tmpdir.join('0.log')))
+
+
+def test_search(archive):
+  results = list(archive.search('run1 done'))
+  assert len(results) == 1 and results[0][1:] == (101, 'run1 done')
+  # looked up in index; a single block is read
+  assert archive.candidates('run1 done', archive.select()) == { results[0][0] : [10] }
+  # a word may be a part of a token
+  assert len(list(archive.search('loss 7 '))) == 2
+  assert len(list(archive.search('val_loss 7$'))) == 1
+  # first word may end a token, last word may start one; words within are tokens
+  assert archive.lookup('oss', start=True) == [ 'loss' ]
+  assert archive.lookup('ru', end=True) == [ 'run0', 'run1' ]
+  assert archive.lookup('un', start=True, end=True) == [ 'run0', 'run1' ]
+  assert archive.lookup('los') == []
+  assert archive.candidates('al_lo', archive.select()) == archive.candidates('val_loss', archive.select())
+  assert len(list(archive.search('n1 do'))) == 1
+  assert archive.candidates('val_los loss', archive.select()) == {}
+
+
+def test_select(archive):
+  assert len(list(archive.search('EOF', since='2020-01-15'))) == 1
+  assert len(list(archive.search('EOF', until='2020-01-15'))) == 1
+  run = archive.select()[0]
+  assert list(archive.search('EOF', run=run[:8]))[0][0] == run
@@ -0,0 +1,20 @@
+import os
+
+
+def test_artifacts(loopback_remote, capsys):
+  ckpt = os.path.join(loopback_remote.remote_dir, 'bin', 'ckpt')
+  os.makedirs(ckpt)
+  open(os.path.join(ckpt, 'epoch 1.pt'), 'wb').write(b'1' * 100)
+  open(os.path.join(loopback_remote.remote_dir, 'bin', 'model.bin'), 'wb').write(b'model')
+  assert loopback_remote.pull_artifacts() == [ 'bin/ckpt/epoch 1.pt', 'bin/model.bin' ]
+  assert open('bin/ckpt/epoch 1.pt', 'rb').read() == b'1' * 100
+  assert loopback_remote.pull_artifacts() == []
+  # new and changed files only
+  open(os.path.join(ckpt, 'epoch 2.pt'), 'wb').write(b'2' * 100)
+  open(os.path.join(loopback_remote.remote_dir, 'bin', 'model.bin'), 'ab').write(b'++')
+  loopback_remote.sync_artifacts()
+  assert capsys.readouterr().out.endswith('pulled bin/ckpt/epoch 2.pt bin/model.bin\n')
+  assert open('bin/model.bin', 'rb').read() == b'model++'
+  # missing locally
+  os.remove('bin/model.bin')
+  assert loopback_remote.pull_artifacts([ 'bin/', 'none/' ]) == [ 'bin/model.bin' ]
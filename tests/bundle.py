@@ -41,3 +41,31 @@ def test_rsync_db(bundle):
 def test_requirements(bundle):
   from recompute.bundle import REQS
   assert len(open(REQS).readlines()) > 1
+
+
+def test_stat_index(tmpdir, monkeypatch):
+  from recompute import bundle as bundle_
+  import os
+  monkeypatch.chdir(tmpdir)
+  os.makedirs('.recompute')
+  open('x.py', 'w').write('import os\n')
+  open(bundle_.REQS, 'w').write('numpy\n')
+  scans = []
+  monkeypatch.setattr(Bundle, 'populate_requirements', lambda self: scans.append(1))
+  b = Bundle()
+  assert len(scans) == 1 and b.changed == { 'x.py' }
+  # no change : no rescan
+  db_mtime = os.stat(bundle_.RSYNC_DB).st_mtime_ns
+  b.update_dependencies()
+  assert len(scans) == 1 and not b.changed
+  assert os.stat(bundle_.RSYNC_DB).st_mtime_ns == db_mtime
+  # new file
+  open('y.py', 'w').write('import sys\n')
+  b.update_dependencies()
+  assert len(scans) == 2 and b.changed == { 'y.py' }
+  assert 'y.py' in open(bundle_.RSYNC_DB).read()
+  # removed file
+  os.remove('x.py')
+  b.update_dependencies()
+  assert len(scans) == 3 and b.changed == { 'x.py' }
+  assert 'x.py' not in open(bundle_.RSYNC_DB).read()
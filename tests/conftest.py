@@ -0,0 +1,19 @@
+import pytest
+from recompute.instance import Instance
+
+
+@pytest.fixture
+def loopback_remote(tmpdir, monkeypatch):
+  # a project and a "remote" home, side by side
+  from recompute.remote import Remote
+  from recompute.bundle import Bundle
+  project = tmpdir.mkdir('project')
+  project.join('x.py').write('print(42)\n')
+  project.join('requirements.txt').write('')
+  project.mkdir('.recompute')
+  monkeypatch.chdir(str(project))
+  instance = Instance('me', '', str(tmpdir.join('home')), transport='loopback')
+  r = Remote(instance, Bundle())
+  r.use_agent = False
+  r.rsync()
+  return r
@@ -0,0 +1,55 @@
+import pytest
+from recompute.connection import ConnectionManager
+from recompute.instance import Instance
+
+
+@pytest.fixture
+def manager():
+  import tempfile
+  return ConnectionManager(control_dir=tempfile.mkdtemp(), max_sessions=2)
+
+
+@pytest.fixture
+def instance():
+  return Instance('usr', 'pass', 'host')
+
+
+def test_ssh_options(manager, instance):
+  options = manager.ssh_options(instance)
+  assert 'ControlMaster=auto' in options
+  assert 'ControlPath={}/%C'.format(manager.control_dir) in options
+  assert 'ControlPersist={}'.format(manager.persist) in options
+
+
+def test_ssh_options_no_multiplex(manager, instance):
+  assert 'ControlPath=none' in manager.ssh_options(instance, multiplex=False)
+
+
+def test_make_remote_cmd(instance):
+  from recompute.process import make_remote_cmd
+  from recompute import cmd
+  command = make_remote_cmd(cmd.SSH_EXEC, instance, cmd='ls')
+  assert command.startswith('sshpass -p pass ssh -o ControlMaster=auto')
+  assert command.endswith('usr@host \'ls\'')
+
+
+def test_session_limit(manager, instance):
+  import threading
+  import time
+  manager.masters.add(str(instance))  # pretend master is open
+  active, peak = [0], [0]
+  lock = threading.Lock()
+
+  def work():
+    with manager.session(instance):
+      with lock:
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+      time.sleep(0.05)
+      with lock:
+        active[0] -= 1
+
+  threads = [ threading.Thread(target=work) for _ in range(6) ]
+  [ t.start() for t in threads ]
+  [ t.join() for t in threads ]
+  assert peak[0] == 2
@@ -0,0 +1,126 @@
+import pytest
+import hashlib
+import os
+
+from recompute import fetch
+
+
+@pytest.fixture
+def server(tmpdir):
+  """HTTP server over `tmpdir/www` that serves byte ranges"""
+  from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+  import threading
+  import functools
+  www = tmpdir.mkdir('www')
+  www.join('small.txt').write('hello\n')
+  www.join('large.bin').write_binary(os.urandom(1 << 20))
+  requests = []
+
+  class RangeHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+      pass
+
+    def do_GET(self):
+      requests.append((self.path, self.headers.get('Range')))
+      path = self.translate_path(self.path)
+      if not os.path.isfile(path):
+        return self.send_error(404)
+      data = open(path, 'rb').read()
+      if self.headers.get('Range'):
+        start, _, end = self.headers['Range'][len('bytes='):].partition('-')
+        end = int(end) if end else len(data) - 1
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(data)))
+        data = data[int(start):end + 1]
+      else:
+        self.send_response(200)
+      self.send_header('Content-Length', str(len(data)))
+      self.end_headers()
+      self.wfile.write(data)
+
+  httpd = ThreadingHTTPServer(('127.0.0.1', 0),
+      functools.partial(RangeHandler, directory=str(www)))
+  threading.Thread(target=httpd.serve_forever, daemon=True).start()
+  httpd.url = 'http://127.0.0.1:{}/'.format(httpd.server_address[1])
+  httpd.www, httpd.requests = www, requests
+  yield httpd
+  httpd.shutdown()
+
+
+def test_parse_url():
+  assert fetch.parse_url('http://x/a%20b.txt#sha256=AB') == \
+      ('http://x/a%20b.txt', 'a b.txt', ('sha256', 'ab'))
+  assert fetch.parse_url('http://x/y.zip') == ('http://x/y.zip', 'y.zip', None)
+
+
+def test_fetch(server, tmpdir):
+  dir_ = str(tmpdir.join('data'))
+  large = server.www.join('large.bin').read_binary()
+  digest = hashlib.sha256(large).hexdigest()
+  assert fetch.main([ '--dir', dir_, '--segment-size', '1024',
+    server.url + 'small.txt', server.url + 'large.bin#sha256=' + digest ]) == 0
+  assert open(os.path.join(dir_, 'large.bin'), 'rb').read() == large
+  # large file in segments
+  assert len([ r for path, r in server.requests if path == '/large.bin' ]) == 1 + fetch.SEGMENTS
+  manifest = fetch.read_manifest(dir_)
+  assert manifest['large.bin']['sha256'] == digest and manifest['small.txt']['size'] == 6
+  # fetched already
+  del server.requests[:]
+  assert fetch.main([ '--dir', dir_, server.url + 'small.txt', server.url + 'large.bin' ]) == 0
+  assert not server.requests
+
+
+def test_fetch_fails(server, tmpdir, capsys):
+  dir_ = str(tmpdir.join('data'))
+  assert fetch.main([ '--dir', dir_, server.url + 'small.txt#md5=00', server.url + 'none' ]) == 2
+  assert not os.listdir(dir_)
+  assert capsys.readouterr().out.count('fail') == 2
+
+
+def test_resume(server, tmpdir):
+  dir_ = tmpdir.mkdir('data')
+  dir_.join('small.txt.part').write('hel')
+  assert fetch.main([ '--dir', str(dir_), server.url + 'small.txt' ]) == 0
+  assert dir_.join('small.txt').read() == 'hello\n'
+  assert ('/small.txt', 'bytes=3-') in server.requests
+
+
+def test_store(server, tmpdir):
+  cas = str(tmpdir.join('cas'))
+  one, two = str(tmpdir.join('one')), str(tmpdir.join('two'))
+  assert fetch.main([ '--dir', one, '--cas', cas, server.url + 'large.bin' ]) == 0
+  requests = len(server.requests)
+  # another project : linked from store, nothing fetched
+  assert fetch.main([ '--dir', two, '--cas', cas, server.url + 'large.bin' ]) == 0
+  assert len(server.requests) == requests
+  assert os.stat(os.path.join(one, 'large.bin')).st_ino == os.stat(os.path.join(two, 'large.bin')).st_ino
+  assert fetch.read_manifest(two)['large.bin']['sha256'] in os.listdir(cas)
+
+
+def test_download(loopback_remote, tmpdir):
+  from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+  import threading
+  import functools
+  import time
+  tmpdir.mkdir('www').join('iris.data').write('5.1,3.5,1.4,0.2\n')
+  httpd = ThreadingHTTPServer(('127.0.0.1', 0),
+      functools.partial(SimpleHTTPRequestHandler, directory=str(tmpdir.join('www'))))
+  threading.Thread(target=httpd.serve_forever, daemon=True).start()
+  url = 'http://127.0.0.1:{}/iris.data'.format(httpd.server_address[1])
+  try:
+    _, output = loopback_remote.download([ url ])
+    assert output.split()[:2] == [ 'ok', 'iris.data' ]
+    assert open(os.path.join(loopback_remote.remote_data, 'iris.data')).read() == '5.1,3.5,1.4,0.2\n'
+    _, output = loopback_remote.download([ url ])
+    assert output.split()[:2] == [ 'skip', 'iris.data' ]
+    # async : a job of its own
+    os.remove(os.path.join(loopback_remote.remote_data, 'iris.data'))
+    pid, _ = loopback_remote.download([ url ], run_async=True)
+    assert loopback_remote.jobs[-1][:2] == ('data', pid)
+    for _ in range(50):
+      if os.path.exists(os.path.join(loopback_remote.remote_data, 'iris.data')):
+        break
+      time.sleep(0.1)
+    assert os.path.exists(os.path.join(loopback_remote.remote_data, 'iris.data'))
+  finally:
+    httpd.shutdown()
@@ -0,0 +1,70 @@
+import pytest
+import importlib.metadata
+import os
+
+from recompute import imports
+
+
+@pytest.fixture
+def project(tmpdir, monkeypatch):
+  monkeypatch.chdir(tmpdir)
+  os.makedirs('.recompute')
+  os.makedirs('pkg')
+  open('main.py', 'w').write('import os, numpy.linalg\nfrom pkg import util\nimport helper\n')
+  open('helper.py', 'w').write('from collections import OrderedDict\n')
+  open('pkg/util.py', 'w').write('from . import main\nfrom .sub import x\nimport json\n')
+  open('old.py', 'w').write('print "python 2"\nimport numpy as np\nfrom sklearn import svm\n')
+  return [ './main.py', './helper.py', './pkg/util.py', './old.py' ]
+
+
+def test_scan():
+  assert imports.scan(b'import a.b, c\nfrom d.e import f\nfrom . import g\n') == { 'a', 'c', 'd' }
+  # python 2 fallback
+  assert imports.scan(b'print "x"\nimport a.b, c as d\nfrom e.f import g\n') == { 'a', 'c', 'e' }
+
+
+def test_requirements(project, monkeypatch):
+  numpy = 'numpy=={}'.format(importlib.metadata.version('numpy'))
+  # sklearn isn't installed : falls back to the name of its distribution
+  monkeypatch.setattr(importlib.metadata, 'packages_distributions', lambda: { 'numpy' : [ 'numpy' ] })
+  requirements = imports.ImportScanner().requirements(project)
+  assert numpy in requirements and 'scikit-learn' in requirements
+  assert not [ r for r in requirements if r.split('==')[0] in [ 'pkg', 'helper', 'os', 'json' ] ]
+
+
+def test_before_310(monkeypatch):
+  # python < 3.10 : standard library and distributions are found by files
+  import sys
+  stdlib, distributions = imports.stdlib_modules(), imports.packages_distributions()
+  monkeypatch.delattr(sys, 'stdlib_module_names', raising=False)
+  monkeypatch.delattr(importlib.metadata, 'packages_distributions', raising=False)
+  modules = imports.stdlib_modules()
+  assert { 'os', 'json', 'asyncio', 'sys', 'collections' } <= modules and 'numpy' not in modules
+  assert len(modules & stdlib) > 0.9 * len(stdlib)
+  assert imports.packages_distributions()['numpy'] == distributions['numpy']
+  assert imports.packages_distributions()['prettytable'] == distributions['prettytable']
+
+
+def test_cache(project, monkeypatch):
+  imports.ImportScanner().requirements(project)
+  parsed = []
+  scan_file = imports.scan_file
+  monkeypatch.setattr(imports, 'scan_file', lambda path: parsed.append(path) or scan_file(path))
+  scanner = imports.ImportScanner()
+  scanner.update(project, changed=set())
+  assert not parsed
+  # same contents elsewhere : not parsed again
+  open('copy.py', 'w').write(open('main.py').read())
+  scanner.update(project + [ './copy.py' ], changed={ './copy.py' })
+  assert not parsed
+  open('main.py', 'a').write('import prettytable\n')
+  scanner.update(project, changed={ './main.py' })
+  assert parsed == [ './main.py' ]
+  assert 'prettytable' in scanner.imports[scanner.files['./main.py']]
+
+
+def test_pool(project, monkeypatch):
+  monkeypatch.setattr(imports, 'POOL_THRESHOLD', 1)
+  scanner = imports.ImportScanner()
+  scanner.update(project)
+  assert scanner.imports[scanner.files['./pkg/util.py']] == { 'json' }
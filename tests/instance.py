@@ -59,3 +59,11 @@ def test_resolve_conf(instanceman, instance):
   assert isinstance(instance_x, type(instance))
   instance_y = Instance().resolve_conf(instanceman.confman.config['instance 0'])
   assert instance_x == instance_y
+
+
+def test_get_keeps_transport(tmpdir):
+  confman = ConfigManager(str(tmpdir.join('recompute.conf')))
+  confman.add_instance(Instance('me', '', str(tmpdir), transport='loopback', max_jobs=2))
+  instance = InstanceManager(confman).get(0)
+  assert (instance.transport, instance.max_jobs) == ('loopback', 2)
+  assert instance == InstanceManager(confman).get_all()[0]
@@ -0,0 +1,54 @@
+import pytest
+import os
+
+from recompute import listing
+
+
+OUTPUT = '\n'.join([
+  'd 4096 1600000000.5 data',
+  'f 100 1600000001.0 data/iris.data',
+  'd 4096 1600000002.0 data/raw',
+  'f 1000 1600000003.0 data/raw/a b.csv',
+  'f 10 1600000004.0 x.py',
+  'garbage'
+  ])
+
+
+def test_parse():
+  entries = listing.parse(OUTPUT)
+  assert entries['data/raw/a b.csv'] == ('f', 1000, 1600000003.0)
+  assert len(entries) == 5
+
+
+def test_queries():
+  listing_ = listing.Listing(listing.parse(OUTPUT))
+  assert listing_.stat('data/') == ('d', 1100, 1600000000.5, 2)
+  assert listing_.stat('x.py') == ('f', 10, 1600000004.0, 1)
+  assert listing_.stat('none') is None
+  assert [ row[0] for row in listing_.ls() ] == [ 'data', 'x.py' ]
+  assert [ row[0] for row in listing_.ls('./data') ] == [ 'data/iris.data', 'data/raw' ]
+  assert listing_.du('data') == [ ('data/raw', 1000, 1), ('data/iris.data', 100, 1), ('data', 1100, 2) ]
+  assert listing_.du()[-1] == ('.', 1110, 3)
+
+
+def test_cache(tmpdir):
+  path = str(tmpdir.join('listing'))
+  listing.Listing(listing.parse(OUTPUT)).save(path)
+  assert len(listing.Listing.load(path).entries) == 5
+  assert listing.Listing.load(path, ttl=-1) is None
+  listing.Listing.invalidate(path)
+  assert listing.Listing.load(path) is None
+
+
+def test_listing(loopback_remote):
+  listing_ = loopback_remote.get_listing()
+  assert listing_.stat('x.py')[:2] == ('f', 10)
+  # served from cache, till a push
+  open(os.path.join(loopback_remote.remote_data, 'iris.data'), 'w').write('5.1')
+  assert loopback_remote.get_listing().stat('data/iris.data') is None
+  assert loopback_remote.get_listing(force=True).stat('data/iris.data')[:2] == ('f', 3)
+  open('iris.csv', 'w').write('5.1,3.5')
+  assert loopback_remote.push([ 'iris.csv' ])
+  data = loopback_remote.relpath(loopback_remote.remote_data)
+  assert [ row[0] for row in loopback_remote.get_listing().ls(data) ] == \
+      [ 'data/iris.csv', 'data/iris.data' ]
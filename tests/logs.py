@@ -0,0 +1,69 @@
+import pytest
+
+
+@pytest.mark.parametrize('use_agent', [ False, True ])
+def test_update_local_log(loopback_remote, use_agent):
+  loopback_remote.use_agent = use_agent
+  with open(loopback_remote.logfile, 'w') as f:
+    f.write('epoch 1\n')
+  offset, data = loopback_remote.update_local_log()
+  assert (offset, data) == (8, b'epoch 1\n')
+  with open(loopback_remote.logfile, 'a') as f:
+    f.write('epoch 2\n')
+  offset, data = loopback_remote.update_local_log(offset)
+  assert (offset, data) == (16, b'epoch 2\n')
+  assert loopback_remote.update_local_log(offset) == (16, b'')
+  assert open(loopback_remote.local_logfile).read() == 'epoch 1\nepoch 2\n'
+  # a new run truncates the log
+  with open(loopback_remote.logfile, 'w') as f:
+    f.write('new\n')
+  assert loopback_remote.update_local_log(offset) == (4, b'new\n')
+  assert open(loopback_remote.local_logfile).read() == 'new\n'
+  # bytes that aren't UTF-8 come through as they are
+  with open(loopback_remote.logfile, 'ab') as f:
+    f.write(b'\xff\xe2\x82\n')
+  assert loopback_remote.update_local_log(4) == (8, b'\xff\xe2\x82\n')
+
+
+def test_loop_get_remote_log(loopback_remote, capsys):
+  with open(loopback_remote.logfile, 'w') as f:
+    f.write('loss 1\nacc 1\nEOF\n')
+  loopback_remote.loop_get_remote_log(0, keyword='loss')
+  assert capsys.readouterr().out == 'loss 1\n'
+
+
+def test_follow_log(loopback_remote):
+  import threading
+  import time
+  def write():
+    with open(loopback_remote.logfile, 'w') as f:
+      for line in [ 'loss 2', 'acc 1', 'loss 1', 'EOF', 'loss 0' ]:
+        f.write(line + '\n')
+        f.flush()
+        time.sleep(0.1)
+  writer = threading.Thread(target=write)
+  writer.start()
+  assert loopback_remote.follow_log('^loss') == 'loss 2\nloss 1\nEOF\n'
+  writer.join()
+
+
+def test_job_logs(loopback_remote, capsys):
+  a, _ = loopback_remote.execute(['echo a1; sleep 0.5; echo a2'], run_async=True, name='a')
+  b, _ = loopback_remote.execute(['echo b1; exit 1'], run_async=True, name='b')
+  # `re log` reads the latest job's log
+  assert loopback_remote.logfile == loopback_remote.jobs[-1][-1]
+  assert loopback_remote.jobs[0][-1] != loopback_remote.jobs[1][-1]
+  loopback_remote.loop_get_job_logs(0.2)
+  out = capsys.readouterr().out.splitlines()
+  assert [ line for line in out if line.startswith('a:') ] == [
+      'a:{} | a1'.format(a), 'a:{} | a2'.format(a), 'a:{} | EOF'.format(a) ]
+  # a failed job ends its log too
+  assert [ line for line in out if line.startswith('b:') ] == [
+      'b:{} | b1'.format(b), 'b:{} | EOF'.format(b) ]
+  # nothing new
+  assert [ data for _, _, data in loopback_remote.read_job_logs() ] == [ b'', b'' ]
+  # a line written in parts is printed once, whole
+  c, _ = loopback_remote.execute(['printf par; sleep 0.5; echo tial'], run_async=True, name='c')
+  loopback_remote.loop_get_job_logs(0.2)
+  assert [ line for line in capsys.readouterr().out.splitlines() if line.startswith('c:') ] == [
+      'c:{} | partial'.format(c), 'c:{} | EOF'.format(c) ]
@@ -0,0 +1,85 @@
+import pytest
+import os
+
+from recompute.manifest import Manifest, hash_tree
+
+
+@pytest.fixture
+def tree(tmpdir, monkeypatch):
+  monkeypatch.chdir(tmpdir)
+  os.makedirs('a/b')
+  for path in [ 'x.py', 'a/y.py', 'a/b/z.py' ]:
+    open(path, 'w').write(path)
+  return [ './x.py', './a/y.py', './a/b/z.py\n' ]
+
+
+def test_hash_tree():
+  dirs = hash_tree({ 'x' : '1', 'a/y' : '2', 'a/b/z' : '3' })
+  assert set(dirs) == { '.', 'a', 'a/b' }
+  # a change propagates to the root, not to siblings
+  changed = hash_tree({ 'x' : '1', 'a/y' : '2', 'a/b/z' : '4' })
+  assert changed['a/b'] != dirs['a/b'] and changed['.'] != dirs['.']
+  assert hash_tree({ 'x' : '1', 'a/y' : '2' })['.'] != dirs['.']
+
+
+def test_diff(tree):
+  local = Manifest().update(tree)
+  assert sorted(local.files) == [ 'a/b/z.py', 'a/y.py', 'x.py' ]
+  assert local.diff(Manifest()) == ([ 'a/b/z.py', 'a/y.py', 'x.py' ], [], [])
+  remote = Manifest(dict(local.files))
+  assert local.diff(remote) == ([], [], [])
+  open('a/b/z.py', 'a').write('!')
+  os.remove('x.py')
+  open('w.py', 'w').write('w')
+  assert local.update(tree + [ 'w.py' ]).diff(remote) == ([ 'w.py' ], [ 'a/b/z.py' ], [ 'x.py' ])
+
+
+def test_save_load(tree, monkeypatch):
+  os.makedirs('.recompute')
+  local = Manifest().update(tree)
+  local.save()
+  loaded = Manifest.load()
+  assert loaded.root == local.root and loaded.stats == local.stats
+  # unchanged stat : not hashed again
+  from recompute import manifest
+  monkeypatch.setattr(manifest, 'hash_file', lambda path: 'rehashed')
+  assert loaded.update(tree).files == local.files
+  assert Manifest.loads('not json') is None
+
+
+def test_rsync_manifest(loopback_remote, monkeypatch):
+  from recompute import manifest
+  assert os.path.exists(loopback_remote.remote_manifest)
+  assert loopback_remote.diff() == ([], [], [])
+  # nothing changed : nothing transferred
+  synced = []
+  sync_files = loopback_remote.sync_files
+  monkeypatch.setattr(loopback_remote, 'sync_files',
+      lambda paths: synced.append(paths) or sync_files(paths))
+  assert loopback_remote.rsync() and not synced
+  # only changed files travel
+  open('x.py', 'w').write('print(43)\n')
+  open('y.py', 'w').write('print(44)\n')
+  assert loopback_remote.rsync(update=True)
+  assert synced == [ [ 'y.py', 'x.py' ], [ manifest.MANIFEST ] ]
+  _, output = loopback_remote.execute(['python3 x.py'])
+  assert output.strip() == '43'
+  # drift in remote
+  os.remove(os.path.join(loopback_remote.remote_dir, 'x.py'))
+  open(loopback_remote.remote_manifest, 'w').write('{}')
+  assert loopback_remote.diff() == ([ 'x.py', 'y.py' ], [], [])
+
+
+def test_rsync_failed(loopback_remote, monkeypatch):
+  # a failed push of a.py; a partial push of b.py that succeeds must not claim a.py is in remote
+  sync_files = loopback_remote.sync_files
+  monkeypatch.setattr(loopback_remote, 'sync_files',
+      lambda paths: 'a.py' not in paths and sync_files(paths))
+  open('a.py', 'w').write('print(1)\n')
+  open('b.py', 'w').write('print(2)\n')
+  loopback_remote.bundle.update_dependencies()
+  assert not loopback_remote.rsync(paths=[ 'a.py' ])
+  monkeypatch.setattr(loopback_remote, 'sync_files', sync_files)
+  assert loopback_remote.rsync(paths=[ 'b.py' ])
+  assert open(os.path.join(loopback_remote.remote_dir, 'a.py')).read() == 'print(1)\n'
+  assert loopback_remote.diff() == ([], [], [])
@@ -0,0 +1,64 @@
+import pytest
+from recompute.metrics import MetricStore, extract, downsample
+
+import numpy as np
+import os
+
+
+def test_extract():
+  columns = extract(b'epoch: 3 loss=0.25 lr=1e-3\n'
+      b'{"step": 10, "loss": -0.5, "ok": true}\n'
+      b"{'loss': 2.5e1, 'acc': .5}\n"
+      b'v1.2.3 x=1.2.3\n', first_line=10)
+  assert sorted(columns) == [ 'acc', 'epoch', 'loss', 'lr', 'step' ]
+  lines, values = columns['loss']
+  assert list(lines) == [ 10, 11, 12 ] and list(values) == [ 0.25, -0.5, 25. ]
+  assert extract(b'nothing to see\n') == {}
+
+
+def test_downsample():
+  assert list(downsample(np.arange(10.), 5)) == [ 0.5, 2.5, 4.5, 6.5, 8.5 ]
+  assert len(downsample(np.arange(3.), 5)) == 3
+
+
+def test_store(tmpdir):
+  logfile = tmpdir.join('x.log')
+  store = MetricStore('x.log', str(tmpdir.join('metrics')))
+  logfile.write(''.join([ 'step={} loss={}\n'.format(i, 1. / (i + 1)) for i in range(100) ]))
+  assert store.update(str(logfile)) == 200
+  # an incomplete line waits
+  logfile.write('step=100 loss=0.0\nstep=101 lo', mode='a')
+  assert store.update(str(logfile)) == 2
+  lines, values = store.column('step')
+  assert list(lines) == list(range(101)) and list(values) == list(range(101))
+  # store is reloaded from disk
+  store = MetricStore('x.log', str(tmpdir.join('metrics')))
+  assert store.keys() == [ 'loss', 'step' ]
+  key, count, last, min_, max_, mean = store.summary()[1]
+  assert (key, count, last, min_, max_) == ('step', 101, 100, 0, 100)
+  lines, values = store.series('step', 10)
+  assert len(values) == 10 and lines[-1] == 100
+  # a new run starts over
+  logfile.write('acc=1\n')
+  assert store.update(str(logfile)) == 1
+  assert store.keys() == [ 'acc' ]
+
+
+def test_update_metrics(loopback_remote):
+  import time
+  def run(command):
+    loopback_remote.execute([ command ], run_async=True)
+    for _ in range(50):
+      if os.path.exists(loopback_remote.logfile) and 'EOF' in open(loopback_remote.logfile).read():
+        break
+      time.sleep(0.1)
+    return loopback_remote.update_metrics()
+  store = run('for i in 1 2 3; do echo loss=$i; done')
+  assert [ row[:2] for row in store.summary() ] == [ ('loss', 3) ]
+  # the next job has a store of its own; its log is read from the start
+  store = run('for i in 1 2 3 4 5 6 7 8 9; do echo acc=$i; done')
+  assert [ row[:2] for row in store.summary() ] == [ ('acc', 9) ]
+  assert list(store.column('acc')[1]) == list(range(1, 10))
+  # nothing new : nothing read again
+  assert loopback_remote.update_metrics().summary()[0][:2] == ('acc', 9)
+  assert store.manifest['source'] == loopback_remote.logfile
@@ -40,6 +40,72 @@ def test_async_execute():
   os.kill(pid, signal.SIGTERM)
 
 
+def test_execute_async():
+  from recompute.process import execute_async, run
+  pid, output = run(execute_async('echo 42'))
+  assert pid and output.strip() == '42'
+
+
+def test_execute_async_timeout():
+  from recompute.process import execute_async, run
+  import asyncio
+  with pytest.raises(asyncio.TimeoutError):
+    run(execute_async('sleep 60', timeout=0.2))
+
+
+def test_execute_async_overlap():
+  from recompute.process import execute_async, run
+  import asyncio
+  import time
+
+  async def fan_out():
+    return await asyncio.gather(*[ execute_async('sleep 0.5') for _ in range(4) ])
+
+  start = time.time()
+  assert len(run(fan_out())) == 4
+  assert time.time() - start < 1.5
+
+
+def test_kill_group():
+  from recompute.process import kill_group
+  import subprocess
+  proc = subprocess.Popen(['true'], start_new_session=True)
+  proc.wait()
+  kill_group(proc.pid)  # gone already; no ProcessLookupError
+
+
+def test_parse_batch():
+  from recompute.process import execute, parse_batch
+  from recompute import cmd
+  import shlex
+  script = cmd.make_batch(['echo 42', 'ls /does/not/exist', 'printf 4', 'cd /', 'pwd'], 'tok')
+  _, output = execute('sh -c {}'.format(shlex.quote(script)))
+  results = parse_batch(output, 'tok', 6)
+  assert results[0] == (0, '42\n', '')
+  assert results[1][0] != 0 and results[1][2]
+  assert results[2] == (0, '4', '')
+  assert results[4] == (0, '/\n', '')  # same shell
+  assert results[5] == (None, '', '')
+
+
+def test_remote_execute_batch(instance):
+  from recompute.process import remote_execute_batch
+  results = remote_execute_batch(['echo 4', 'echo 2'], instance)
+  assert [ out for _, out, _ in results ] == ['4\n', '2\n']
+
+
+def test_execute_batch_loopback(tmpdir):
+  # the same batch script and parser, without a network
+  from recompute import transport
+  loopback = transport.get(Instance('me', '', str(tmpdir), transport='loopback'))
+  results = loopback.execute_batch([ 'echo 4', 'ls /does/not/exist',
+    'echo out; echo err >&2; (exit 3)', 'cd /', 'pwd', "printf '%s' \"it's\"" ])
+  assert results[0] == (0, '4\n', '')
+  assert results[1][0] not in (0, None) and results[1][1] == '' and results[1][2]
+  assert results[2] == (3, 'out\n', 'err\n')
+  assert results[3:] == [ (0, '', ''), (0, '/\n', ''), (0, "it's", '') ]  # same shell
+
+
 def test_remote_execute(instance):
   from recompute.process import remote_execute
   pid, output = remote_execute('ls -1a', instance)
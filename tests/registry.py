@@ -0,0 +1,25 @@
+import os
+
+
+def test_registry(loopback_remote):
+  import time
+  pid, _ = loopback_remote.execute([ 'sleep 30' ], run_async=True)
+  for _ in range(50):
+    if loopback_remote.job_status():
+      break
+    time.sleep(0.1)
+  (job, state, pid_, pgid, start, logfile, command), = loopback_remote.job_status()
+  assert (state, pid_, pgid, command) == ('alive', pid, pid, 'sleep 30')
+  assert logfile == loopback_remote.jobs[-1][2]
+  assert loopback_remote.list_processes(force=True) == [ ('runner', pid) ]
+  # the job is killed as a group; reported dead once, then dropped
+  loopback_remote.kill(0)
+  time.sleep(0.5)
+  assert [ status[:2] for status in loopback_remote.job_status() ] == [ (job, 'dead') ]
+  assert loopback_remote.job_status() == []
+  assert not loopback_remote.is_process_alive(pid)
+  group = os.popen('ps -o stat= -g {}'.format(pid)).read().split()
+  assert all(stat.startswith('Z') for stat in group)  # dead, if not reaped yet
+  # sync runs register, too
+  loopback_remote.execute([ 'true' ])
+  assert [ status[1] for status in loopback_remote.job_status() ] == [ 'dead' ]
@@ -28,6 +28,20 @@ def test_cache(remote):
   assert pickle.load(open(remote.CACHE, 'rb'))
 
 
+def test_bootstrap(remote):
+  assert remote.bootstrap_info['home']
+  assert remote.bootstrap_info['python'].startswith('Python')
+  assert remote.bootstrap_info['disk_free'] > 0
+
+
+def test_bootstrap_cache(remote):
+  r = Remote(remote.instance, remote.bundle)
+  assert r.bootstrap_info['time'] == remote.bootstrap_info['time']
+  assert r.remote_dir == remote.remote_dir
+  r = Remote(remote.instance, remote.bundle, force=True)
+  assert r.bootstrap_info['time'] > remote.bootstrap_info['time']
+
+
 def test_execute_command(cremote):
   pid, output = cremote.execute_command(
       'ls -1 {}'.format(cremote.remote_dir),
@@ -127,3 +141,34 @@ def test_pull(cremote):
     os.path.join(cremote.remote_dir, 'to_be_pulled.txt')),
     bypass_subprocess=False
     )
+
+
+def test_bootstrap_cache_rules(loopback_remote, monkeypatch):
+  from recompute import transport
+  from recompute import remote as remote_
+  calls = []
+  execute_batch = transport.LoopbackTransport.execute_batch
+  def execute_batch_(self, *args, **kwargs):
+    calls.append(args)
+    return execute_batch(self, *args, **kwargs)
+  monkeypatch.setattr(transport.LoopbackTransport, 'execute_batch', execute_batch_)
+  instance, bundle = loopback_remote.instance, loopback_remote.bundle
+  time_ = loopback_remote.bootstrap_info['time']
+  # a valid cache : no calls
+  r = Remote(instance, bundle)
+  assert r.bootstrap_info['time'] == time_ and r.remote_dir == loopback_remote.remote_dir
+  assert calls == []
+  # another remote home, then back to the first : bootstrapped each time
+  r = Remote(instance, bundle, remote_home='elsewhere/')
+  assert r.remote_dir.endswith('elsewhere/' + bundle.name) and len(calls) == 1
+  r = Remote(instance, bundle)
+  assert r.bootstrap_info['time'] > time_ and len(calls) == 2
+  # forced
+  Remote(instance, bundle, force=True)
+  assert len(calls) == 3
+  # expired
+  Remote(instance, bundle)
+  assert len(calls) == 3
+  monkeypatch.setattr(remote_, 'BOOTSTRAP_TTL', 0)
+  Remote(instance, bundle)
+  assert len(calls) == 4
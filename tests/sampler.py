@@ -0,0 +1,104 @@
+import subprocess
+import pytest
+import time
+import json
+import os
+
+from recompute import sampler
+
+
+def test_ring(tmpdir):
+  path = str(tmpdir.join('ring'))
+  ring = sampler.Ring(path, slots=4)
+  for i in range(6):
+    ring.append((float(i), 0., 0, 0, 0, 0, -1., 1))
+  assert [ record[0] for record in ring.read() ] == [ 2., 3., 4., 5. ]
+  assert [ record[0] for record in ring.read(2) ] == [ 4., 5. ]
+  ring.close()
+  # size is fixed; the count survives a reopen
+  assert os.path.getsize(path) == sampler.HEADER.size + 4 * sampler.RECORD.size
+  ring = sampler.Ring(path)
+  assert (ring.slots, ring.count) == (4, 6)
+  ring.close()
+  tmpdir.join('junk').write('not a ring buffer')
+  with pytest.raises(ValueError):
+    sampler.Ring(str(tmpdir.join('junk')))
+
+
+def test_run(tmpdir):
+  dir_ = tmpdir.mkdir('samples')
+  job = subprocess.Popen([ 'sh', '-c', 'sleep 1; true' ], start_new_session=True)
+  start = time.time()
+  sampler.run(job.pid, str(dir_.join('project.job')), interval=0.2)
+  job.wait()
+  assert time.time() - start < 5  # ends with the job
+  samples = sampler.read(str(dir_), last=2)['project.job']
+  assert len(samples) == 2
+  assert samples[-1]['time'] > samples[0]['time']
+  assert samples[-1]['procs'] >= 1 and samples[-1]['rss'] > 0
+  # stale ring buffers are dropped
+  os.utime(str(dir_.join('project.job')), (0, 0))
+  assert sampler.read(str(dir_)) == {}
+  assert not dir_.join('project.job').exists()
+
+
+def test_main_read(tmpdir, capsys):
+  ring = sampler.Ring(str(tmpdir.join('project.job')))
+  ring.append((time.time(), 1., 1 << 20, 0, 0, 0, -1., 2))
+  ring.close()
+  assert sampler.main([ '--read', str(tmpdir) ]) == 0
+  output = json.loads(capsys.readouterr().out)
+  assert output['samples']['project.job'][0]['procs'] == 2
+
+
+def test_gpu_cache(tmpdir, monkeypatch):
+  calls = []
+  def query_gpu():
+    calls.append(1)
+    return [ [ 'GPU-0', 10, 300 ], [ 'GPU-1', 11, 500 ] ], { 'GPU-0' : 40., 'GPU-1' : 90. }
+  monkeypatch.setattr(sampler, 'query_gpu', query_gpu)
+  cache = str(tmpdir.join(sampler.GPU_CACHE))
+  # samplers of a host share a query, for `GPU_INTERVAL` seconds
+  assert sampler.gpu({ 10 }, cache) == (300 << 20, 40.)
+  assert sampler.gpu({ 10, 11 }, cache) == (800 << 20, 90.)
+  assert sampler.gpu({ 12 }, cache) == (0, -1.)
+  assert len(calls) == 1
+  monkeypatch.setattr(sampler, 'GPU_INTERVAL', 0)
+  sampler.gpu({ 10 }, cache)
+  assert len(calls) == 2
+  # the cache is not a ring buffer
+  assert sampler.read(str(tmpdir)) == {}
+
+
+def test_top(loopback_remote, monkeypatch):
+  import time
+  from recompute.instance import InstanceManager
+  from recompute import process
+  from recompute import channel
+  from recompute import sampler
+  # the sampler is uploaded once, and started by the runner
+  uploads = []
+  upload = channel.upload
+  monkeypatch.setattr(channel, 'upload', lambda *args: uploads.append(args) or upload(*args))
+  pid, _ = loopback_remote.execute([ 'sleep 5' ], run_async=True)
+  for _ in range(50):
+    rows = process.run(InstanceManager(None).top_instance(loopback_remote.instance))
+    if rows and rows[0][3] != '-':
+      break
+    time.sleep(0.2)
+  (machine, job, procs, cpu, rss, read, write, gpu_mem, gpu_util, age), = rows
+  assert machine == str(loopback_remote.instance) and job.startswith(loopback_remote.bundle.name + '.')
+  assert procs >= 1 and cpu != '-' and age < 10
+  loopback_remote.kill(0)
+  loopback_remote.execute([ 'true' ], run_async=True)
+  assert len(uploads) == 1
+  # a remote without sampler : `re top` uploads it, or says it can't
+  os.remove(os.path.join(loopback_remote.instance.host, channel.agent_path(sampler)))
+  assert process.run(InstanceManager(None).top_instance(loopback_remote.instance)) is not None
+  assert os.path.exists(os.path.join(loopback_remote.instance.host, channel.agent_path(sampler)))
+  os.remove(os.path.join(loopback_remote.instance.host, channel.agent_path(sampler)))
+  async def fail(*args):
+    return False
+  monkeypatch.setattr(channel, 'upload_async', fail)
+  assert process.run(InstanceManager(None).top_instance(loopback_remote.instance)) == \
+      [ (str(loopback_remote.instance), 'sampler unavailable') + ('-',) * 8 ]
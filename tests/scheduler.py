@@ -0,0 +1,118 @@
+import pytest
+import time
+
+from recompute.instance import Instance
+from recompute import scheduler
+from recompute.scheduler import Queue
+
+
+def job(id_, gpu=0, cpus=0, state='queued', instance=None, pid=None):
+  return { 'id' : id_, 'cmd' : 'true', 'gpu' : gpu, 'cpus' : cpus, 'state' : state,
+      'instance' : instance, 'pid' : pid, 'logfile' : None,
+      'submitted' : time.time(), 'started' : time.time(), 'ended' : None }
+
+
+def test_parse_probe():
+  probe = scheduler.parse_probe('16000, 12000\n16000, 3000\n', '8 2.50\n',
+      'job1-x\talive\t41\t41\t-\tlog\tpython3 x.py\njob2-y\tdead\t42\t42\t-\tlog\ttrue\n')
+  assert probe == { 'gpu_total' : 32000, 'gpu_free' : 12000, 'cpus' : 8, 'load' : 2.5,
+      'alive' : { 41 } }
+  # no GPU (nvidia-smi : command not found), no registry
+  probe = scheduler.parse_probe('', '4 0.00', '')
+  assert (probe['gpu_total'], probe['gpu_free'], probe['alive']) == (0, 0, set())
+
+
+def test_room_place():
+  probe = scheduler.parse_probe('16000, 12000', '8 1.0', '')
+  # resources declared by running jobs are held, though not in use yet
+  running = [ job(1, gpu=10000, cpus=4, state='running', pid=7) ]
+  assert scheduler.room(probe, running, 2) == [ 1, 6000, 4 ]
+  rooms = { 'a' : [ 1, 6000, 4 ], 'b' : [ 2, 0, 7. ] }
+  assert scheduler.place(job(2, gpu=4000), rooms) == 'a'
+  assert scheduler.place(job(3, cpus=6), rooms) == 'b'
+  assert scheduler.place(job(4), rooms) == 'b'  # most slots
+  assert scheduler.place(job(5, gpu=8000), rooms) is None
+  # an overloaded instance still takes jobs that need no cores
+  assert scheduler.place(job(6), { 'a' : [ 1, 0, -3. ] }) == 'a'
+
+
+def test_queue(tmpdir):
+  path = str(tmpdir.join('queue'))
+  first = Queue.submit('python3 x.py', gpu=1000, path=path)
+  second = Queue.submit('python3 y.py', cpus=2, path=path)
+  assert (first['id'], second['id']) == (1, 2)
+  # an update keeps jobs submitted meanwhile
+  first.update({ 'state' : 'running', 'instance' : 'me@host', 'pid' : 7 })
+  Queue.submit('python3 z.py', path=path)
+  queue = Queue.update([ first ], path)
+  assert [ j['state'] for j in queue.jobs ] == [ 'running', 'queued', 'queued' ]
+  assert [ j['id'] for j in Queue.load(path).with_state('queued') ] == [ 2, 3 ]
+  # ended jobs are forgotten, oldest first
+  for _ in range(scheduler.ENDED_KEPT + 2):
+    Queue.submit('true', path=path)
+  queue = Queue.load(path)
+  for j in queue.jobs[3:]:
+    j['state'] = 'ended'
+  queue.save(path)
+  assert len(Queue.load(path).with_state('ended')) == scheduler.ENDED_KEPT
+
+
+def test_lock(tmpdir):
+  import threading
+  path = str(tmpdir.join('queue'))
+  submitted = []
+  def submit():
+    submitted.append(Queue.submit('true', path=path))
+  # a pass of the scheduler holds the queue; submissions wait for it
+  with scheduler.lock(path):
+    thread = threading.Thread(target=submit)
+    thread.start()
+    thread.join(0.5)
+    assert not submitted
+  thread.join(5)
+  assert [ j['id'] for j in submitted ] == [ 1 ]
+
+
+def test_scheduler(loopback_remote, tmpdir, monkeypatch, capsys):
+  import time
+  from recompute.config import ConfigManager
+  from recompute.instance import InstanceManager
+  from recompute import scheduler
+  monkeypatch.setattr(scheduler, 'GRACE', 0)
+  # two instances, a job at a time each
+  confman = ConfigManager(str(tmpdir.join('recompute.conf')))
+  tmpdir.mkdir('home2')
+  for home in [ 'home', 'home2' ]:
+    confman.add_instance(Instance('me', '', str(tmpdir.join(home)), transport='loopback'))
+  scheduler_ = scheduler.Scheduler(InstanceManager(confman), loopback_remote.bundle)
+  for _ in range(3):
+    scheduler.Queue.submit('sleep 1')
+  assert [ event for event, _ in scheduler_.step() ] == [ 'started', 'started' ]
+  jobs = scheduler.Queue.load().jobs
+  assert [ job['state'] for job in jobs ] == [ 'running', 'running', 'queued' ]
+  assert set(job['instance'] for job in jobs[:2]) == \
+      set('me@{}'.format(tmpdir.join(home)) for home in [ 'home', 'home2' ])
+  # the third job takes the first slot that frees up; the scheduler stops once all jobs end
+  scheduler_.run(delay=0.5)
+  assert [ job['state'] for job in scheduler.Queue.load().jobs ] == [ 'ended' ] * 3
+  assert capsys.readouterr().out.count('started') == 1
+  # handles of the scheduler keep caches of their own; the default one is untouched
+  import pickle
+  assert pickle.load(open(loopback_remote.CACHE, 'rb'))['jobs'] == []
+
+
+def test_scheduler_failed_rsync(loopback_remote, tmpdir, monkeypatch):
+  from recompute.config import ConfigManager
+  from recompute.instance import InstanceManager
+  from recompute.remote import Remote
+  from recompute import scheduler
+  confman = ConfigManager(str(tmpdir.join('recompute.conf')))
+  confman.add_instance(loopback_remote.instance)
+  scheduler_ = scheduler.Scheduler(InstanceManager(confman), loopback_remote.bundle)
+  scheduler.Queue.submit('true')
+  # files couldn't be synced : the job waits, the instance is set up again next pass
+  with monkeypatch.context() as patch:
+    patch.setattr(Remote, 'rsync', lambda self, *args, **kwargs: False)
+    assert scheduler_.step() == []
+  assert scheduler.Queue.load().jobs[0]['state'] == 'queued' and not scheduler_.remotes
+  assert [ event for event, _ in scheduler_.step() ] == [ 'started' ]
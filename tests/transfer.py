@@ -0,0 +1,128 @@
+import pytest
+import os
+
+from recompute.instance import Instance
+from recompute import transport
+from recompute import transfer
+
+
+CHUNK = 64 * 1024
+
+
+@pytest.fixture
+def loopback(tmpdir, monkeypatch):
+  monkeypatch.chdir(tmpdir)
+  os.makedirs('.recompute')
+  tmpdir.join('big.bin').write_binary(os.urandom(10 * CHUNK + 123))
+  return transport.get(Instance('me', '', str(tmpdir.join('home')), transport='loopback'))
+
+
+def flaky(monkeypatch, fail):
+  """Fail chunk commands whose (block) offset is in `fail`, once"""
+  run_chunk = transfer.run_chunk
+  calls = []
+  async def run_chunk_(cmdstr, feed=None, drain=None):
+    calls.append(cmdstr)
+    for offset in list(fail):
+      if 'seek={} '.format(offset) in cmdstr or 'skip={} '.format(offset) in cmdstr:
+        fail.remove(offset)
+        return False
+    return await run_chunk(cmdstr, feed, drain)
+  monkeypatch.setattr(transfer, 'run_chunk', run_chunk_)
+  return calls
+
+
+def test_make_chunks():
+  assert transfer.make_chunks(10, 4) == [ (0, 0, 4), (1, 4, 4), (2, 8, 2) ]
+  assert transfer.make_chunks(0, 4) == []
+
+
+def test_push(loopback, monkeypatch):
+  data = open('big.bin', 'rb').read()
+  calls = flaky(monkeypatch, [ 3, 7 ])
+  assert not transfer.push(loopback, 'big.bin', 'data/big.bin', chunk_size=CHUNK)
+  assert not os.path.exists(loopback.resolve('data/big.bin'))
+  # resume : only the failed chunks move
+  del calls[:]
+  assert transfer.push(loopback, 'big.bin', 'data/big.bin', chunk_size=CHUNK)
+  assert len(calls) == 2
+  assert open(loopback.resolve('data/big.bin'), 'rb').read() == data
+  assert not os.listdir(transfer.TRANSFERS_DIR)
+
+
+def test_pull(loopback, monkeypatch):
+  data = open('big.bin', 'rb').read()
+  os.makedirs(loopback.resolve('data'))
+  open(loopback.resolve('data/big.bin'), 'wb').write(data)
+  calls = flaky(monkeypatch, [ 0, 10 ])
+  assert not transfer.pull(loopback, 'data/big.bin', 'copy/big.bin', chunk_size=CHUNK)
+  del calls[:]
+  assert transfer.pull(loopback, 'data/big.bin', 'copy/big.bin', chunk_size=CHUNK)
+  assert len(calls) == 2
+  assert open('copy/big.bin', 'rb').read() == data
+  # no such file
+  assert not transfer.pull(loopback, 'data/none.bin', 'copy/none.bin', chunk_size=CHUNK)
+
+
+def test_corrupt(loopback, monkeypatch):
+  # a chunk goes missing in remote : checksum fails, the transfer starts over
+  calls = flaky(monkeypatch, [ 2 ])
+  assert not transfer.push(loopback, 'big.bin', 'big.bin', chunk_size=CHUNK)
+  journal = transfer.Journal('push', os.path.abspath('big.bin'), 'big.bin',
+      os.path.getsize('big.bin'), os.stat('big.bin').st_mtime_ns, CHUNK)
+  journal.add(2)
+  assert not transfer.push(loopback, 'big.bin', 'big.bin', chunk_size=CHUNK)
+  assert transfer.push(loopback, 'big.bin', 'big.bin', chunk_size=CHUNK)
+
+
+def test_chunked_push_pull(loopback_remote, tmpdir, monkeypatch):
+  from recompute import transfer
+  monkeypatch.setattr(transfer, 'CHUNKED_SIZE', 1024)
+  data = os.urandom(5 * 4096 + 1)
+  open('big.bin', 'wb').write(data)
+  assert loopback_remote.copy_file_to_remote('big.bin', loopback_remote.remote_data)
+  assert open(os.path.join(loopback_remote.remote_data, 'big.bin'), 'rb').read() == data
+  assert loopback_remote.get_file_from_remote(os.path.join(loopback_remote.remote_data, 'big.bin'),
+      str(tmpdir))
+  assert tmpdir.join('big.bin').read_binary() == data
+  # small files : a single stream
+  assert loopback_remote.copy_file_to_remote('x.py', loopback_remote.remote_dir) is None
+
+
+def test_push_data_store(loopback_remote):
+  from recompute.remote import REMOTE_CAS
+  from recompute import transfer
+  open('iris.data', 'w').write('5.1,3.5,1.4,0.2\n')
+  assert loopback_remote.copy_file_to_remote('iris.data')
+  stored = os.path.join(loopback_remote.transport.root, REMOTE_CAS, transfer.digest('iris.data'))
+  copy = os.path.join(loopback_remote.remote_data, 'iris.data')
+  assert open(copy).read() == '5.1,3.5,1.4,0.2\n'
+  assert os.stat(copy).st_ino == os.stat(stored).st_ino
+  # in store : linked, under another name
+  assert loopback_remote.copy_file_to_remote('iris.data',
+      os.path.join(loopback_remote.remote_data, 'iris.csv'))
+  assert os.stat(os.path.join(loopback_remote.remote_data, 'iris.csv')).st_ino == os.stat(stored).st_ino
+  # a new version doesn't touch the store's copy
+  open('iris.data', 'w').write('4.9,3.0,1.4,0.2\n')
+  assert loopback_remote.copy_file_to_remote('iris.data')
+  assert open(copy).read() == '4.9,3.0,1.4,0.2\n'
+  assert open(stored).read() == '5.1,3.5,1.4,0.2\n'
+
+
+def test_push_pull_paths(loopback_remote, tmpdir, capsys):
+  os.mkdir('results')
+  for name in [ 'a.csv', 'b.csv', 'c.txt' ]:
+    open(os.path.join('results', name), 'w').write(name)
+  assert loopback_remote.push([ 'results/*.csv', 'results', 'x.py' ],
+      os.path.join(loopback_remote.remote_dir, 'out/'))
+  assert sorted(os.listdir(os.path.join(loopback_remote.remote_dir, 'out'))) == \
+      [ 'a.csv', 'b.csv', 'results', 'x.py' ]
+  assert loopback_remote.pull([ 'out/*.csv', 'out/results' ], str(tmpdir.join('back')))
+  assert sorted(tmpdir.join('back').listdir()) == [ tmpdir.join('back', name)
+      for name in [ 'a.csv', 'b.csv', 'results' ] ]
+  assert tmpdir.join('back', 'results', 'c.txt').read() == 'c.txt'
+  # bytes moved and throughput are shown
+  out = capsys.readouterr().out
+  assert 'push [' in out and 'pull [' in out and 'MB/s' in out
+  assert not loopback_remote.pull([ 'out/*.csv', 'none' ], str(tmpdir.join('none')))
+  assert not loopback_remote.push([ 'none*' ])
@@ -0,0 +1,57 @@
+import pytest
+from recompute.instance import Instance
+from recompute import transport
+
+import os
+
+
+@pytest.fixture
+def loopback(tmpdir):
+  return transport.get(Instance('me', '', str(tmpdir.join('home')), transport='loopback'))
+
+
+def test_get():
+  assert isinstance(transport.get(Instance('me', '', 'host')), transport.SSHTransport)
+
+
+def test_execute(loopback):
+  _, output = loopback.execute('echo $HOME; pwd')
+  assert output.split() == [ loopback.root ] * 2
+  assert loopback.is_active()
+
+
+def test_execute_batch(loopback):
+  results = loopback.execute_batch([ 'echo 1', 'echo 2 >&2; false' ])
+  assert results == [ (0, '1\n', ''), (1, '', '2\n') ]
+
+
+def test_remote(loopback_remote):
+  assert loopback_remote.bootstrap_info['home'] == loopback_remote.transport.root
+  assert os.path.exists(os.path.join(loopback_remote.remote_dir, 'x.py'))
+  _, output = loopback_remote.execute(['python3 x.py'])
+  assert output.strip() == '42'
+
+
+def test_remote_push_pull(loopback_remote, tmpdir):
+  loopback_remote.copy_file_to_remote('x.py', os.path.join(loopback_remote.remote_data, 'y.py'))
+  loopback_remote.get_file_from_remote(os.path.join(loopback_remote.remote_data, 'y.py'),
+      str(tmpdir.join('z.py')))
+  assert tmpdir.join('z.py').read() == 'print(42)\n'
+
+
+def test_remote_async(loopback_remote):
+  import time
+  pid, _ = loopback_remote.execute(['sleep 30'], run_async=True)
+  time.sleep(0.5)
+  assert pid in [ p for _, p in loopback_remote.list_processes(force=True) ]
+  loopback_remote.kill(0, force=True)
+  time.sleep(0.5)
+  assert not loopback_remote.is_process_alive(pid)
+
+
+def test_agent(loopback):
+  from recompute import channel
+  agent = channel.get(loopback)
+  assert agent
+  assert agent.request('exec', cmd='echo $HOME')['stdout'].strip() == loopback.root
+  channel.close_all()
@@ -0,0 +1,44 @@
+import pytest
+import os
+
+from recompute import walker
+
+
+@pytest.fixture
+def tree(tmpdir, monkeypatch):
+  monkeypatch.chdir(tmpdir)
+  for path in [ 'x.py', 'a/y.py', 'a/b/z.py', 'a/b/c.yaml', 'data/d.py', 'lib/data/e.py',
+      '.git/hooks/h.py', 'env/pyvenv.cfg', 'env/lib/site.py', 'build/gen.py',
+      'a/__pycache__/y.py', 'node_modules/m/n.py' ]:
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+  open('.gitignore', 'w').write('# generated\nbuild/\n')
+  open('a/.gitignore', 'w').write('/b/z.py\n')
+
+
+def test_translate():
+  import re
+  assert re.match(walker.translate('*.py'), 'x.py')
+  assert not re.match(walker.translate('a/*.py'), 'a/b/x.py')
+  assert re.match(walker.translate('a/**/x.py'), 'a/b/c/x.py')
+  assert re.match(walker.translate('a/**/x.py'), 'a/x.py')
+  assert re.match(walker.translate('[!a]?.py'), 'bc.py')
+
+
+def test_walk(tree):
+  assert sorted(walker.walk()) == [ 'a/y.py', 'lib/data/e.py', 'x.py' ]
+  include = walker.compile_patterns([ '**/*.yaml' ])
+  exclude = walker.compile_patterns([ 'lib/', '!build/' ])
+  assert sorted(walker.walk('.', exclude, include)) == \
+      [ 'a/b/c.yaml', 'a/y.py', 'build/gen.py', 'x.py' ]
+
+
+def test_pruned(tree, monkeypatch):
+  # excluded directories aren't scanned
+  scanned = []
+  scandir = os.scandir
+  monkeypatch.setattr(os, 'scandir', lambda path: scanned.append(path) or scandir(path))
+  list(walker.walk())
+  assert not [ path for path in scanned
+      if path.split('/')[0] in [ '.git', 'data', 'build', 'node_modules' ] ]
@@ -0,0 +1,71 @@
+import pytest
+import os
+
+from recompute import watcher
+
+
+@pytest.fixture
+def inotify(tmpdir, monkeypatch):
+  monkeypatch.chdir(tmpdir)
+  os.makedirs('a')
+  w = watcher.InotifyWatcher()
+  w.watch([ '.', 'a' ])
+  yield w
+  w.close()
+
+
+def test_wait(inotify):
+  assert inotify.wait(0.1) == set()
+  # a burst of events is one change
+  open('x.py', 'w').write('x')
+  open('a/y.py', 'w').write('y')
+  os.rename('a/y.py', 'a/z.py')
+  assert inotify.wait(1, debounce=0.1) == { 'x.py', 'a/y.py', 'a/z.py' }
+
+
+def test_watch(inotify):
+  inotify.watch([ '.' ])
+  open('a/y.py', 'w').write('y')
+  assert inotify.wait(0.2) == set()
+  # removed directories drop out
+  os.makedirs('b')
+  inotify.watch([ '.', 'b' ])
+  inotify.wait(0.2)
+  os.rmdir('b')
+  inotify.wait(0.2)
+  assert 'b' not in inotify.wds
+
+
+def test_polling():
+  assert watcher.PollingWatcher().wait(0) is None
+
+
+def test_remote_watch(loopback_remote, monkeypatch, capsys):
+  import threading
+  import time
+  pushed = []
+  rsync = loopback_remote.rsync
+  def rsync_(update=False, paths=None):
+    pushed.append(paths)
+    assert rsync(update, paths)
+    if len(pushed) == 2:  # initial push, then changes
+      raise KeyboardInterrupt
+    return True
+  monkeypatch.setattr(loopback_remote, 'rsync', rsync_)
+  # directories are walked once, and again only when one is created
+  walks, idle = [], []
+  get_local_dirs = loopback_remote.bundle.get_local_dirs
+  monkeypatch.setattr(loopback_remote.bundle, 'get_local_dirs',
+      lambda: walks.append(1) or get_local_dirs())
+  def edit():
+    time.sleep(0.5)
+    idle.append(len(walks))
+    os.makedirs('pkg')
+    open('pkg/y.py', 'w').write('print(44)\n')
+    open('x.py', 'w').write('print(43)\n')
+  threading.Thread(target=edit).start()
+  loopback_remote.watch(delay=0.2)
+  assert pushed[0] is None and pushed[1] == [ 'pkg/y.py', 'x.py' ]
+  assert idle == [ 1 ]
+  assert open(os.path.join(loopback_remote.remote_dir, 'pkg/y.py')).read() == 'print(44)\n'
+  assert loopback_remote.diff() == ([], [], [])